@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+
+'''
+Generate synthetic fs scenarios at controlled scales for benchmarking.
+
+Topologies: fat-tree, Waxman, Barabasi-Albert (BA) and a ring of PoPs,
+from tens up to tens of thousands of nodes.  Traffic follows a gravity
+model over the heaviest (or all) source/destination pairs, and
+measurement nodes and link failure schedules are configurable.  All
+randomness is driven from a single seed, so the same command line
+always produces the same scenario.
+
+Example:
+
+    $ python conf/scengen.py -t ba -n 1000 -m 10 -f 5 -s 1 -o ba1000.json
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import sys
+import math
+import json
+import random
+from optparse import OptionParser
+import networkx as nx
+
+
+HARPOON_SUBSPEC = "flowsize=pareto(10000.0,1.2) ipproto=randomchoice(6) sport=randomchoice(22,80,443) dport=randomunifint(1025,65535) lossrate=randomchoice(0.001)"
+
+# unless --maxpairs says otherwise, traffic goes between the heaviest
+# PAIRS_PER_ENDPOINT gravity pairs per endpoint, up to MAX_PAIRS; more
+# pairs than MAX_PAIRS must be asked for with --manypairs
+PAIRS_PER_ENDPOINT = 10
+MAX_PAIRS = 200000
+
+class ScenarioError(Exception):
+    pass
+
+
+def fattree(numnodes, rng):
+    '''
+    k-ary fat tree with (k/2)^2 core switches and k pods of k/2
+    aggregation and k/2 edge switches each; k is the largest even number
+    with 5k^2/4 <= numnodes.  Edge switches are the traffic endpoints.
+    '''
+    k = max(2, int(math.sqrt(numnodes * 4 / 5.0)) // 2 * 2)
+    half = k // 2
+    graph = nx.MultiGraph()
+    endpoints = []
+    cores = [ 'core{}'.format(i) for i in xrange(half*half) ]
+    graph.add_nodes_from(cores)
+    for pod in xrange(k):
+        aggs = [ 'agg{}_{}'.format(pod, i) for i in xrange(half) ]
+        edges = [ 'edge{}_{}'.format(pod, i) for i in xrange(half) ]
+        for i,agg in enumerate(aggs):
+            for j in xrange(half):
+                graph.add_edge(agg, cores[i*half+j])
+            for edge in edges:
+                graph.add_edge(agg, edge)
+        endpoints.extend(edges)
+    return graph, endpoints
+
+
+def waxman(numnodes, rng, alpha=0.4, avgdegree=4.0):
+    '''
+    Waxman random graph on the unit square.  beta is chosen so that the
+    expected average degree stays near avgdegree at any scale, and
+    disconnected components are joined to the largest one through their
+    closest sampled pair of nodes.  (Edge selection is O(n^2), so 10k
+    node graphs take a minute or so.)
+    '''
+    pos = dict((i, (rng.random(), rng.random())) for i in xrange(numnodes))
+    dist = lambda a,b: math.hypot(pos[a][0]-pos[b][0], pos[a][1]-pos[b][1])
+    L = math.sqrt(2.0)
+    meanfactor = sum(math.exp(-dist(rng.randrange(numnodes), rng.randrange(numnodes)) / (alpha*L)) for i in xrange(1000)) / 1000.0
+    beta = min(1.0, avgdegree / (max(numnodes-1, 1) * meanfactor))
+    graph = nx.MultiGraph()
+    graph.add_nodes_from(pos)
+    for a in xrange(numnodes):
+        for b in xrange(a+1, numnodes):
+            if rng.random() < beta * math.exp(-dist(a,b) / (alpha*L)):
+                graph.add_edge(a, b)
+
+    components = sorted(nx.connected_components(graph), key=len, reverse=True)
+    main = components[0]
+    for comp in components[1:]:
+        a,b = min(((x,y) for x in comp for y in rng.sample(main, min(len(main), 32))), key=lambda xy: dist(*xy))
+        graph.add_edge(a, b)
+        main.extend(comp)
+
+    for n in graph:
+        graph.node[n]['pos'] = pos[n]
+    graph = nx.relabel_nodes(graph, dict((n, 'w{}'.format(n)) for n in graph))
+    return graph, graph.nodes()
+
+
+def barabasi_albert(numnodes, rng, m=2):
+    '''Barabasi-Albert preferential attachment graph.'''
+    graph = nx.MultiGraph(nx.barabasi_albert_graph(numnodes, min(m, numnodes-1), seed=rng.randint(0, 2**31)))
+    graph = nx.relabel_nodes(graph, dict((n, 'ba{}'.format(n)) for n in graph))
+    return graph, graph.nodes()
+
+
+def ring_of_pops(numnodes, rng, popsize=5):
+    '''
+    A ring of PoPs.  Each PoP has two core routers linked to each other
+    and popsize-2 access routers homed to both cores; core routers link
+    to the matching core in the next PoP around the ring.  Access
+    routers are the traffic endpoints.
+    '''
+    popsize = max(popsize, 3)
+    numpops = max(2, numnodes // popsize)
+    graph = nx.MultiGraph()
+    endpoints = []
+    for pop in xrange(numpops):
+        c0,c1 = 'pop{}_c0'.format(pop), 'pop{}_c1'.format(pop)
+        graph.add_edge(c0, c1)
+        for i in xrange(popsize-2):
+            access = 'pop{}_a{}'.format(pop, i)
+            graph.add_edge(access, c0)
+            graph.add_edge(access, c1)
+            endpoints.append(access)
+        nextpop = (pop + 1) % numpops
+        if nextpop != pop:
+            graph.add_edge(c0, 'pop{}_c0'.format(nextpop))
+            graph.add_edge(c1, 'pop{}_c1'.format(nextpop))
+    return graph, endpoints
+
+
+TOPOLOGIES = {
+    'fattree': fattree,
+    'waxman': waxman,
+    'ba': barabasi_albert,
+    'ring': ring_of_pops,
+}
+
+
+def node_prefix(index):
+    '''A /24 destination prefix for the index-th endpoint.'''
+    if index >= 65536:
+        raise ScenarioError("Too many endpoints to number within 10.0.0.0/8")
+    return "10.{}.{}.0/24".format(index // 256, index % 256)
+
+
+def gravity_pairs(endpoints, rng, flowrate, maxpairs=0):
+    '''
+    Gravity model: each endpoint gets an exponentially distributed mass,
+    and the flow arrival rate between i and j is proportional to
+    mass_i * mass_j, scaled so all pairs together start flowrate flows
+    per second.  If maxpairs > 0, only the heaviest maxpairs pairs are
+    kept (and rescaled to the same total).  Yields (src, dst, rate)
+    tuples.
+    '''
+    mass = dict((n, rng.expovariate(1.0)) for n in endpoints)
+    total = sum(mass.itervalues())
+    selfmass = sum(m*m for m in mass.itervalues())
+    norm = total * total - selfmass
+
+    if maxpairs > 0:
+        pairs = []
+        # the heaviest pairs are among the heaviest sources and destinations
+        bymass = sorted(endpoints, key=lambda n: mass[n], reverse=True)
+        top = bymass[:int(math.ceil(math.sqrt(maxpairs))) + 1]
+        candidates = [ (mass[a]*mass[b], a, b) for a in top for b in top if a != b ]
+        candidates.sort(reverse=True)
+        candidates = candidates[:maxpairs]
+        norm = sum(w for w,a,b in candidates)
+        for w,a,b in candidates:
+            yield a, b, flowrate * w / norm
+        return
+
+    for a in endpoints:
+        for b in endpoints:
+            if a != b:
+                yield a, b, flowrate * mass[a] * mass[b] / norm
+
+
+def link_delay(graph, a, b, rng, mindelay, maxdelay):
+    '''Propagation delay: proportional to distance for topologies with
+    node positions, otherwise uniform within [mindelay, maxdelay].'''
+    if 'pos' in graph.node[a] and 'pos' in graph.node[b]:
+        pa, pb = graph.node[a]['pos'], graph.node[b]['pos']
+        frac = math.hypot(pa[0]-pb[0], pa[1]-pb[1]) / math.sqrt(2.0)
+    else:
+        frac = rng.random()
+    return '{:.3f}ms'.format((mindelay + frac * (maxdelay - mindelay)) * 1000.0)
+
+
+def build_scenario(options, rng):
+    topo = TOPOLOGIES.get(options.topology, None)
+    if not topo:
+        raise ScenarioError("Unknown topology {} (choose from {})".format(options.topology, ', '.join(sorted(TOPOLOGIES))))
+
+    graph, endpoints = topo(options.numnodes, rng)
+    endpoints = sorted(endpoints)
+    nodes = sorted(graph.nodes())
+    prefixes = dict((n, node_prefix(i)) for i,n in enumerate(endpoints))
+
+    if options.measure == 'all':
+        mnodes = 'all'
+    else:
+        mnodes = ' '.join(sorted(rng.sample(nodes, min(int(options.measure), len(nodes)))))
+
+    graphcfg = {
+        "flowexport": options.flowexport,
+        "measurementnodes": mnodes,
+        "flowsampling": 1.0,
+        "pktsampling": 1.0,
+        "counterexport": options.counters,
+        "counterexportinterval": 1,
+        "counterexportfile": "counters",
+        "longflowtmo": 60,
+        "flowinactivetmo": 60,
+        "harpoonsubspec": HARPOON_SUBSPEC,
+    }
+
+    nodedicts = dict((n, {"id": n, "autoack": False}) for n in nodes)
+    for n,pfx in prefixes.iteritems():
+        nodedicts[n]["ipdests"] = pfx
+
+    maxpairs = options.maxpairs
+    if maxpairs is None:
+        maxpairs = min(PAIRS_PER_ENDPOINT * len(endpoints), MAX_PAIRS)
+    allpairs = len(endpoints) * (len(endpoints) - 1)
+    wanted = min(maxpairs, allpairs) if maxpairs > 0 else allpairs
+    if wanted > MAX_PAIRS and not options.manypairs:
+        raise ScenarioError("{} traffic pairs is more than {}; ask for fewer with --maxpairs, or use --manypairs to generate them anyway".format(wanted, MAX_PAIRS))
+
+    numpairs = 0
+    for src,dst,rate in gravity_pairs(endpoints, rng, options.flowrate, maxpairs):
+        ndict = nodedicts[src]
+        tkey = 'm{}'.format(numpairs)
+        skey = 's{}'.format(numpairs)
+        ndict["traffic"] = (ndict.get("traffic", "") + " " + tkey).strip()
+        ndict[tkey] = "modulator start=0.0 generator={} profile=(({},),(1,))".format(skey, options.duration)
+        ndict[skey] = "harpoon ipsrc={} ipdst={} flowstart=exponential({!r}) $harpoonsubspec".format(prefixes[src], prefixes[dst], rate)
+        numpairs += 1
+
+    index = dict((n, i) for i,n in enumerate(nodes))
+    edges = sorted((min(a,b), max(a,b)) for a,b in graph.edges())
+    failing = set()
+    if options.failures > 0:
+        failing = set(rng.sample(xrange(len(edges)), min(options.failures, len(edges))))
+
+    links = []
+    for i,(a,b) in enumerate(edges):
+        ldict = {
+            "source": index[a], "target": index[b],
+            "capacity": options.capacity,
+            "delay": link_delay(graph, a, b, rng, options.mindelay, options.maxdelay),
+            "weight": 1,
+        }
+        if i in failing:
+            ldict["reliability"] = "mttf=exponential(1/{!r}) mttr=exponential(1/{!r})".format(float(options.mttf), float(options.mttr))
+        links.append(ldict)
+
+    header = {
+        "directed": False,
+        "multigraph": True,
+        "graph": [["node", {}], ["graph", graphcfg], ["edge", {}], ["name", options.name or "{}{}".format(options.topology, len(nodes))]],
+    }
+    return header, [ nodedicts[n] for n in nodes ], links, numpairs
+
+
+def write_scenario(outfile, header, nodes, links):
+    '''Write a node-link JSON scenario one record per line, so that very
+    large scenarios never have to be serialized in one piece.'''
+    outfile.write('{\n')
+    for key,val in header.iteritems():
+        outfile.write('"{}": {},\n'.format(key, json.dumps(val)))
+    for key,records in (('nodes', nodes), ('links', links)):
+        outfile.write('"{}": [\n'.format(key))
+        for i,rec in enumerate(records):
+            outfile.write(json.dumps(rec))
+            outfile.write(',\n' if i < len(records)-1 else '\n')
+        outfile.write(']{}\n'.format(',' if key == 'nodes' else ''))
+    outfile.write('}\n')
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.prog = "scengen.py"
+    parser.add_option("-t", "--topology", dest="topology", default="ba",
+                      help="Topology type: {} (default: ba)".format(', '.join(sorted(TOPOLOGIES))))
+    parser.add_option("-n", "--nodes", dest="numnodes", default=100, type=int,
+                      help="Approximate number of nodes (default: 100)")
+    parser.add_option("-s", "--seed", dest="seed", default=1, type=int,
+                      help="Random seed (default: 1)")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="Output file name (default: <topology><nodes>.json)")
+    parser.add_option("--name", dest="name", default=None,
+                      help="Scenario name")
+    parser.add_option("-r", "--flowrate", dest="flowrate", default=100.0, type=float,
+                      help="Network-wide new flows per second, split across pairs by a gravity model (default: 100)")
+    parser.add_option("-p", "--maxpairs", dest="maxpairs", default=None, type=int,
+                      help="Only generate traffic for the heaviest N gravity pairs; 0 for all pairs (default: {} per endpoint, at most {})".format(PAIRS_PER_ENDPOINT, MAX_PAIRS))
+    parser.add_option("--manypairs", dest="manypairs", default=False, action="store_true",
+                      help="Allow more than {} traffic pairs".format(MAX_PAIRS))
+    parser.add_option("-d", "--duration", dest="duration", default=3600, type=int,
+                      help="Duration of traffic sources in seconds (default: 3600)")
+    parser.add_option("-m", "--measure", dest="measure", default="1",
+                      help="Number of randomly chosen measurement nodes, or 'all' (default: 1)")
+    parser.add_option("-x", "--flowexport", dest="flowexport", default="text",
+                      help="Flow exporter for measurement nodes (default: text)")
+    parser.add_option("-c", "--counters", dest="counters", default=False, action="store_true",
+                      help="Turn on interface counter export")
+    parser.add_option("-f", "--failures", dest="failures", default=0, type=int,
+                      help="Number of randomly chosen links that fail and recover (default: 0)")
+    parser.add_option("--mttf", dest="mttf", default=3600.0, type=float,
+                      help="Mean time to failure for failing links, in seconds (default: 3600)")
+    parser.add_option("--mttr", dest="mttr", default=60.0, type=float,
+                      help="Mean time to recovery for failing links, in seconds (default: 60)")
+    parser.add_option("--capacity", dest="capacity", default="1Gb",
+                      help="Link capacity (default: 1Gb)")
+    parser.add_option("--mindelay", dest="mindelay", default=0.001, type=float,
+                      help="Minimum link delay in seconds (default: 0.001)")
+    parser.add_option("--maxdelay", dest="maxdelay", default=0.050, type=float,
+                      help="Maximum link delay in seconds (default: 0.050)")
+    (options, args) = parser.parse_args()
+
+    if options.measure != 'all' and not options.measure.isdigit():
+        parser.error("--measure must be a number or 'all'")
+
+    rng = random.Random(options.seed)
+    try:
+        header, nodes, links, numpairs = build_scenario(options, rng)
+    except ScenarioError,e:
+        print >>sys.stderr, "Error: {}".format(str(e))
+        sys.exit(-1)
+
+    outname = options.output or "{}{}.json".format(options.topology, options.numnodes)
+    with open(outname, 'w') as outfile:
+        write_scenario(outfile, header, nodes, links)
+    print "Wrote {}: {} nodes, {} links, {} traffic pairs".format(outname, len(nodes), len(links), numpairs)
+
+
+if __name__ == '__main__':
+    main()
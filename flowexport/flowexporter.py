@@ -9,6 +9,8 @@ class FlowExporter(object):
 
     def __init__(self, rname):
         self.routername = str(rname)
+        # packet sampling rate applied to the exported flow records
+        self.samplingrate = 1.0
 
     @abstractmethod
     def exportflow(self, ts, flet):
@@ -22,7 +22,10 @@ class TextExporter(FlowExporter):
         self.outfile.close()
 
     def exportflow(self, ts, flet):
-        record = 'textexport %s %0.06f %s\n' % (self.routername, ts, str(flet))
+        if self.samplingrate < 1.0:
+            record = 'textexport %s %0.06f %s sampling %g\n' % (self.routername, ts, str(flet), self.samplingrate)
+        else:
+            record = 'textexport %s %0.06f %s\n' % (self.routername, ts, str(flet))
         self.buffer.append(record)
         if len(self.buffer) >= self.bufsize:
             self._flush_buffer()
@@ -116,12 +116,12 @@ class FsCore(object):
         heapify(self.__heap)
         return len(removed)
 
-    def run(self, scenario, configonly=False):
+    def run(self, scenario, configonly=False, usecache=False):
         '''Start the simulation using a particular scenario filename'''
         cfg = FsConfigurator()
         if scenario:
             root, ext = os.path.splitext(scenario)
-            self.__topology = cfg.load_config(scenario, configtype=ext[1:])
+            self.__topology = cfg.load_config(scenario, configtype=ext[1:], usecache=usecache)
         else:
             self.logger.info("No simulation scenario specified." +
                              "  I'll just do nothing!")
@@ -169,6 +169,12 @@ def main():
     parser.add_option("-s", "--seed", dest="seed",
                       default=None, type="int",
                       help="Set random number generation seed (default: seed based on system time)")
+    parser.add_option("-C", "--cache", dest="usecache",
+                      default=False, action="store_true",
+                      help="Read and write a compiled scenario cache file (<scenario>.fscache, next to the scenario) to speed up startup")
+    parser.add_option("-n", "--nocache", dest="usecache",
+                      action="store_false",
+                      help="Don't use a compiled scenario cache file (the default)")
     (options, args) = parser.parse_args()
 
     if len(args) != 1:
@@ -181,7 +187,7 @@ def main():
     sim = FsCore(options.interval, endtime=options.simtime, debug=options.debug)
     signal.signal(signal.SIGINT, sim.sighandler)
     sys.path.append(".")
-    sim.run(args[0], configonly=options.configonly)
+    sim.run(args[0], configonly=options.configonly, usecache=options.usecache)
 
 if __name__ == '__main__':
     main()
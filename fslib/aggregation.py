@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+'''
+Export-time flow aggregation.
+
+A FlowAggregator sits between a measurement node and its flow exporter.
+Expired flow records are rolled up into buckets keyed by any of: source
+and destination prefix (at a chosen length), protocol, source and
+destination port class, and ingress interface.  Once per aggregation
+interval, each bucket is passed on to the exporter as a single
+AggregateFlowlet, so the exporter writes one record per bucket rather
+than one per flow.
+
+Port classes keep well-known ports (below 1024) as they are, and map
+registered ports (1024-49151) to 1024 and dynamic ports to 49152.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import socket
+import struct
+from fslib.flowlet import Flowlet, FlowIdent
+
+AGGREGATION_KEYS = ('srcprefix','dstprefix','proto','srcport','dstport','ingress')
+
+_ADDR = struct.Struct('!I')
+
+
+def port_class(port):
+    '''Representative port number for a port's class.'''
+    if port < 1024:
+        return port
+    if port < 49152:
+        return 1024
+    return 49152
+
+
+class AggregateFlowlet(Flowlet):
+    '''A flow record standing for a bucket of aggregated flows.'''
+    __slots__ = ['flows','srcprefixlen','dstprefixlen']
+
+    def __init__(self, ident, srcprefixlen, dstprefixlen, flows, pkts, nbytes):
+        Flowlet.__init__(self, ident, pkts=pkts, bytes=nbytes)
+        self.srcprefixlen = srcprefixlen
+        self.dstprefixlen = dstprefixlen
+        self.flows = flows
+
+    def __str__(self):
+        return "%0.06f %0.06f %s/%d:%d->%s/%d:%d %s 0x%0x %s %d %d %s %d flows" % (self.flowstart, self.flowend, self.srcaddr, self.srcprefixlen, self.srcport, self.dstaddr, self.dstprefixlen, self.dstport, self.ipprotoname, self.iptos, self.ingress_intf, self.pkts, self.bytes, self.tcpflagsstr, self.flows)
+
+
+class FlowAggregator(object):
+    '''
+    Aggregates exported flows by the given keys (names from
+    AGGREGATION_KEYS, with prefix keys optionally carrying a length,
+    e.g., 'srcprefix/16'; the default length is 24) and passes one
+    record per bucket to exporter every interval seconds.  Presents the
+    same interface as a flow exporter.
+    '''
+    __slots__ = ['exporter','interval','srclen','srcmask','dstlen','dstmask','proto','srcport','dstport','ingress','buckets','intervalend','lastts']
+
+    def __init__(self, exporter, keys, interval=60.0):
+        self.exporter = exporter
+        self.interval = float(interval)
+        if self.interval <= 0:
+            raise ValueError("Aggregation interval must be positive")
+        self.srclen = self.dstlen = 0
+        self.proto = self.srcport = self.dstport = self.ingress = False
+        for key in keys:
+            name,slash,length = key.partition('/')
+            if name not in AGGREGATION_KEYS or (slash and name not in ('srcprefix','dstprefix')):
+                raise ValueError("Invalid flow aggregation key {}".format(key))
+            length = int(length) if slash else 24
+            if not 0 <= length <= 32:
+                raise ValueError("Invalid prefix length in flow aggregation key {}".format(key))
+            if name == 'srcprefix':
+                self.srclen = length
+            elif name == 'dstprefix':
+                self.dstlen = length
+            else:
+                setattr(self, name, True)
+        self.srcmask = (0xffffffff << (32 - self.srclen)) & 0xffffffff
+        self.dstmask = (0xffffffff << (32 - self.dstlen)) & 0xffffffff
+        # bucket key -> [flows, pkts, bytes, first start, last end, tcpflags]
+        self.buckets = {}
+        self.intervalend = None
+        self.lastts = 0.0
+
+    @property
+    def routername(self):
+        return self.exporter.routername
+
+    @property
+    def samplingrate(self):
+        return self.exporter.samplingrate
+
+    @samplingrate.setter
+    def samplingrate(self, rate):
+        self.exporter.samplingrate = rate
+
+    def exportflow(self, ts, flet):
+        if self.intervalend is None:
+            self.intervalend = (int(ts / self.interval) + 1) * self.interval
+        elif ts >= self.intervalend:
+            self.__flush(self.intervalend)
+            self.intervalend = (int(ts / self.interval) + 1) * self.interval
+        self.lastts = ts
+
+        key = (_ADDR.unpack(socket.inet_aton(str(flet.srcaddr)))[0] & self.srcmask,
+               _ADDR.unpack(socket.inet_aton(str(flet.dstaddr)))[0] & self.dstmask,
+               flet.ipproto if self.proto else 0,
+               port_class(flet.srcport) if self.srcport else 0,
+               port_class(flet.dstport) if self.dstport else 0,
+               flet.ingress_intf if self.ingress else None)
+        bucket = self.buckets.get(key, None)
+        if bucket is None:
+            self.buckets[key] = [1, flet.pkts, flet.bytes, flet.flowstart, flet.flowend, flet.tcpflags]
+        else:
+            bucket[0] += 1
+            bucket[1] += flet.pkts
+            bucket[2] += flet.bytes
+            bucket[3] = min(bucket[3], flet.flowstart)
+            bucket[4] = max(bucket[4], flet.flowend)
+            bucket[5] |= flet.tcpflags
+
+    def __flush(self, ts):
+        ntoa = socket.inet_ntoa
+        pack = _ADDR.pack
+        for key in sorted(self.buckets):
+            src,dst,proto,sport,dport,ingress = key
+            flows,pkts,nbytes,start,end,flags = self.buckets[key]
+            flet = AggregateFlowlet(FlowIdent(ntoa(pack(src)), ntoa(pack(dst)), proto, sport, dport), self.srclen, self.dstlen, flows, pkts, nbytes)
+            flet.tcpflags = flags
+            flet.flowend = end
+            flet.flowstart = start
+            flet.ingress_intf = ingress if self.ingress else '*'
+            self.exporter.exportflow(ts, flet)
+        self.buckets = {}
+
+    def shutdown(self):
+        if self.buckets:
+            self.__flush(self.lastts)
+        self.exporter.shutdown()
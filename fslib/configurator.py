@@ -3,23 +3,28 @@
 __author__ = 'jsommers@colgate.edu'
 
 import sys
+import os
+import hashlib
+import cPickle
 from importlib import import_module
 from abc import ABCMeta, abstractmethod
-import json
 import pydot
 import ipaddr
 from pytricia import PyTricia
 from fslib.node import *
 from fslib.link import Link
+from fslib.fib import build_fibs
+from fslib.streamload import load_json_graph, load_gml_graph
 from fslib.common import get_logger
 from fslib.traffic import FlowEventGenModulator
+from fslib.aggregation import FlowAggregator, AGGREGATION_KEYS
+from fslib.groundtruth import GroundTruthRecorder, groundtruth, set_groundtruth
 import fslib.util as fsutil
 from fslib.util import *
 from fslib.common import fscore
 
-from networkx import single_source_dijkstra_path, single_source_dijkstra_path_length, read_gml
+from networkx import single_source_dijkstra_path, single_source_dijkstra_path_length
 from networkx.drawing.nx_pydot import read_dot
-from networkx.readwrite import json_graph
 
 
 class InvalidTrafficSpecification(Exception):
@@ -42,7 +47,7 @@ class NullTopology(object):
         pass
 
 class Topology(NullTopology):
-    def __init__(self, graph, nodes, links, traffic_modulators):
+    def __init__(self, graph, nodes, links, traffic_modulators, routing=None, owdhash=None):
         self.logger = get_logger('fslib.config')
         self.__graph = graph
         self.nodes = nodes
@@ -50,8 +55,9 @@ class Topology(NullTopology):
         self.traffic_modulators = traffic_modulators
         self.routing = {}
         self.ipdestlpm = None
+        self.fib = None
         self.owdhash = {}
-        self.__configure_routing()
+        self.__configure_routing(routing, owdhash)
 
         for a,b,d in self.graph.edges(data=True):
             if 'reliability' in d:
@@ -71,29 +77,35 @@ class Topology(NullTopology):
         ttf = ttr = None
         for k,v in relidict.iteritems():
             if k == 'failureafter':
-                ttf = eval(v)
+                ttf = evalspec(v)
                 if isinstance(ttf, (int, float)):
                     ttf = modulation_generator([ttf])
 
             elif k == 'downfor':
-                ttr = eval(v)
+                ttr = evalspec(v)
                 if isinstance(ttr, (int, float)):
                     ttr = modulation_generator([ttr])
 
             elif k == 'mttf':
-                ttf = eval(v)
+                ttf = evalspec(v)
 
             elif k == 'mttr':
-                ttr = eval(v)
+                ttr = evalspec(v)
 
         if ttf or ttr:
             assert(ttf and ttr)
             xttf = next(ttf)
             fscore().after(xttf, 'link-failure-'+a+'-'+b, self.__linkdown, a, b, edict, ttf, ttr)
 
-    def __configure_routing(self):
-        for n in self.graph:
-            self.routing[n] = single_source_dijkstra_path(self.graph, n)
+    def __configure_routing(self, routing=None, owdhash=None):
+        '''Compute shortest paths and forwarding tables.  Precomputed
+        routing and owd tables (e.g., from a scenario cache) can be
+        passed in to skip the shortest path computations.'''
+        if routing is None:
+            routing = {}
+            for n in self.graph:
+                routing[n] = single_source_dijkstra_path(self.graph, n)
+        self.routing = routing
 
         self.ipdestlpm = PyTricia()
         for n,d in self.graph.nodes_iter(data=True):
@@ -108,26 +120,19 @@ class Topology(NullTopology):
                     xnode['net'] = ipnet
                     xnode['dests'] = [ n ]
 
-        # install static forwarding table entries to each node
-
-        # FIXME: there's a problematic bit of code here that triggers
-        # pytricia-related (iterator) core dump
-        for nodename,nodeobj in self.nodes.iteritems():
-            if isinstance(nodeobj, Router):
-                for prefix in self.ipdestlpm.keys():
-                    lpmnode = self.ipdestlpm.get(prefix)
-                    if nodename not in lpmnode['dests']:
-                        routes = self.routing[nodename]
-                        for d in lpmnode['dests']:
-                            try:
-                                path = routes[d]
-                            except KeyError:
-                                self.logger.warn("No route from {} to {}".format(nodename, d)) 
-                                continue
-                                
-                            nexthop = path[1]
-                            nodeobj.addForwardingEntry(prefix, nexthop)
-                
+        # build static forwarding tables for all routers in bulk.  routers
+        # share a single prefix trie and interned next-hop groups, and
+        # each one just keeps an array of group ids.
+        prefixdests = [ (prefix, self.ipdestlpm.get(prefix)['dests']) for prefix in self.ipdestlpm.keys() ]
+        routers = [ nodename for nodename,nodeobj in self.nodes.iteritems() if isinstance(nodeobj, Router) ]
+        self.fib, fibs = build_fibs(prefixdests, routers, self.routing, self.logger)
+        for nodename,fib in fibs.iteritems():
+            self.nodes[nodename].setForwardingTable(fib)
+
+        if owdhash is not None:
+            self.owdhash = owdhash
+            return
+
         self.owdhash = {}
         for a in self.graph:
             for b in self.graph:
@@ -161,6 +166,11 @@ class Topology(NullTopology):
     def stop(self):
         for nname,n in self.nodes.iteritems():
             n.stop()     
+
+        recorder = groundtruth()
+        if recorder:
+            recorder.close()
+            set_groundtruth(None)
             
     def __linkdown(self, a, b, edict, ttf, ttr):
         '''kill a link & recompute routing '''
@@ -267,6 +277,10 @@ class Topology(NullTopology):
 class FsConfigurator(object):
     link_subnetter = None
 
+    # bump whenever the contents of the compiled scenario cache change
+    CACHE_VERSION = 1
+    CACHE_SUFFIX = '.fscache'
+
     def __init__(self):
         self.logger = get_logger('fslib.config')
         # FIXME: let this be configurable
@@ -332,25 +346,79 @@ class FsConfigurator(object):
             for k,v in d.iteritems():
                 d[k] = self.__substitute(v)
 
-    def load_config(self, config, configtype="json"):
+    def __scenario_digest(self, config, configtype):
+        '''Content hash of a scenario file, used as the cache key.'''
+        h = hashlib.sha1(configtype)
+        with open(config, 'rb') as infile:
+            for block in iter(lambda: infile.read(1<<20), ''):
+                h.update(block)
+        return h.hexdigest()
+
+    def __read_cache(self, config, digest):
+        '''Return the compiled scenario for config if a cache file exists
+        and matches both the cache version and the scenario content hash;
+        otherwise return None.'''
+        cachename = config + FsConfigurator.CACHE_SUFFIX
+        if not os.path.exists(cachename):
+            return None
         try:
-            if configtype == "dot":
-                self.graph = read_dot(config)
-            elif configtype == "json":
-                self.graph = json_graph.node_link_graph(json.load(open(config)))
-            elif configtype == "gml":
-                self.graph = read_gml(config)
+            with open(cachename, 'rb') as infile:
+                version,xdigest = cPickle.load(infile)
+                if version != FsConfigurator.CACHE_VERSION or xdigest != digest:
+                    self.logger.info("Ignoring stale scenario cache {}".format(cachename))
+                    return None
+                cached = cPickle.load(infile)
         except Exception,e:
-            print "Config read error: {}".format(str(e))
-            self.logger.error("Error reading configuration: {}".format(str(e)))
-            sys.exit(-1)
-         
-        mconfig_dict = {'counterexport':False, 'flowexport':'null','counterexportinterval':0, 'counterexportfile':None, 'maintenance_cycle':60, 'pktsampling':1.0, 'flowsampling':1.0, 'longflowtmo':-1, 'flowinactivetmo':-1}
+            self.logger.warn("Error reading scenario cache {}: {}".format(cachename, str(e)))
+            return None
+        self.logger.info("Loaded compiled scenario from {}".format(cachename))
+        return cached
+
+    def __write_cache(self, config, digest, topology):
+        '''Write the parsed graph, link parameters, routing and owd tables
+        next to the scenario file.'''
+        cachename = config + FsConfigurator.CACHE_SUFFIX
+        cached = {'graph':topology.graph, 'routing':topology.routing, 'owdhash':topology.owdhash}
+        # write to a temporary file and rename it into place, so that a
+        # failed write never leaves a truncated cache behind; the cache
+        # is only an optimization, so any failure is just logged
+        tmpname = cachename + '.tmp'
+        try:
+            with open(tmpname, 'wb') as outfile:
+                cPickle.dump((FsConfigurator.CACHE_VERSION, digest), outfile, cPickle.HIGHEST_PROTOCOL)
+                cPickle.dump(cached, outfile, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, cachename)
+        except Exception,e:
+            self.logger.warn("Couldn't write scenario cache {}: {}".format(cachename, str(e)))
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+            return
+        self.logger.info("Wrote compiled scenario to {}".format(cachename))
+
+    def load_config(self, config, configtype="json", usecache=False):
+        '''Read a scenario file and build the simulation topology.  If
+        usecache is True, a compiled version of the parsed scenario
+        (graph, link parameters, routing and owd tables) is loaded from,
+        or written to, a versioned cache file next to the scenario.'''
+        digest = cached = None
+        if usecache:
+            digest = self.__scenario_digest(config, configtype)
+            cached = self.__read_cache(config, digest)
+
+        if cached:
+            self.graph = cached['graph']
+        else:
+            self.__read_graph(config, configtype)
+
+        mconfig_dict = {'counterexport':False, 'counterexportformat':'text', 'flowexport':'null','counterexportinterval':0, 'counterexportfile':None, 'maintenance_cycle':60, 'pktsampling':1.0, 'pktsamplingmode':'random', 'flowsampling':1.0, 'longflowtmo':-1, 'flowinactivetmo':-1, 'flowcachesize':-1, 'flowcachepolicy':'lru', 'measurementtype':'flow'}
 
         self.logger.info("Reading config for graph {}.".format(self.graph.graph.get('name','(unnamed)')))
 
-        self.__strip_strings()
-        self.__do_substitutions()
+        if not cached:
+            self.__strip_strings()
+            self.__do_substitutions()
 
         measurement_nodes = self.graph.nodes()
         for key in self.graph.graph['graph']:
@@ -367,6 +435,37 @@ class FsConfigurator(object):
             s = "No such flow exporter {0} (module flowexport.{0}export doesn't exist.".format(mconfig_dict['flowexport'])
             raise InvalidConfiguration(s)
 
+        if mconfig_dict['flowcachepolicy'] not in MeasurementConfig.FLOWCACHE_POLICIES:
+            raise InvalidConfiguration("Unknown flow cache policy {} (choose from {})".format(mconfig_dict['flowcachepolicy'], ', '.join(MeasurementConfig.FLOWCACHE_POLICIES)))
+
+        if mconfig_dict['counterexportformat'] not in MeasurementConfig.COUNTER_FORMATS:
+            raise InvalidConfiguration("Unknown counter export format {} (choose from {})".format(mconfig_dict['counterexportformat'], ', '.join(MeasurementConfig.COUNTER_FORMATS)))
+
+        if mconfig_dict['measurementtype'] not in MeasurementConfig.MEASUREMENT_TYPES:
+            raise InvalidConfiguration("Unknown measurement type {} (choose from {})".format(mconfig_dict['measurementtype'], ', '.join(MeasurementConfig.MEASUREMENT_TYPES)))
+
+        if mconfig_dict['pktsamplingmode'] not in PacketSampler.MODES:
+            raise InvalidConfiguration("Unknown packet sampling mode {} (choose from {})".format(mconfig_dict['pktsamplingmode'], ', '.join(PacketSampler.MODES)))
+
+        try:
+            pktsampling = float(mconfig_dict['pktsampling'])
+        except (TypeError, ValueError):
+            pktsampling = None
+        if pktsampling is None or not 0.0 < pktsampling <= 1.0:
+            raise InvalidConfiguration("Packet sampling rate {} must be a fraction in (0, 1] (e.g., 0.01 for 1 in 100)".format(mconfig_dict['pktsampling']))
+
+        for classes in [ mconfig_dict.get('measureclasses','all') ] + [ d['measureclasses'] for n,d in self.graph.nodes_iter(data=True) if 'measureclasses' in d ]:
+            unknown = set(MeasurementConfig.selection(classes) or []) - set(MeasurementConfig.TRAFFIC_CLASSES)
+            if unknown:
+                raise InvalidConfiguration("Unknown traffic class(es) {} in measureclasses (choose from {})".format(', '.join(sorted(unknown)), ', '.join(MeasurementConfig.TRAFFIC_CLASSES)))
+
+        aggregation = MeasurementConfig.selection(mconfig_dict.get('flowaggregation','none'))
+        if aggregation:
+            try:
+                FlowAggregator(None, aggregation, mconfig_dict.get('aggregationinterval', 60.0))
+            except ValueError,e:
+                raise InvalidConfiguration("Bad flow aggregation setting: {} (keys are {}, with optional /prefixlen for prefixes)".format(str(e), ', '.join(AGGREGATION_KEYS)))
+
         measurement_config = MeasurementConfig(**mconfig_dict)
         self.logger.info("Running measurements on these nodes: <{}>".format(','.join(measurement_nodes)))
 
@@ -381,9 +480,37 @@ class FsConfigurator(object):
         self.traffic_modulators = []
 
         self.__configure_parallel_universe(measurement_config, measurement_nodes)
+
+        # traffic generators pick up the ground-truth recorder (if any)
+        # when they're constructed
+        gtname = mconfig_dict.get('groundtruth', None)
+        if gtname:
+            self.logger.info("Recording ground-truth flows in {}".format(gtname))
+            set_groundtruth(GroundTruthRecorder(gtname))
+        else:
+            set_groundtruth(None)
         self.__configure_traffic()
         self.__print_config()
-        return Topology(self.graph, self.nodes, self.links, self.traffic_modulators)
+        if cached:
+            return Topology(self.graph, self.nodes, self.links, self.traffic_modulators, routing=cached['routing'], owdhash=cached['owdhash'])
+
+        topology = Topology(self.graph, self.nodes, self.links, self.traffic_modulators)
+        if usecache:
+            self.__write_cache(config, digest, topology)
+        return topology
+
+    def __read_graph(self, config, configtype):
+        try:
+            if configtype == "dot":
+                self.graph = read_dot(config)
+            elif configtype == "json":
+                self.graph = load_json_graph(config)
+            elif configtype == "gml":
+                self.graph = load_gml_graph(config)
+        except Exception,e:
+            print "Config read error: {}".format(str(e))
+            self.logger.error("Error reading configuration: {}".format(str(e)))
+            sys.exit(-1)
 
     def __print_config(self):
         self.logger.debug("*** Begin Configuration Dump ***".center(30))
@@ -516,7 +643,7 @@ class FsConfigurator(object):
 
         trafprofname = moddict.get('generator', None)
         st = moddict.get('start', None)
-        st = eval(st)
+        st = evalspec(st)
         if isinstance(st, (int, float)):
             st = fsutil.randomchoice(st)
 
@@ -538,7 +665,8 @@ class FsConfigurator(object):
 
         self.logger.debug("Found traffic specification for {}: {}".format(trafprofname,trafprofstr))
         tgen = self.__configure_traf_spec(trafprofname, trafprofstr, srcnode)
-        fm = FlowEventGenModulator(tgen, stime=st, emerge_profile=emerge, sustain_profile=profile, withdraw_profile=withdraw)
+        superpose = evalspec(moddict.get('superpose', 'False'))
+        fm = FlowEventGenModulator(tgen, stime=st, emerge_profile=emerge, sustain_profile=profile, withdraw_profile=withdraw, superpose=superpose)
         return fm
 
      
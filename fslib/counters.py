@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+'''
+Interface (SNMP-style) counters for all measurement nodes.
+
+Rather than every node keeping its own dictionary of counters and
+scheduling its own export event, all nodes sharing a measurement
+configuration update one flat array of counters, indexed by
+(interface row, metric), where an interface row is a (node, neighbor)
+pair.  A single event per export interval snapshots the whole array
+and writes it out, either as the per-node text files fs has always
+produced or as binary columnar frames.
+
+Binary output consists of two files:
+
+  <exportfile>.idx     one line per interface row: "row node neighbor"
+  <exportfile>.frames  a header (magic, version, item size) followed by
+                       one frame per interval: timestamp (double) and row
+                       count (uint32), then the bytes, pkts and flows
+                       columns, each holding one unsigned integer per row
+
+Rows are only ever appended, so a frame's columns cover rows 0..n-1 of
+the index as it stood when the frame was written.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import sys
+import struct
+from array import array
+from fslib.common import fscore
+
+BYTECOUNT = 0
+PKTCOUNT = 1
+FLOWCOUNT = 2
+NUM_METRICS = 3
+
+FRAME_MAGIC = 'FSCT'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<4sBB')
+FRAME = struct.Struct('<dI')
+
+
+class InterfaceCounters(object):
+    '''Counters for every (node, neighbor) interface seen by a set of
+    measurement nodes, stored in one preallocated, growable array.'''
+    __slots__ = ['config','rows','names','counts','refs','outfiles','indexfile','indexed','started']
+
+    def __init__(self, config, initialrows=64):
+        self.config = config
+        self.rows = {}
+        self.names = []
+        self.counts = array('L', [0]) * (initialrows * NUM_METRICS)
+        self.refs = 0
+        self.outfiles = {}
+        self.indexfile = None
+        self.indexed = 0
+        self.started = False
+
+    def row(self, node, neighbor):
+        '''Return the row for the interface at node facing neighbor,
+        allocating one if needed.'''
+        key = (str(node), str(neighbor))
+        row = self.rows.get(key, None)
+        if row is None:
+            row = len(self.names)
+            self.rows[key] = row
+            self.names.append(key)
+            if len(self.counts) < len(self.names) * NUM_METRICS:
+                # double capacity, so growth is amortized O(1)
+                self.counts.extend(array('L', [0]) * len(self.counts))
+        return row
+
+    def get(self, node, neighbor, metric):
+        '''Current (since the last export) count of one metric.'''
+        row = self.rows.get((str(node), str(neighbor)), None)
+        if row is None:
+            return 0
+        return self.counts[row * NUM_METRICS + metric]
+
+    def start(self):
+        '''Called by each measurement node as it starts; the export event
+        is only scheduled once.'''
+        self.refs += 1
+        if self.started or self.config.exportinterval <= 0:
+            return
+        self.started = True
+        if self.binary:
+            name = self.config.exportfile or 'counters'
+            self.outfiles[None] = open('{}.frames'.format(name), 'wb')
+            self.outfiles[None].write(FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, self.counts.itemsize))
+            self.indexfile = open('{}.idx'.format(name), 'w')
+        # (event names keep counter exports ordered as they were when
+        # each node scheduled its own)
+        fscore().after(0, 'router-snmpexport', self.export)
+
+    @property
+    def binary(self):
+        return self.config.counterexportformat == 'binary'
+
+    def export(self):
+        '''Snapshot and write out all counters, then reset them.'''
+        counts = self.counts
+        self.counts = array('L', [0]) * len(counts)
+        if self.binary:
+            self.__write_frame(counts)
+        else:
+            self.__write_text(counts)
+        fscore().after(self.config.exportinterval, 'node-snmpexport', self.export)
+
+    def __write_frame(self, counts):
+        nrows = len(self.names)
+        for row in xrange(self.indexed, nrows):
+            print >>self.indexfile, row, self.names[row][0], self.names[row][1]
+        self.indexed = nrows
+        self.indexfile.flush()
+        outfile = self.outfiles[None]
+        outfile.write(FRAME.pack(fscore().now, nrows))
+        for metric in xrange(NUM_METRICS):
+            counts[metric:nrows*NUM_METRICS:NUM_METRICS].tofile(outfile)
+
+    def __write_text(self, counts):
+        now = fscore().now
+        for row,(node,neighbor) in enumerate(self.names):
+            base = row * NUM_METRICS
+            if not (counts[base+BYTECOUNT] or counts[base+PKTCOUNT] or counts[base+FLOWCOUNT]):
+                continue
+            print >>self.__textfile(node), '%8.3f %s->%s %d bytes %d pkts %d flows' % (now, neighbor, node, counts[base+BYTECOUNT], counts[base+PKTCOUNT], counts[base+FLOWCOUNT])
+
+    def __textfile(self, node):
+        outfile = self.outfiles.get(node, None)
+        if outfile is None:
+            if self.config.exportfile == 'stdout':
+                outfile = sys.stdout
+            else:
+                outfile = open('{}_{}.txt'.format(node, self.config.exportfile), 'w')
+            self.outfiles[node] = outfile
+        return outfile
+
+    def stop(self):
+        '''Called by each measurement node as it stops; output files are
+        closed once the last one has stopped.'''
+        self.refs -= 1
+        if self.refs > 0:
+            return
+        for outfile in self.outfiles.itervalues():
+            if outfile is not sys.stdout:
+                outfile.close()
+        self.outfiles = {}
+        if self.indexfile:
+            self.indexfile.close()
+            self.indexfile = None
+
+
+def read_counter_frames(name):
+    '''
+    Read binary counter output written with exportfile name.  Returns
+    the list of (node, neighbor) interface rows and a generator of
+    (timestamp, bytes, pkts, flows) frames, where each column is an
+    array with one entry per row.
+    '''
+    names = []
+    with open('{}.idx'.format(name)) as indexfile:
+        for line in indexfile:
+            row,node,neighbor = line.split()
+            names.append((node, neighbor))
+
+    def frames():
+        with open('{}.frames'.format(name), 'rb') as infile:
+            magic,version,itemsize = FRAME_HEADER.unpack(infile.read(FRAME_HEADER.size))
+            if magic != FRAME_MAGIC or version != FRAME_VERSION:
+                raise ValueError("{}.frames is not an fs counter frame file".format(name))
+            typecode = [ t for t in 'LI' if array(t).itemsize == itemsize ][0]
+            while True:
+                header = infile.read(FRAME.size)
+                if len(header) < FRAME.size:
+                    return
+                ts,nrows = FRAME.unpack(header)
+                columns = []
+                for metric in xrange(NUM_METRICS):
+                    col = array(typecode)
+                    col.fromfile(infile, nrows)
+                    columns.append(col)
+                yield (ts,) + tuple(columns)
+
+    return names, frames()
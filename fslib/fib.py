@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+'''
+Forwarding information base (FIB) shared across all routers in fs.
+
+Rather than giving every router its own radix trie full of next-hop
+lists, a single trie maps each destination prefix to an integer slot.
+Distinct next-hop lists are interned once as groups, and each router
+only keeps a compact array of group ids indexed by prefix slot.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+from array import array
+from pytricia import PyTricia
+import ipaddr
+
+
+def normalize_prefix(prefix):
+    '''Return the canonical string form of an IPv4 prefix.'''
+    return str(ipaddr.IPv4Network(str(prefix)).masked())
+
+
+class NexthopGroups(object):
+    '''Interned next-hop groups.  Group 0 is always the empty group,
+    meaning "no route".'''
+    __slots__ = ['groups', 'index']
+
+    def __init__(self):
+        self.groups = [()]
+        self.index = {(): 0}
+
+    def intern(self, nexthops):
+        '''Return the group id for a sequence of next-hop node names,
+        creating a new group if this sequence hasn't been seen before.'''
+        nexthops = tuple(nexthops)
+        gid = self.index.get(nexthops, None)
+        if gid is None:
+            gid = len(self.groups)
+            self.groups.append(nexthops)
+            self.index[nexthops] = gid
+        return gid
+
+    def __getitem__(self, gid):
+        return self.groups[gid]
+
+    def __len__(self):
+        return len(self.groups)
+
+
+class SharedFib(object):
+    '''A single prefix trie shared by a set of routers.  Each prefix is
+    assigned a slot; parents[slot] is the slot of the next-shortest
+    covering prefix (or -1), which lets per-router lookups fall back to
+    a less specific route when a router has no entry for the longest
+    matching prefix.'''
+    __slots__ = ['trie', 'prefixes', 'parents', 'nhgroups']
+
+    def __init__(self, prefixes=()):
+        self.trie = PyTricia(32)
+        self.prefixes = []
+        self.parents = array('l')
+        self.nhgroups = NexthopGroups()
+        for p in prefixes:
+            self.__add(p)
+        self.__compute_parents()
+
+    def __add(self, prefix):
+        pstr = normalize_prefix(prefix)
+        slot = self.trie.get(pstr, None)
+        if slot is not None and self.prefixes[slot] == pstr:
+            return slot
+        slot = len(self.prefixes)
+        self.prefixes.append(pstr)
+        self.trie[pstr] = slot
+        return slot
+
+    def __compute_parents(self):
+        bykey = {}
+        nets = []
+        for slot,pstr in enumerate(self.prefixes):
+            net = ipaddr.IPv4Network(pstr)
+            nets.append(net)
+            bykey[(int(net.network), net.prefixlen)] = slot
+
+        parents = array('l', [-1]) * len(self.prefixes)
+        for slot,net in enumerate(nets):
+            netint = int(net.network)
+            for plen in xrange(net.prefixlen-1, -1, -1):
+                mask = (0xffffffff << (32-plen)) & 0xffffffff
+                parent = bykey.get((netint & mask, plen), None)
+                if parent is not None:
+                    parents[slot] = parent
+                    break
+        self.parents = parents
+
+    def slot(self, prefix):
+        '''Return the slot for an exact prefix, adding the prefix to the
+        shared trie if it isn't there yet.'''
+        nslots = len(self.prefixes)
+        slot = self.__add(prefix)
+        if len(self.prefixes) != nslots:
+            self.__compute_parents()
+        return slot
+
+    def find(self, prefix):
+        '''Return the slot for an exact prefix, or None.'''
+        pstr = normalize_prefix(prefix)
+        slot = self.trie.get(pstr, None)
+        if slot is not None and self.prefixes[slot] == pstr:
+            return slot
+        return None
+
+    def __len__(self):
+        return len(self.prefixes)
+
+
+class RouterFib(object):
+    '''Per-router view of a SharedFib: an array of next-hop group ids,
+    indexed by prefix slot.'''
+    __slots__ = ['shared', 'gids']
+
+    def __init__(self, shared=None, gids=None):
+        if shared is None:
+            shared = SharedFib()
+        self.shared = shared
+        if gids is None:
+            gids = array('L')
+        self.gids = gids
+
+    def __gid(self, slot):
+        if slot < len(self.gids):
+            return self.gids[slot]
+        return 0
+
+    def lookup(self, destip):
+        '''Longest-prefix match for destip; returns a (possibly empty)
+        tuple of next-hop node names.'''
+        shared = self.shared
+        slot = shared.trie.get(destip, None)
+        if slot is None:
+            return ()
+        gids = self.gids
+        parents = shared.parents
+        while slot >= 0:
+            if slot < len(gids) and gids[slot]:
+                return shared.nhgroups.groups[gids[slot]]
+            slot = parents[slot]
+        return ()
+
+    def get(self, prefix, default=None):
+        '''Return the next-hop group installed for an exact prefix.'''
+        slot = self.shared.find(prefix)
+        if slot is None:
+            return default
+        return self.shared.nhgroups[self.__gid(slot)] or default
+
+    def __setslot(self, slot, nexthops):
+        gids = self.gids
+        if slot >= len(gids):
+            gids.extend([0] * (slot + 1 - len(gids)))
+        gids[slot] = self.shared.nhgroups.intern(nexthops)
+
+    def add(self, prefix, nexthop):
+        '''Append nexthop to the group installed for prefix.'''
+        slot = self.shared.slot(prefix)
+        group = self.shared.nhgroups[self.__gid(slot)]
+        self.__setslot(slot, group + (nexthop,))
+
+    def remove(self, prefix, nexthop):
+        '''Remove nexthop from the group installed for prefix.'''
+        slot = self.shared.find(prefix)
+        if slot is None:
+            return
+        group = list(self.shared.nhgroups[self.__gid(slot)])
+        if nexthop in group:
+            group.remove(nexthop)
+        self.__setslot(slot, group)
+
+    def has_key(self, prefix):
+        return self.get(prefix) is not None
+
+    def __len__(self):
+        return sum(1 for g in self.gids if g)
+
+
+def build_fibs(prefixdests, routers, routing, logger=None):
+    '''
+    Build forwarding tables for a set of routers in bulk.
+
+    prefixdests: list of (prefix, [destination node names])
+    routers: iterable of router names to build tables for
+    routing: dict of router name -> {dest name: shortest path list}
+
+    Returns a (SharedFib, {router name: RouterFib}) tuple.  Routers with
+    identical next-hop lists for a prefix share the same interned group,
+    and next hops are only computed once per distinct destination set.
+    '''
+    shared = SharedFib([p for p,dests in prefixdests])
+    nhgroups = shared.nhgroups
+    slotdests = [()] * len(shared)
+    for p,dests in prefixdests:
+        slot = shared.find(p)
+        slotdests[slot] = slotdests[slot] + tuple(dests)
+    fibs = {}
+    for rname in routers:
+        routes = routing.get(rname, {})
+        gids = array('L', [0]) * len(shared)
+        groupcache = {}
+        for slot,dests in enumerate(slotdests):
+            if rname in dests:
+                continue
+            gid = groupcache.get(dests, None)
+            if gid is None:
+                nexthops = []
+                for d in dests:
+                    path = routes.get(d, None)
+                    if path is None:
+                        if logger:
+                            logger.warn("No route from {} to {}".format(rname, d))
+                        continue
+                    nexthops.append(path[1])
+                gid = groupcache[dests] = nhgroups.intern(nexthops)
+            gids[slot] = gid
+        fibs[rname] = RouterFib(shared, gids)
+    return shared, fibs
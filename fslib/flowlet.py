@@ -47,7 +47,7 @@ class FlowIdent(object):
 class Flowlet(object):
     __slots__ = ['__srcmac','__dstmac','__mss','__iptos','__pkts',
                  '__bytes','__flowident','__tcpflags','__ackflow',
-                 '__flowstart','__flowend','ingress_intf']
+                 '__flowstart','__flowend','ingress_intf','span']
     def __init__(self, ident, 
                  srcmac=None, dstmac=None,
                  pkts=0, bytes=0, tcpflags=0):
@@ -59,6 +59,9 @@ class Flowlet(object):
         self.pkts = pkts
         self.bytes = bytes
         self.ingress_intf = None
+        # seconds over which the flowlet's bytes are spread (0 if they
+        # go out within one simulator interval)
+        self.span = 0.0
         self.iptos = 0x0
         self.mss = 1500
         self.tcpflags = 0x0
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+'''
+Columnar storage for the flow records cached at a measurement node.
+
+Each cached flow is a row in a set of typed arrays (start and end times,
+packet and byte counts, TCP flags, TOS, ingress interface), and a dict
+maps flow keys to rows.  Compared with keeping a copied Flowlet object
+(plus a formatted ingress string) per flow, this needs a fraction of
+the memory; Flowlet objects are only built when a record is exported.
+Rows freed by exported flows are reused.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+from array import array
+from collections import OrderedDict
+from fslib.flowlet import Flowlet
+
+
+class FlowRecordStore(object):
+    '''
+    Flow records, one row per cached flow.  If ordered is True, the
+    key->row mapping keeps its insertion order (which touch() can turn
+    into access order), so that the first row is the oldest (or least
+    recently used) flow.
+
+    Each row also gets a serial number, unique over the lifetime of the
+    store, so that references to a row held elsewhere (e.g., in an expiry
+    heap) can be checked for staleness after the row has been reused.
+    '''
+    __slots__ = ['rows','free','idents','start','end','pkts','bytes',
+                 'tcpflags','iptos','ingress','serials','nextserial',
+                 'ingress_names','ingress_ids']
+
+    def __init__(self, ordered=False):
+        self.rows = OrderedDict() if ordered else {}
+        self.free = []
+        self.idents = []
+        self.start = array('d')
+        self.end = array('d')
+        self.pkts = array('L')
+        self.bytes = array('L')
+        self.tcpflags = array('B')
+        self.iptos = array('B')
+        self.ingress = array('l')
+        self.serials = array('L')
+        self.nextserial = 0
+        self.ingress_names = []
+        self.ingress_ids = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def row(self, key):
+        '''Return the row for a flow key, or None.'''
+        return self.rows.get(key, None)
+
+    def valid(self, row, serial):
+        '''Check whether row still holds the flow it held when it had
+        the given serial number.'''
+        return self.serials[row] == serial and self.idents[row] is not None
+
+    def first(self):
+        '''Return the row at the front of the key order.'''
+        return next(self.rows.itervalues())
+
+    def touch(self, key):
+        '''Move a flow to the back of the key order (ordered stores only).'''
+        self.rows[key] = self.rows.pop(key)
+
+    def __ingress_id(self, ingress):
+        iid = self.ingress_ids.get(ingress, None)
+        if iid is None:
+            iid = self.ingress_ids[ingress] = len(self.ingress_names)
+            self.ingress_names.append(ingress)
+        return iid
+
+    def insert(self, flowlet, start, end, pkts, nbytes, ingress):
+        '''Add a new flow record for flowlet's key and return its row.'''
+        self.nextserial += 1
+        iid = self.__ingress_id(ingress)
+        if self.free:
+            row = self.free.pop()
+            self.idents[row] = flowlet.ident
+            self.start[row] = start
+            self.end[row] = end
+            self.pkts[row] = pkts
+            self.bytes[row] = nbytes
+            self.tcpflags[row] = flowlet.tcpflags
+            self.iptos[row] = flowlet.iptos
+            self.ingress[row] = iid
+            self.serials[row] = self.nextserial
+        else:
+            row = len(self.idents)
+            self.idents.append(flowlet.ident)
+            self.start.append(start)
+            self.end.append(end)
+            self.pkts.append(pkts)
+            self.bytes.append(nbytes)
+            self.tcpflags.append(flowlet.tcpflags)
+            self.iptos.append(flowlet.iptos)
+            self.ingress.append(iid)
+            self.serials.append(self.nextserial)
+        self.rows[flowlet.key] = row
+        return row
+
+    def update(self, row, flowlet, pkts, nbytes):
+        '''Add a flowlet's volume and flags to an existing record.'''
+        self.pkts[row] += pkts
+        self.bytes[row] += nbytes
+        self.tcpflags[row] |= flowlet.tcpflags
+
+    def delete(self, row):
+        '''Remove a record; its row will be reused.'''
+        del self.rows[self.idents[row].key]
+        self.idents[row] = None
+        self.free.append(row)
+
+    def flowlet(self, row):
+        '''Materialize a record as a Flowlet (e.g., for export).'''
+        flet = Flowlet(self.idents[row], pkts=self.pkts[row], bytes=self.bytes[row])
+        flet.tcpflags = self.tcpflags[row]
+        flet.iptos = self.iptos[row]
+        flet.flowend = self.end[row]
+        flet.flowstart = self.start[row]
+        flet.ingress_intf = self.ingress_names[self.ingress[row]]
+        return flet
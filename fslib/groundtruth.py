@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+'''
+Ground-truth flow records, for evaluating measurement accuracy.
+
+When the graph-level option groundtruth=<filename> is set, traffic
+generators report each flow they send to a GroundTruthRecorder once,
+when the flow completes, with the flow's true totals (first and last
+emission times, packets, bytes and TCP flags).  Records are fixed-width
+binary:
+
+  header  magic 'FSGT', version (1 byte)
+  record  start, end (double), srcip, dstip (4 bytes each, network
+          order), sport, dport (uint16), ipproto, iptos, tcpflags
+          (1 byte each, plus one pad byte), pkts, bytes (uint64)
+
+Flows still active when the simulation ends are not recorded.  Since
+records are written as flows complete, the file is ordered by end time,
+which lets join_records() match it against exported flow records
+(also ordered by time) in a single streaming pass.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import socket
+import struct
+from heapq import merge
+from collections import defaultdict, deque
+from socket import IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP
+
+GT_MAGIC = 'FSGT'
+GT_VERSION = 1
+GT_HEADER = struct.Struct('<4sB')
+GT_RECORD = struct.Struct('<dd4s4sHHBBBxQQ')
+
+_PROTONAMES = { IPPROTO_TCP:'tcp', IPPROTO_UDP:'udp', IPPROTO_ICMP:'icmp' }
+
+
+class GroundTruthRecorder(object):
+    '''Buffered writer for ground-truth flow records.'''
+    __slots__ = ['outfile','buffer','bufsize','flows']
+
+    def __init__(self, outname, bufsize=1024):
+        self.outfile = open(outname, 'wb')
+        self.outfile.write(GT_HEADER.pack(GT_MAGIC, GT_VERSION))
+        self.buffer = []
+        self.bufsize = bufsize
+        self.flows = 0
+
+    def record(self, flowlet, start, end, pkts, nbytes, tcpflags=0):
+        '''Record one completed flow, identified by flowlet's key.'''
+        self.buffer.append(GT_RECORD.pack(start, end,
+            socket.inet_aton(str(flowlet.srcaddr)), socket.inet_aton(str(flowlet.dstaddr)),
+            flowlet.srcport, flowlet.dstport, flowlet.ipproto, flowlet.iptos, tcpflags,
+            pkts, nbytes))
+        self.flows += 1
+        if len(self.buffer) >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write(''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+
+
+_recorder = None
+
+def set_groundtruth(recorder):
+    '''Install (or, with None, remove) the ground-truth recorder.'''
+    global _recorder
+    _recorder = recorder
+
+def groundtruth():
+    '''Get the ground-truth recorder, or None if flows aren't recorded.'''
+    return _recorder
+
+
+def read_groundtruth(name):
+    '''
+    Generator of ground-truth records from file name, as tuples
+    (start, end, srcip, sport, dstip, dport, protoname, tcpflags, pkts,
+    bytes), with addresses as dotted-quad strings and the protocol named
+    as in exported flow records.
+    '''
+    with open(name, 'rb') as infile:
+        magic,version = GT_HEADER.unpack(infile.read(GT_HEADER.size))
+        if magic != GT_MAGIC or version != GT_VERSION:
+            raise ValueError("{} is not an fs ground-truth file".format(name))
+        size = GT_RECORD.size
+        unpack = GT_RECORD.unpack
+        ntoa = socket.inet_ntoa
+        while True:
+            block = infile.read(size * 4096)
+            if not block:
+                return
+            for offset in xrange(0, len(block) - size + 1, size):
+                start,end,src,dst,sport,dport,proto,tos,flags,pkts,nbytes = unpack(block[offset:offset+size])
+                yield (start, end, ntoa(src), sport, ntoa(dst), dport, _PROTONAMES.get(proto, 'ip'), flags, pkts, nbytes)
+
+
+def read_flow_records(infile):
+    '''
+    Generator of (exportts, start, srcip, sport, dstip, dport, protoname,
+    pkts, bytes) tuples from a text flow export (<node>_flow.txt) file
+    object.  Lines that aren't flow records are skipped.
+    '''
+    for line in infile:
+        fields = line.split()
+        if len(fields) < 11 or fields[0] != 'textexport':
+            continue
+        src,dst = fields[5].split('->')
+        srcip,sport = src.rsplit(':', 1)
+        dstip,dport = dst.rsplit(':', 1)
+        yield (float(fields[2]), float(fields[3]), srcip, int(sport), dstip, int(dport), fields[6], int(fields[9]), int(fields[10]))
+
+
+def join_records(truth, exported, horizon=120.0):
+    '''
+    Match exported flow records to ground-truth flows in one pass over
+    both (each must be ordered by time: ground truth by end time, as
+    written, and exported records by export time).
+
+    An exported record belongs to the ground-truth flow with the same
+    key that started at or before the record's start.  Since a record
+    may be exported before its flow ends (e.g., on an active timeout) or
+    well after, a ground-truth flow is held open for horizon seconds
+    past its end to collect late records, and unclaimed records are held
+    for horizon seconds waiting for their flow.  horizon should be at
+    least the longest export delay (inactive timeout plus maintenance
+    cycle).
+
+    Yields (truth, pkts, bytes, nrecords) for every ground-truth flow,
+    where pkts, bytes and nrecords sum up the matching exported records,
+    and (None, pkts, bytes, 1) for each exported record with no matching
+    ground-truth flow (e.g., reverse ACK flows or flows that hadn't
+    completed by the end of the simulation).
+    '''
+    # exported timestamps are rounded to microseconds
+    slack = 1e-6
+    gtstream = ( (gt[1], 0, gt) for gt in truth )
+    exstream = ( (rec[0], 1, rec) for rec in exported )
+
+    opened = {}                # key -> [truth, pkts, bytes, nrecords]
+    pending = defaultdict(deque)  # key -> unclaimed exported records
+    closing = deque()          # (end, key, entry) in end-time order
+    waiting = deque()          # (exportts, key) in export-time order
+
+    for now,kind,item in merge(gtstream, exstream):
+        # retire flows and records that have aged out of the horizon
+        while closing and closing[0][0] + horizon < now:
+            end,key,entry = closing.popleft()
+            if opened.get(key) is entry:
+                del opened[key]
+            yield tuple(entry)
+        while waiting and waiting[0][0] + horizon < now:
+            ts,key = waiting.popleft()
+            records = pending.get(key)
+            while records and records[0][0] <= ts:
+                rec = records.popleft()
+                yield (None, rec[7], rec[8], 1)
+            if key in pending and not records:
+                del pending[key]
+
+        if kind == 0:
+            key = item[2:7]
+            entry = [item, 0, 0, 0]
+            records = pending.pop(key, None)
+            if records:
+                for rec in records:
+                    if rec[1] + slack >= item[0]:
+                        entry[1] += rec[7]
+                        entry[2] += rec[8]
+                        entry[3] += 1
+                    else:
+                        yield (None, rec[7], rec[8], 1)
+            opened[key] = entry
+            closing.append((item[1], key, entry))
+        else:
+            key = item[2:7]
+            entry = opened.get(key)
+            if entry is not None and item[1] + slack >= entry[0][0]:
+                entry[1] += item[7]
+                entry[2] += item[8]
+                entry[3] += 1
+            else:
+                pending[key].append(item)
+                waiting.append((item[0], key))
+
+    for end,key,entry in closing:
+        yield tuple(entry)
+    for records in pending.itervalues():
+        for rec in records:
+            yield (None, rec[7], rec[8], 1)
@@ -130,16 +130,27 @@ class Link(object):
         before arriving at next node, and optionally handle computing queueing delay (backlog) on
         the link.
         '''
-        wait = self.delay + flowlet.size / self.capacity
+        size = flowlet.size
+        # how much longer than the wait the bytes stay in the backlog
+        hold = 0.0
+        interval = fscore().interval
+        if flowlet.span > interval:
+            # a flowlet whose bytes are spread over several intervals
+            # occupies the link with one interval's worth at a time, for
+            # every interval it spans: the share stays in the backlog
+            # until it would have drained after the last interval
+            size = size * interval / flowlet.span
+            hold = flowlet.span - interval
+        wait = self.delay + size / self.capacity
 
         if self.doqdelay:
             queuedelay = max(0, (self.backlog - self.bdp) / self.capacity)
             wait += queuedelay
-            self.backlog += flowlet.size 
+            self.backlog += size 
             if queuedelay > self.queuealarm and fscore().now - self.lastalarm > self.alarminterval:
                 self.lastalarm = fscore().now
                 self.logger.warn("Excessive backlog on link {}-{}({:3.2f} sec ({} bytes))".format(self.ingress_name, self.egress_name, queuedelay, self.backlog))
-            fscore().after(wait, "link-decrbacklog-{}".format(self.egress_node.name), self.decrbacklog, flowlet.size)
+            fscore().after(wait + hold, "link-decrbacklog-{}".format(self.egress_node.name), self.decrbacklog, size)
 
         fscore().after(wait, "link-flowarrival-{}".format(self.egress_name, self.egress_ip), self.egress_node.flowlet_arrival, flowlet, prevnode, destnode, self.egress_ip)
 
@@ -8,33 +8,68 @@ import logging
 from random import random
 import copy
 from fslib.flowlet import *
-from collections import Counter, defaultdict, namedtuple
+from collections import defaultdict, namedtuple
+from heapq import heappush, heappop, heapify
 import copy
 import networkx
 from pytricia import PyTricia
 import time
 from fslib.common import *
 from fslib.link import NullLink
-from socket import IPPROTO_TCP
+from fslib.fib import RouterFib
+from fslib.util import evalspec
+from fslib.sampling import PacketSampler
+from fslib.sketch import CountMinSketch, SpaceSaving, HyperLogLog
+import fslib.counters as fscounters
+from fslib.flowstore import FlowRecordStore
+from fslib.aggregation import FlowAggregator
+from socket import IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP
 
 
 class MeasurementConfig(object):
-    __slots__ = ['__counterexport','__exporttype','__exportinterval','__exportfile','__pktsampling','__flowsampling','__maintenance_cycle','__longflowtmo','__flowinactivetmo']
+    __slots__ = ['__counterexport','__counterexportformat','__exporttype','__exportinterval','__exportfile','__pktsampling','__pktsamplingmode','__flowsampling','__maintenance_cycle','__longflowtmo','__flowinactivetmo','__flowcachesize','__flowcachepolicy','__flowcachehighwater','__aggressivetmo','__measurementtype','__sketchinterval','__sketchwidth','__sketchdepth','__heavyhitters','__hllbits','__measureingress','__measureegress','__measureclasses','__flowaggregation','__aggregationinterval','__counters']
+    FLOWCACHE_POLICIES = ('lru','oldest','aggressive')
+    MEASUREMENT_TYPES = ('flow','sketch')
+    COUNTER_FORMATS = ('text','binary')
+    TRAFFIC_CLASSES = ('tcp','udp','icmp','ack')
+
     def __init__(self, **kwargs):
-        self.__counterexport = bool(eval(str(kwargs.get('counterexport','False'))))
+        self.__counterexport = bool(evalspec(str(kwargs.get('counterexport','False'))))
+        self.__counterexportformat = kwargs.get('counterexportformat','text')
         self.__exporttype = kwargs.get('flowexport','null')
         self.__exportinterval = int(kwargs.get('counterexportinterval',1))
         self.__exportfile = kwargs.get('counterexportfile',None)
         self.__pktsampling = float(kwargs.get('pktsampling',1.0))
+        self.__pktsamplingmode = kwargs.get('pktsamplingmode','random')
         self.__flowsampling = float(kwargs.get('flowsampling',1.0))
         self.__maintenance_cycle = float(kwargs.get('maintenance_cycle',60.0))
         self.__longflowtmo = int(kwargs.get('longflowtmo',-1))
         self.__flowinactivetmo = int(kwargs.get('flowinactivetmo',-1))
+        self.__flowcachesize = int(kwargs.get('flowcachesize',-1))
+        self.__flowcachepolicy = kwargs.get('flowcachepolicy','lru')
+        self.__flowcachehighwater = float(kwargs.get('flowcachehighwater',0.9))
+        self.__aggressivetmo = float(kwargs.get('aggressivetmo',1.0))
+        self.__measurementtype = kwargs.get('measurementtype','flow')
+        self.__sketchinterval = float(kwargs.get('sketchinterval',60.0))
+        self.__sketchwidth = int(kwargs.get('sketchwidth',2048))
+        self.__sketchdepth = int(kwargs.get('sketchdepth',4))
+        self.__heavyhitters = int(kwargs.get('heavyhitters',32))
+        self.__hllbits = int(kwargs.get('hllbits',10))
+        self.__measureingress = kwargs.get('measureingress','all')
+        self.__measureegress = kwargs.get('measureegress','none')
+        self.__measureclasses = kwargs.get('measureclasses','all')
+        self.__flowaggregation = kwargs.get('flowaggregation','none')
+        self.__aggregationinterval = float(kwargs.get('aggregationinterval',60.0))
+        self.__counters = None
 
     @property 
     def counterexport(self):
         return self.__counterexport
 
+    @property
+    def counterexportformat(self):
+        return self.__counterexportformat
+
     @property
     def exporttype(self):
         return self.__exporttype
@@ -58,6 +93,10 @@ class MeasurementConfig(object):
     def pktsampling(self):
         return self.__pktsampling
 
+    @property
+    def pktsamplingmode(self):
+        return self.__pktsamplingmode
+
     @property 
     def flowsampling(self):
         return self.__flowsampling
@@ -74,6 +113,94 @@ class MeasurementConfig(object):
     def flowinactivetmo(self):
         return self.__flowinactivetmo
 
+    @property
+    def flowcachesize(self):
+        return self.__flowcachesize
+
+    @property
+    def flowcachepolicy(self):
+        return self.__flowcachepolicy
+
+    @property
+    def flowcachehighwater(self):
+        return self.__flowcachehighwater
+
+    @property
+    def aggressivetmo(self):
+        return self.__aggressivetmo
+
+    @property
+    def measurementtype(self):
+        return self.__measurementtype
+
+    def measurementclass(self):
+        '''Return the class used to instantiate measurement objects at
+        each measurement node: exact flow records or sketches.'''
+        if self.measurementtype == 'sketch':
+            return SketchMeasurement
+        return NodeMeasurement
+
+    @property
+    def sketchinterval(self):
+        return self.__sketchinterval
+
+    @property
+    def sketchwidth(self):
+        return self.__sketchwidth
+
+    @property
+    def sketchdepth(self):
+        return self.__sketchdepth
+
+    @property
+    def heavyhitters(self):
+        return self.__heavyhitters
+
+    @property
+    def hllbits(self):
+        return self.__hllbits
+
+    @property
+    def measureingress(self):
+        return self.__measureingress
+
+    @property
+    def measureegress(self):
+        return self.__measureegress
+
+    @property
+    def measureclasses(self):
+        return self.__measureclasses
+
+    @property
+    def flowaggregation(self):
+        return self.__flowaggregation
+
+    @property
+    def aggregationinterval(self):
+        return self.__aggregationinterval
+
+    @property
+    def counters(self):
+        '''The interface counters shared by all nodes measured under this
+        configuration (created on first use).'''
+        if self.__counters is None:
+            self.__counters = fscounters.InterfaceCounters(self)
+        return self.__counters
+
+    @staticmethod
+    def selection(spec):
+        '''Parse a measureingress, measureegress or measureclasses value:
+        'all' gives None (no restriction), 'none' an empty list, and
+        otherwise a list of neighbor or traffic class names (separated by
+        spaces or commas).'''
+        spec = str(spec).replace(',', ' ').split()
+        if spec == ['all']:
+            return None
+        if spec == ['none']:
+            return []
+        return spec
+
     def __str__(self):
         return 'MeasurementConfig <{}, {}, {}>'.format(str(self.exporttype), str(self.counterexport), self.exportfile)
 
@@ -89,19 +216,63 @@ class NullMeasurement(object):
         pass
 
 
+class TrafficClassFilter(object):
+    '''Passes flowlets of selected traffic classes (IP protocols, plus
+    'ack' for the reverse flows made by autoack) on to a measurement
+    object.'''
+    __slots__ = ['measurement','protos','acks']
+    PROTOCOLS = {'tcp':IPPROTO_TCP, 'udp':IPPROTO_UDP, 'icmp':IPPROTO_ICMP}
+
+    def __init__(self, measurement, classes):
+        self.measurement = measurement
+        self.acks = 'ack' in classes
+        self.protos = frozenset(TrafficClassFilter.PROTOCOLS[c] for c in classes if c != 'ack')
+
+    def selected(self, flowlet):
+        if flowlet.ackflow:
+            return self.acks
+        return flowlet.ipproto in self.protos
+
+    def add(self, flowlet, prevnode, inport):
+        if self.selected(flowlet):
+            self.measurement.add(flowlet, prevnode, inport)
+
+    def remove(self, flowlet, prevnode):
+        if self.selected(flowlet):
+            self.measurement.remove(flowlet, prevnode)
+
+
 class NodeMeasurement(NullMeasurement):
-    BYTECOUNT = 0
-    PKTCOUNT = 1
-    FLOWCOUNT = 2
-    __slots__ = ['config','counters','flow_table','node_name','exporter','counters','counter_exportfh']
+    BYTECOUNT = fscounters.BYTECOUNT
+    PKTCOUNT = fscounters.PKTCOUNT
+    FLOWCOUNT = fscounters.FLOWCOUNT
+    __slots__ = ['config','counters','counter_rows','flow_table','node_name','exporter','expiry_index','aggressive_index','evictions','pktsampler']
 
     def __init__(self, measurement_config, node_name):
         self.config = measurement_config
         self.node_name = node_name
-        self.flow_table = {}
-        self.counters = defaultdict(Counter)
-        self.counter_exportfh = None
+        # a bounded flow cache is kept in eviction order: insertion order
+        # for oldest-first, and access order for LRU
+        self.flow_table = FlowRecordStore(ordered=self.config.flowcachesize > 0)
+        # heaps of (deadline, serial, row) ordered by the earliest time
+        # at which a cached flow can hit one of the export timeouts, or
+        # the (shorter) aggressive inactive timeout
+        self.expiry_index = []
+        self.aggressive_index = []
+        self.evictions = 0
+        # interface counters for all nodes live in one table, owned by
+        # their measurement config; counter_rows caches this node's
+        # offset into it per neighbor
+        self.counters = self.config.counters
+        self.counter_rows = {}
         self.exporter = self.config.exportclass()(node_name)
+        self.pktsampler = None
+        if self.config.pktsampling < 1.0:
+            self.pktsampler = PacketSampler(self.config.pktsampling, self.config.pktsamplingmode)
+            self.exporter.samplingrate = self.pktsampler.rate
+        aggregation = MeasurementConfig.selection(self.config.flowaggregation)
+        if aggregation:
+            self.exporter = FlowAggregator(self.exporter, aggregation, self.config.aggregationinterval)
 
     def start(self):
         '''
@@ -111,101 +282,250 @@ class NodeMeasurement(NullMeasurement):
         '''
         fscore().after(random()*self.config.maintenance_cycle, 'node-flowexport-'+str(self.node_name), self.flow_export)
 
-        if self.config.counterexport and self.config.exportinterval > 0:
-            if self.config.exportfile == 'stdout':
-                self.counter_exportfh = sys.stdout
-            else:
-                self.counter_exportfh = open('{}_{}.txt'.format(self.node_name, self.config.exportfile), 'w')
-            fscore().after(0, 'router-snmpexport-'+str(self.node_name), self.counter_export)
-
-    def counter_export(self):
-        if not self.config.counterexport:
-            return
+        if self.config.counterexport:
+            self.counters.start()
 
-        for k,v in self.counters.iteritems():
-            print >>self.counter_exportfh, '%8.3f %s->%s %d bytes %d pkts %d flows' % (fscore().now, k, self.node_name, v[self.BYTECOUNT], v[self.PKTCOUNT], v[self.FLOWCOUNT])
-        self.counters = defaultdict(Counter)
-        fscore().after(self.config.exportinterval, 'node-snmpexport-'+str(self.node_name), self.counter_export)
+    def __expiry(self, row):
+        '''
+        Return the simulation time at which a cached flow expires due to
+        the inactive or long-flow timeouts, or None if it never does.
+        '''
+        flowend = self.flow_table.end[row]
+        if flowend <= 0:
+            return None
+        config = self.config
+        deadline = None
+        if config.flowinactivetmo > 0:
+            deadline = flowend + config.flowinactivetmo
+        if config.longflowtmo > 0:
+            longdeadline = self.flow_table.start[row] + config.longflowtmo
+            if deadline is None or longdeadline < deadline:
+                deadline = longdeadline
+        return deadline
+
+    def __aggressive_expiry(self, row):
+        '''Deadline for a cached flow under the aggressive inactive
+        timeout used when the cache is above its high watermark.'''
+        flowend = self.flow_table.end[row]
+        if flowend <= 0:
+            return None
+        return flowend + self.config.aggressivetmo
+
+    def __push(self, heap, deadline, row):
+        flow_table = self.flow_table
+        heappush(heap, (deadline, flow_table.serials[row], row))
+        # entries for flows that have left the cache are normally dropped
+        # when they reach the head of the heap; compact the heap if they
+        # pile up so it stays proportional to the cache size
+        if len(heap) > 2 * len(flow_table) + 1024:
+            heap[:] = [ entry for entry in heap if flow_table.valid(entry[2], entry[1]) ]
+            heapify(heap)
+
+    def __index_expiry(self, row):
+        deadline = self.__expiry(row)
+        if deadline is not None:
+            self.__push(self.expiry_index, deadline, row)
+        if self.config.flowcachesize > 0 and self.config.flowcachepolicy == 'aggressive':
+            deadline = self.__aggressive_expiry(row)
+            if deadline is not None:
+                self.__push(self.aggressive_index, deadline, row)
+
+    def __export(self, row):
+        '''Export a cached flow and remove it from the cache.'''
+        flow_table = self.flow_table
+        if flow_table.end[row] < 0:
+            flow_table.end[row] = fscore().now
+        self.exporter.exportflow(fscore().now, flow_table.flowlet(row))
+        flow_table.delete(row)
+
+    def __expire(self, heap, deadlinefn, now):
+        '''
+        Export and remove all flows in heap whose deadline (as computed
+        by deadlinefn) has passed; returns the number of flows expired.
+        Heap entries are validated lazily: entries for flows that have
+        since been removed (or replaced by a new cache entry for the same
+        key) are dropped, and flows whose deadline has moved are pushed
+        back with the new one.
+        '''
+        flow_table = self.flow_table
+        expired = 0
+        while heap and heap[0][0] <= now:
+            deadline,serial,row = heappop(heap)
+            if not flow_table.valid(row, serial):
+                continue
+            deadline = deadlinefn(row)
+            if deadline is None:
+                continue
+            if deadline > now:
+                self.__push(heap, deadline, row)
+                continue
+            self.__export(row)
+            expired += 1
+        return expired
+
+    def __make_room(self):
+        '''
+        Make room for one new entry in a bounded flow cache.  With the
+        aggressive policy, crossing the high watermark first expires all
+        flows past the aggressive inactive timeout; if the cache is still
+        full, flows are evicted (and exported) in LRU, oldest-first or
+        earliest-aggressive-deadline order.
+        '''
+        config = self.config
+        flow_table = self.flow_table
+        if config.flowcachepolicy == 'aggressive':
+            if len(flow_table) >= config.flowcachehighwater * config.flowcachesize:
+                self.evictions += self.__expire(self.aggressive_index, self.__aggressive_expiry, fscore().now)
+            heap = self.aggressive_index
+            while len(flow_table) >= config.flowcachesize and heap:
+                deadline,serial,row = heappop(heap)
+                if flow_table.valid(row, serial):
+                    self.__export(row)
+                    self.evictions += 1
+
+        while len(flow_table) >= config.flowcachesize:
+            self.__export(flow_table.first())
+            self.evictions += 1
 
     def flow_export(self):
-        config = self.config
-        killlist = []
-        for k,v in self.flow_table.iteritems():
-            # if flow has been inactive for inactivetmo seconds, or
-            # flow has been active longer than longflowtmo seconds, expire it
-            if config.flowinactivetmo > 0 and ((fscore().now - v.flowend) >= config.flowinactivetmo) and v.flowend > 0:
-                self.exporter.exportflow(fscore().now, v)
-                killlist.append(k)
-
-            if config.longflowtmo > 0 and ((fscore().now - v.flowstart) >= config.longflowtmo) and v.flowend > 0:
-                self.exporter.exportflow(fscore().now, v)
-                killlist.append(k)
-
-        for k in killlist:
-            if k in self.flow_table:
-                del self.flow_table[k]
+        '''
+        Export and remove flows that have been inactive for flowinactivetmo
+        seconds or active for longer than longflowtmo seconds.  Only the
+        head of the expiry index is examined, so the cost of a pass
+        depends on the number of expiring flows, not the cache size.
+        '''
+        self.__expire(self.expiry_index, self.__expiry, fscore().now)
 
         # reschedule next router maintenance
         fscore().after(self.config.maintenance_cycle, 'node-flowexport-'+str(self.node_name), self.flow_export)
 
     def stop(self):
-        killlist = []
-        for k,v in self.flow_table.iteritems():
-            if v.flowend < 0:
-                v.flowend = fscore().now
-            self.exporter.exportflow(fscore().now, v)
-            killlist.append(k)
-
-        for k in killlist:
-            del self.flow_table[k]
+        flow_table = self.flow_table
+        for row in [ flow_table.row(k) for k in flow_table ]:
+            self.__export(row)
+        self.expiry_index = []
+        self.aggressive_index = []
+        if self.evictions:
+            get_logger(self.node_name).info("{} flows evicted from full flow cache".format(self.evictions))
         self.exporter.shutdown()
-        if self.counter_exportfh and self.config.exportfile != 'stdout':
-            self.counter_exportfh.close() 
+        if self.config.counterexport:
+            self.counters.stop()
 
     def __nosample(self):
         if self.config.flowsampling < 1.0:
             return random() > self.config.flowsampling
 
-    def __addflow(self, flowlet, prevnode, inport):
-        newflow = 0
-        flet = None
-        if flowlet.key in self.flow_table:
-            flet = self.flow_table[flowlet.key]
+    def __addflow(self, flowlet, prevnode, inport, pkts, nbytes):
+        flow_table = self.flow_table
+        row = flow_table.row(flowlet.key)
+        if row is not None:
             # flet.flowend = fscore().now ### FIXME!!!
-            flet += flowlet
-        else:
-            # NB: shallow copy of flowlet; will share same reference to
-            # five tuple across the entire simulation
-            newflow = 1
-            flet = copy.copy(flowlet) 
-            flet.flowend += fscore().now 
-            flet.flowstart = fscore().now
-            self.flow_table[flet.key] = flet
-            flet.ingress_intf = "{}:{}".format(prevnode,inport)
-        return newflow
+            flow_table.update(row, flowlet, pkts, nbytes)
+            if self.config.flowcachesize > 0 and self.config.flowcachepolicy == 'lru':
+                # move to the most-recently-used end
+                flow_table.touch(flowlet.key)
+            return 0
+
+        now = fscore().now
+        if self.config.flowcachesize > 0:
+            self.__make_room()
+        # NB: the record shares the flowlet's five tuple object, which is
+        # the same reference across the entire simulation
+        row = flow_table.insert(flowlet, now, flowlet.flowend + now, pkts, nbytes, "{}:{}".format(prevnode,inport))
+        self.__index_expiry(row)
+        return 1
 
     def __addcounters(self, flowlet, prevnode, newflow):
-        counters = self.counters[prevnode]
-        counters[self.BYTECOUNT] += flowlet.bytes
-        counters[self.PKTCOUNT] += flowlet.pkts
-        counters[self.FLOWCOUNT] += newflow
+        base = self.counter_rows.get(prevnode, None)
+        if base is None:
+            base = self.counter_rows[prevnode] = self.counters.row(self.node_name, prevnode) * fscounters.NUM_METRICS
+        counts = self.counters.counts
+        counts[base+self.BYTECOUNT] += int(flowlet.bytes)
+        counts[base+self.PKTCOUNT] += int(flowlet.pkts)
+        counts[base+self.FLOWCOUNT] += newflow
 
     def add(self, flowlet, prevnode, inport):
         if self.__nosample():
             return
-        newflow = self.__addflow(flowlet, prevnode, inport)
+        # interface counters see every packet; only the flow cache is
+        # subject to packet sampling, which thins each flowlet down to
+        # its sampled packets (and proportionally fewer bytes)
+        newflow = 0
+        pkts = int(flowlet.pkts)
+        nbytes = int(flowlet.bytes)
+        if self.pktsampler and pkts > 0:
+            sampled = self.pktsampler.sample(pkts)
+            nbytes = nbytes * sampled // pkts
+            pkts = sampled
+        if pkts > 0 or not self.pktsampler:
+            newflow = self.__addflow(flowlet, prevnode, inport, pkts, nbytes)
         if self.config.counterexport:
             self.__addcounters(flowlet, prevnode, newflow)
 
     def remove(self, flowlet, prevnode):
-        if flowlet.key not in self.flow_table:
-            return
+        row = self.flow_table.row(flowlet.key)
+        if row is not None:
+            self.__export(row)
+
+class SketchMeasurement(NullMeasurement):
+    '''
+    Fixed-memory alternative to NodeMeasurement.  Instead of a record
+    per flow, each interval of sketchinterval seconds is summarized with
+    a count-min sketch of bytes per flow key, space-saving heavy hitters
+    (by bytes) and HyperLogLog counts of distinct sources and
+    destinations, written to <node>_sketch.txt.
+    '''
+    __slots__ = ['config','node_name','volumes','heavyhitters','srcs','dsts','bytes','pkts','intervalstart','outfile']
+
+    def __init__(self, measurement_config, node_name):
+        self.config = measurement_config
+        self.node_name = node_name
+        self.volumes = CountMinSketch(self.config.sketchwidth, self.config.sketchdepth)
+        self.heavyhitters = SpaceSaving(self.config.heavyhitters)
+        self.srcs = HyperLogLog(self.config.hllbits)
+        self.dsts = HyperLogLog(self.config.hllbits)
+        self.bytes = self.pkts = 0
+        self.intervalstart = 0.0
+        self.outfile = None
+
+    def start(self):
+        self.outfile = open('{}_sketch.txt'.format(self.node_name), 'w')
+        self.intervalstart = fscore().now
+        fscore().after(self.config.sketchinterval, 'node-sketchexport-'+str(self.node_name), self.sketch_export)
+
+    def __summarize(self):
+        now = fscore().now
+        print >>self.outfile, '%8.3f %8.3f summary %d bytes %d pkts %d srcs %d dsts' % (self.intervalstart, now, self.bytes, self.pkts, self.srcs.count(), self.dsts.count())
+        for key,count,error in self.heavyhitters.top():
+            print >>self.outfile, '%8.3f %8.3f heavyhitter %s:%d->%s:%d %d %d bytes (cms %d, err %d)' % (self.intervalstart, now, key.srcip, key.sport, key.dstip, key.dport, key.ipproto, count, self.volumes.estimate(key), error)
+        self.volumes.clear()
+        self.heavyhitters.clear()
+        self.srcs.clear()
+        self.dsts.clear()
+        self.bytes = self.pkts = 0
+        self.intervalstart = now
+
+    def sketch_export(self):
+        self.__summarize()
+        fscore().after(self.config.sketchinterval, 'node-sketchexport-'+str(self.node_name), self.sketch_export)
+
+    def stop(self):
+        if self.outfile:
+            if fscore().now > self.intervalstart:
+                self.__summarize()
+            self.outfile.close()
+            self.outfile = None
+
+    def add(self, flowlet, prevnode, inport):
+        key = flowlet.key
+        nbytes = int(flowlet.bytes)
+        self.volumes.add(key, nbytes)
+        self.heavyhitters.add(key, nbytes)
+        self.srcs.add(key.srcip)
+        self.dsts.add(key.dstip)
+        self.bytes += nbytes
+        self.pkts += flowlet.pkts
 
-        stored_flowlet = self.flow_table[flowlet.key]
-        if stored_flowlet.flowend < 0:
-            stored_flowlet.flowend = fscore().now
-        del self.flow_table[flowlet.key]
-        self.exporter.exportflow(fscore().now, stored_flowlet)
 
 class ArpFailure(Exception):
     pass
@@ -217,20 +537,61 @@ class Node(object):
        the arrival of a new flowlet at the node.'''
     __metaclass__ = ABCMeta
 
-    __slots__ = ['__name','__started','node_measurements','ports','logger','node_to_port_map']
+    __slots__ = ['__name','__started','node_measurements','egress_measurements','ingress_meter','ingress_meters','egress_meter','egress_meters','ports','logger','node_to_port_map']
 
     def __init__(self, name, measurement_config, **kwargs):
         # exportfn, exportinterval, exportfile):
         self.__name = name
+        self.node_measurements = self.egress_measurements = NullMeasurement()
+        # the measurement (or traffic class filter) applied to flowlets
+        # arriving from, or leaving for, a neighbor: either one for all
+        # neighbors, or per neighbor in the *_meters dicts.  flowlets on
+        # unmeasured interfaces only cost a failed dict lookup.
+        self.ingress_meter = self.egress_meter = None
+        self.ingress_meters = {}
+        self.egress_meters = {}
         if measurement_config:
-            self.node_measurements = NodeMeasurement(measurement_config, name)
-        else:
-            self.node_measurements = NullMeasurement()
+            self.node_measurements = measurement_config.measurementclass()(measurement_config, name)
+            self.__configure_meters(measurement_config, kwargs)
         self.ports = {}
         self.node_to_port_map = defaultdict(list)
         self.logger = get_logger(self.name)
         self.__started = False
 
+    def __configure_meters(self, measurement_config, kwargs):
+        '''
+        Select the interfaces (by neighbor name), directions and traffic
+        classes to measure, from the node's measureingress, measureegress
+        and measureclasses attributes or else the graph-wide ones.  The
+        neighbor name for locally generated traffic is the generator
+        name (e.g., harpoon), and for autoack reverse flows it's the node
+        itself.  Egress flows are measured separately, with records
+        written as node <name>_egress.
+        '''
+        select = MeasurementConfig.selection
+        classes = select(kwargs.get('measureclasses', measurement_config.measureclasses))
+        ingress = select(kwargs.get('measureingress', measurement_config.measureingress))
+        egress = select(kwargs.get('measureegress', measurement_config.measureegress))
+
+        meter = self.node_measurements
+        if classes is not None:
+            meter = TrafficClassFilter(meter, classes)
+        if ingress is None:
+            self.ingress_meter = meter
+        else:
+            self.ingress_meters = dict( (n,meter) for n in ingress )
+
+        if egress == []:
+            return
+        self.egress_measurements = measurement_config.measurementclass()(measurement_config, '{}_egress'.format(self.name))
+        meter = self.egress_measurements
+        if classes is not None:
+            meter = TrafficClassFilter(meter, classes)
+        if egress is None:
+            self.egress_meter = meter
+        else:
+            self.egress_meters = dict( (n,meter) for n in egress )
+
     @property
     def started(self):
         return self.__started
@@ -251,19 +612,36 @@ class Node(object):
     def start(self):
         self.__started = True
         self.node_measurements.start()
+        self.egress_measurements.start()
 
     def stop(self):
         self.node_measurements.stop()
+        self.egress_measurements.stop()
 
     @abstractmethod
     def flowlet_arrival(self, flowlet, prevnode, destnode, input_ident=None):
         pass
 
     def measure_flow(self, flowlet, prevnode, inport):
-        self.node_measurements.add(flowlet, prevnode, inport)
+        meter = self.ingress_meter or self.ingress_meters.get(prevnode)
+        if meter:
+            meter.add(flowlet, prevnode, inport)
 
     def unmeasure_flow(self, flowlet, prevnode):
-        self.node_measurements.remove(flowlet, prevnode)
+        meter = self.ingress_meter or self.ingress_meters.get(prevnode)
+        if meter:
+            meter.remove(flowlet, prevnode)
+
+    def measure_egress_flow(self, flowlet, nextnode, outport):
+        meter = self.egress_meter or self.egress_meters.get(nextnode)
+        if not meter:
+            return
+        if isinstance(flowlet, SubtractiveFlowlet):
+            meter.remove(flowlet, nextnode)
+            return
+        meter.add(flowlet, nextnode, outport)
+        if flowlet.endofflow:
+            meter.remove(flowlet, nextnode)
 
     def add_link(self, link, localip, remoteip, next_node):
         '''Add a new interface and link to this node.  link is the link object connecting
@@ -282,8 +660,8 @@ class Router(Node):
 
     def __init__(self, name, measurement_config, **kwargs): 
         Node.__init__(self, name, measurement_config, **kwargs)
-        self.autoack=bool(eval(str(kwargs.get('autoack','False'))))
-        self.forwarding_table = PyTricia(32)
+        self.autoack=bool(evalspec(str(kwargs.get('autoack','False'))))
+        self.forwarding_table = RouterFib()
         self.default_link = None
 
         from fslib.configurator import FsConfigurator
@@ -300,33 +678,28 @@ class Router(Node):
             raise ForwardingFailure("Error setting default next hop: there's no static ARP entry to get interface")
         self.logger.debug("Setting default next hop for {} to {}".format(self.name, nexthop))
 
+    def setForwardingTable(self, fib):
+        '''Replace the forwarding table wholesale with a (typically shared)
+           RouterFib built in bulk by the topology.'''
+        self.forwarding_table = fib
+
     def addForwardingEntry(self, prefix, nexthop):
         '''Add new forwarding table entry to Node, given a destination prefix
            and a nexthop (node name)'''
-        pstr = str(prefix)
-        self.logger.debug("Adding forwarding table entry: {}->{}".format(pstr, nexthop))
-        xnode = self.forwarding_table.get(pstr, None)
-        if not xnode:
-            xnode = []
-            self.forwarding_table[pstr] = xnode
-        xnode.append(nexthop)
+        self.logger.debug("Adding forwarding table entry: {}->{}".format(prefix, nexthop))
+        self.forwarding_table.add(prefix, nexthop)
 
     def removeForwardingEntry(self, prefix, nexthop):
         '''Remove an entry from the Node forwarding table.'''
-        pstr = str(prefix)
-        if not self.forwarding_table.has_key(pstr):
-            return
-        xnode = self.forwarding_table.get(pstr)
-        xnode.remove(nexthop)
-        if not xnode:
-            del self.forwarding_table[pstr]
+        self.forwarding_table.remove(prefix, nexthop)
 
     def nextHop(self, destip):
-        '''Return the next hop from the local forwarding table (next node, ipaddr), based on destination IP address (or prefix)'''
-        xlist = self.forwarding_table.get(str(destip), None)
+        '''Return the next hop from the local forwarding table (next node, ipaddr), based on destination IP address (or prefix),
+           or None if there's no route (e.g., while a link failure has partitioned the network)'''
+        xlist = self.forwarding_table.lookup(str(destip))
         if xlist:
             return xlist[hash(destip) % len(xlist)]
-        raise ForwardingFailure()
+        return None
 
     def flowlet_arrival(self, flowlet, prevnode, destnode, input_ip=None):
         if input_ip is None:
@@ -373,7 +746,7 @@ class Router(Node):
                 # weird, but if reverse flow is short enough, it might only
                 # stay in the flow cache for a very short period of time
                 if revflow.endofflow:
-                    self.unmeasure_flow(revflow, prevnode)
+                    self.unmeasure_flow(revflow, self.name)
 
                 destnode = fscore().topology.destnode(self.name, revflow.dstaddr)
 
@@ -392,6 +765,10 @@ class Router(Node):
 
     def forward(self, flowlet, destnode):
         nextnode = self.nextHop(flowlet.dstaddr)
+        if nextnode is None:
+            self.logger.debug("No route to {}; dropping flowlet {}".format(flowlet.dstaddr, flowlet))
+            return
         port = self.portFromNexthopNode(nextnode, flowkey=flowlet.key)
         link = port.link or self.default_link
+        self.measure_egress_flow(flowlet, nextnode, port.localip)
         link.flowlet_arrival(flowlet, self.name, destnode)   
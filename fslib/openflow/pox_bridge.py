@@ -18,7 +18,7 @@ from fslib.node import Node, PortInfo
 from fslib.link import NullLink
 from fslib.common import fscore, get_logger
 from fslib.flowlet import Flowlet, FlowIdent
-from fslib.util import default_ip_to_macaddr
+from fslib.util import default_ip_to_macaddr, evalspec
 from fslib.configurator import FsConfigurator
 
 from pytricia import PyTricia
@@ -157,10 +157,10 @@ class OpenflowSwitch(Node):
         self.pox_switch.set_connection(self)
         self.pox_switch.set_output_packet_callback(self. send_packet)
         self.controller_name = kwargs.get('controller', 'controller')
-        self.autoack = bool(eval(kwargs.get('autoack', 'False')))
+        self.autoack = bool(evalspec(kwargs.get('autoack', 'False')))
         self.controller_links = {}
         self.interface_to_port_map = {}
-        self.trace = bool(eval(kwargs.get('trace', 'False')))
+        self.trace = bool(evalspec(kwargs.get('trace', 'False')))
 
         self.ipdests = PyTricia()
         for prefix in kwargs.get('ipdests','').split():
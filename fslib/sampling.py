@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+'''
+Packet sampling for flow measurement.
+
+A measurement node sees a stream of flowlets, each carrying some number
+of packets.  Rather than flipping a coin for every packet, the sampler
+keeps track of how many packets remain until the next sampled one and
+consumes a whole flowlet at a time.  For random (probabilistic)
+sampling the gaps between sampled packets are geometric, which makes
+the number of sampled packets in a flowlet binomially distributed (i.e.,
+binomial thinning of the flowlet), and gaps are drawn in batches from
+NumPy when it is available.  Systematic 1-in-N sampling needs no random
+draws after the initial phase.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import math
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PacketSampler(object):
+    '''
+    Samples packets at a given rate, either at random ('random') or
+    every Nth packet, with N = round(1/rate) ('systematic').
+    '''
+    __slots__ = ['rate','mode','interval','nextsample','gaps','rng','batchsize','bulk']
+    MODES = ('random','systematic')
+
+    def __init__(self, rate, mode='random', batchsize=4096):
+        if not 0.0 < rate < 1.0:
+            raise ValueError("Packet sampling rate must be between 0 and 1 (got {})".format(rate))
+        if mode not in PacketSampler.MODES:
+            raise ValueError("Unknown packet sampling mode {}".format(mode))
+        self.mode = mode
+        self.batchsize = batchsize
+        self.gaps = iter(())
+        self.rng = None
+        if mode == 'systematic':
+            self.interval = max(1, int(round(1.0/rate)))
+            self.rate = 1.0 / self.interval
+            # start at a random phase so nodes don't sample in lockstep
+            self.nextsample = random.randint(1, self.interval)
+        else:
+            self.interval = 0
+            self.rate = rate
+            if numpy is not None:
+                # seeded from the random module so that runs with a
+                # fixed seed remain reproducible
+                self.rng = numpy.random.RandomState(random.getrandbits(32))
+            self.nextsample = self.__gap()
+        # flowlets expected to contain more sampled packets than this
+        # get a single binomial draw instead of walking gaps
+        self.bulk = 16.0 / self.rate
+
+    def __gap(self):
+        '''Number of packets up to and including the next sampled one.'''
+        try:
+            return next(self.gaps)
+        except StopIteration:
+            pass
+        if self.rng is not None:
+            self.gaps = iter(self.rng.geometric(self.rate, self.batchsize).tolist())
+        else:
+            logq = math.log(1.0 - self.rate)
+            r = random.random
+            self.gaps = iter([ int(math.log(1.0 - r()) / logq) + 1 for i in xrange(self.batchsize) ])
+        return next(self.gaps)
+
+    def sample(self, pkts):
+        '''Return how many of the next pkts packets are sampled.'''
+        pkts = int(pkts)
+        if pkts < self.nextsample:
+            self.nextsample -= pkts
+            return 0
+
+        pkts -= self.nextsample
+        if self.mode == 'systematic':
+            self.nextsample = self.interval - pkts % self.interval
+            return 1 + pkts // self.interval
+
+        if self.rng is not None and pkts > self.bulk:
+            # geometric gaps are memoryless, so the remainder of the
+            # flowlet can be thinned in one draw and a fresh gap started
+            sampled = 1 + int(self.rng.binomial(pkts, self.rate))
+            self.nextsample = self.__gap()
+            return sampled
+
+        sampled = 1
+        gap = self.__gap()
+        while gap <= pkts:
+            pkts -= gap
+            sampled += 1
+            gap = self.__gap()
+        self.nextsample = gap - pkts
+        return sampled
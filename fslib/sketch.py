@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+'''
+Fixed-size streaming sketches for measurement nodes that can't afford
+exact per-flow state: a count-min sketch for per-key volumes,
+space-saving for heavy hitters and HyperLogLog for distinct counts.
+Each keeps its state in preallocated arrays, so memory use depends only
+on the sketch parameters, not on the number of flows seen.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+from array import array
+from heapq import heappush, heapreplace
+import math
+
+_MASK64 = 0xffffffffffffffff
+
+
+def mix64(h):
+    '''64-bit finalizer (from MurmurHash3) applied to a Python hash value,
+    so that similar keys (e.g., consecutive addresses) spread evenly.'''
+    h &= _MASK64
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & _MASK64
+    h ^= h >> 33
+    return h
+
+
+class CountMinSketch(object):
+    '''Count-min sketch: depth rows of width counters.  Estimates never
+    undercount, and overcount by at most 2N/width with probability
+    1 - 2^-depth, where N is the total count added.'''
+    __slots__ = ['width','depth','table','total']
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = array('L', [0]) * (width * depth)
+        self.total = 0
+
+    def __cells(self, key):
+        h = mix64(hash(key))
+        h1 = h & 0xffffffff
+        h2 = (h >> 32) | 1
+        width = self.width
+        return [ row*width + (h1 + row*h2) % width for row in xrange(self.depth) ]
+
+    def add(self, key, count=1):
+        table = self.table
+        for cell in self.__cells(key):
+            table[cell] += count
+        self.total += count
+
+    def estimate(self, key):
+        table = self.table
+        return min(table[cell] for cell in self.__cells(key))
+
+    def clear(self):
+        self.table = array('L', [0]) * (self.width * self.depth)
+        self.total = 0
+
+
+class SpaceSaving(object):
+    '''
+    Space-saving heavy hitters with a fixed number of counters.  Any key
+    whose total exceeds N/capacity is guaranteed to be tracked; a key's
+    reported count overestimates its true count by at most its error.
+    The minimum counter is found through a lazily updated heap: counts
+    only grow, so stale heap entries are refreshed when they surface.
+    '''
+    __slots__ = ['capacity','keys','index','counts','errors','heap']
+
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.clear()
+
+    def add(self, key, count=1):
+        slot = self.index.get(key, None)
+        if slot is not None:
+            self.counts[slot] += count
+            return
+
+        if len(self.keys) < self.capacity:
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.counts.append(count)
+            self.errors.append(0)
+            self.index[key] = slot
+            heappush(self.heap, (count, slot))
+            return
+
+        # replace the key with the smallest count
+        heap = self.heap
+        counts = self.counts
+        while heap[0][0] != counts[heap[0][1]]:
+            heapreplace(heap, (counts[heap[0][1]], heap[0][1]))
+        mincount,slot = heap[0]
+        del self.index[self.keys[slot]]
+        self.keys[slot] = key
+        self.index[key] = slot
+        self.errors[slot] = mincount
+        counts[slot] = mincount + count
+        heapreplace(heap, (counts[slot], slot))
+
+    def top(self, n=None):
+        '''Return up to n (key, count, error) tuples, largest count first.'''
+        entries = sorted(xrange(len(self.keys)), key=lambda slot: self.counts[slot], reverse=True)
+        if n is not None:
+            entries = entries[:n]
+        return [ (self.keys[slot], self.counts[slot], self.errors[slot]) for slot in entries ]
+
+    def clear(self):
+        self.keys = []
+        self.index = {}
+        self.counts = array('L')
+        self.errors = array('L')
+        self.heap = []
+
+
+class HyperLogLog(object):
+    '''HyperLogLog distinct counter with 2^bits one-byte registers
+    (standard error about 1.04/sqrt(2^bits)).'''
+    __slots__ = ['bits','registers']
+
+    def __init__(self, bits=10):
+        if not 7 <= bits <= 16:
+            raise ValueError("HyperLogLog bits must be between 7 and 16")
+        self.bits = bits
+        self.registers = array('B', [0]) * (1 << bits)
+
+    def add(self, item):
+        h = mix64(hash(item))
+        rest = 64 - self.bits
+        slot = h >> rest
+        rank = rest - (h & ((1 << rest) - 1)).bit_length() + 1
+        if rank > self.registers[slot]:
+            self.registers[slot] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        estimate = alpha * m * m / sum(math.ldexp(1.0, -r) for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+    def clear(self):
+        self.registers = array('B', [0]) * (1 << self.bits)
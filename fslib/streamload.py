@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+'''
+Streaming readers for large JSON and GML scenario files.
+
+json.load() and networkx's read_gml() both materialize the entire
+document (the raw text plus a decoded dict/parse tree) before a graph
+is built from it, so peak memory at startup is several times the size
+of the topology.  The readers here pull node and link records out of
+the file one at a time and add them straight to the graph, so only the
+graph itself (which routing needs anyway) is ever held in full.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import re
+import json
+import codecs
+import networkx as nx
+
+
+class StreamParseError(Exception):
+    pass
+
+
+class _JsonStream(object):
+    '''Minimal incremental reader over a file containing a JSON document.'''
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, infile, bufsize=1<<16):
+        self.infile = infile
+        self.bufsize = bufsize
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def __fill(self):
+        if self.eof:
+            return False
+        data = self.infile.read(self.bufsize)
+        if not data:
+            self.eof = True
+            return False
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += self.utf8.decode(data)
+        return True
+
+    def peek(self):
+        '''Return the next non-whitespace character without consuming it.'''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _JsonStream.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.__fill():
+                raise StreamParseError("Unexpected end of JSON input")
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise StreamParseError("Expected '{}' at offset {} in JSON input".format(ch, self.pos))
+        self.pos += 1
+
+    def value(self):
+        '''Decode the next complete JSON value.'''
+        self.peek()
+        while True:
+            try:
+                val,end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.__fill():
+                    raise
+                continue
+            # a number that runs to the end of the buffer may be truncated
+            if end == len(self.buf) and self.__fill():
+                continue
+            self.pos = end
+            return val
+
+    def members(self):
+        '''Iterate over the keys of a JSON object, leaving the stream
+        positioned at each key's value.'''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            ch = self.peek()
+            self.pos += 1
+            if ch == '}':
+                return
+            elif ch != ',':
+                raise StreamParseError("Expected ',' or '}}' at offset {} in JSON input".format(self.pos))
+
+    def elements(self):
+        '''Iterate over the values in a JSON array, one at a time.'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            ch = self.peek()
+            self.pos += 1
+            if ch == ']':
+                return
+            elif ch != ',':
+                raise StreamParseError("Expected ',' or ']' at offset {} in JSON input".format(self.pos))
+
+
+def _single_edges(graph):
+    '''
+    Turn a MultiGraph (or MultiDiGraph) into a Graph (or DiGraph) in
+    place, merging the attributes of parallel edges as nx.Graph(graph)
+    would, but reusing the node and edge attribute dicts rather than
+    copying the whole graph.
+    '''
+    directed = graph.is_directed()
+    pred = graph.pred if directed else graph.adj
+    done = set()
+    for u,nbrs in graph.adj.iteritems():
+        for v,keydict in nbrs.items():
+            if v in done:
+                continue
+            if len(keydict) == 1:
+                data = next(keydict.itervalues())
+            else:
+                data = {}
+                for edgedata in keydict.itervalues():
+                    data.update(edgedata)
+            nbrs[v] = data
+            pred[v][u] = data
+        if not directed:
+            done.add(u)
+    graph.__class__ = nx.DiGraph if directed else nx.Graph
+    return graph
+
+
+def _finish_graph(graph, multigraph, directed):
+    if not multigraph:
+        graph = _single_edges(graph)
+    if directed and not graph.is_directed():
+        graph = graph.to_directed()
+    return graph
+
+
+def load_json_graph(path):
+    '''
+    Build a networkx graph from a node-link format JSON file (as written
+    by networkx.readwrite.json_graph.node_link_data), reading node and
+    link records incrementally.  The result is equivalent to
+    json_graph.node_link_graph(json.load(open(path))).
+    '''
+    graph = nx.MultiGraph()
+    multigraph = True
+    directed = False
+    mapping = []
+    deferred_links = []
+
+    def add_link(d):
+        source = d.pop('source')
+        target = d.pop('target')
+        edgedata = dict((str(k),v) for k,v in d.iteritems())
+        graph.add_edge(mapping[source], mapping[target], **edgedata)
+
+    with open(path, 'rb') as infile:
+        stream = _JsonStream(infile)
+        for key in stream.members():
+            if key == 'nodes':
+                for d in stream.elements():
+                    node = d.pop('id', len(mapping))
+                    mapping.append(node)
+                    graph.add_node(node, **dict((str(k),v) for k,v in d.iteritems()))
+                # node-link files don't have to list nodes before links
+                for d in deferred_links:
+                    add_link(d)
+                deferred_links = []
+            elif key == 'links':
+                for d in stream.elements():
+                    if mapping:
+                        add_link(d)
+                    else:
+                        deferred_links.append(d)
+            elif key == 'graph':
+                graph.graph = dict(stream.value())
+            elif key == 'multigraph':
+                multigraph = stream.value()
+            elif key == 'directed':
+                directed = stream.value()
+                if directed and not mapping and not deferred_links:
+                    # nothing read yet, so start out directed rather
+                    # than converting at the end
+                    graph = nx.MultiDiGraph(graph)
+            else:
+                stream.value()
+
+    return _finish_graph(graph, multigraph, directed)
+
+
+_GML_TOKEN = re.compile(r'\s*(?:(\[)|(\])|"([^"]*)"|([^\s\[\]"]+))')
+_GML_REAL = re.compile(r'^[+-]?\d+\.\d*([eE][+-]?\d+)?$')
+_GML_INT = re.compile(r'^[+-]?\d+$')
+
+
+def _gml_tokens(infile):
+    started = False
+    for line in infile:
+        line = line.decode('utf-8')
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        # Creator and Version lines may only come before 'graph ['
+        if not started and (stripped.startswith('Creator') or stripped.startswith('Version')):
+            continue
+        started = True
+        pos = 0
+        while pos < len(line):
+            mobj = _GML_TOKEN.match(line, pos)
+            if not mobj:
+                break
+            pos = mobj.end()
+            lbrack,rbrack,quoted,word = mobj.groups()
+            if lbrack:
+                yield '[', None
+            elif rbrack:
+                yield ']', None
+            elif quoted is not None:
+                yield 'atom', quoted
+            elif word.startswith('#'):
+                break
+            elif _GML_REAL.match(word):
+                yield 'atom', float(word)
+            elif _GML_INT.match(word):
+                yield 'atom', int(word)
+            else:
+                yield 'atom', word
+
+
+def _gml_list(tokens):
+    '''Parse key/value pairs up to a closing bracket into a dict.'''
+    result = {}
+    for kind,key in tokens:
+        if kind == ']':
+            return result
+        result[str(key)] = _gml_value(tokens)
+    raise StreamParseError("Unexpected end of GML input")
+
+
+def _gml_value(tokens):
+    kind,val = next(tokens)
+    if kind == '[':
+        return _gml_list(tokens)
+    elif kind == 'atom':
+        return val
+    raise StreamParseError("Unexpected ']' in GML input")
+
+
+def load_gml_graph(path):
+    '''
+    Build a networkx graph from a GML file, adding each node and edge as
+    soon as it has been read.  The result is equivalent to
+    networkx.read_gml(path).
+    '''
+    graph = nx.MultiGraph()
+    multigraph = False
+    with open(path, 'rb') as infile:
+        tokens = _gml_tokens(infile)
+        kind,val = next(tokens, (None,None))
+        if val != 'graph' or next(tokens, (None,None))[0] != '[':
+            raise StreamParseError("GML input must begin with 'graph ['")
+
+        for kind,key in tokens:
+            if kind == ']':
+                break
+            if key == 'node':
+                vdict = _gml_value(tokens)
+                graph.add_node(vdict['id'], attr_dict=vdict)
+            elif key == 'edge':
+                vdict = _gml_value(tokens)
+                source = vdict.pop('source')
+                target = vdict.pop('target')
+                if graph.has_edge(source, target):
+                    multigraph = True
+                graph.add_edge(source, target, attr_dict=vdict)
+            elif key == 'directed':
+                val = _gml_value(tokens)
+                graph.graph[key] = val
+                if val == 1 and not graph.is_directed():
+                    graph = nx.MultiDiGraph(graph)
+            else:
+                graph.graph[str(key)] = _gml_value(tokens)
+
+    return _finish_graph(graph, multigraph, False)
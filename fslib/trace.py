@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+'''
+Binary flow traces, for replaying recorded traffic (see
+traffic_generators/replay.py).
+
+A trace is a header followed by fixed-width flow records sorted by
+flow start time:
+
+  header  magic 'FSTR', version (1 byte, plus 3 pad bytes)
+  record  start, end (double), srcip, dstip (4 bytes each, network
+          order), sport, dport (uint16), ipproto, iptos, tcpflags
+          (1 byte each, plus one pad byte), pkts, bytes (uint64)
+
+Since records are fixed-width and sorted, a TraceReader can memory-map
+a trace of any size, find the first record at or after a given time by
+binary search, and read records one at a time without loading the
+trace into memory.
+
+A trace may have a sparse time index alongside it (<trace>.idx): a
+header (magic 'FSTI', version, stride) followed by the start times
+(doubles) of every stride'th record.  The index is small enough to keep
+in memory, so a seek only has to search within one stride of the
+mapped trace rather than touch pages all over it.
+
+convert() builds an indexed trace from fs text (TextExporter) or
+cflowd (CflowdExporter) flow exports, parsing chunks of the input in a
+pool of processes and merging the sorted runs they produce.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import os
+import re
+import mmap
+import heapq
+import socket
+import struct
+import tempfile
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from itertools import imap
+from fslib.trafficmatrix import read_chunks
+from flowexport.cflow import cflow
+
+TRACE_MAGIC = 'FSTR'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<4sB3x')
+TRACE_RECORD = struct.Struct('<dd4s4sHHBBBxQQ')
+INDEX_MAGIC = 'FSTI'
+INDEX_HEADER = struct.Struct('<4sB3xI')
+INDEX_STRIDE = 1024
+
+_START = struct.Struct('<d')
+_ADDR = struct.Struct('!I')
+_CFLOWD_RECORD = struct.Struct(cflow.struct_template)
+
+# fields: start, end, src, sport, dst, dport, protocol, tos, pkts,
+# bytes, tcp flags
+TEXT_RECORD = re.compile(r'^textexport \S+ \S+ (\S+) (\S+) ([\d.]+)(?:/\d+)?:(\d+)->([\d.]+)(?:/\d+)?:(\d+) (\S+) (\S+) \S+ (\d+) (\d+) ?(\S*)', re.M)
+PROTOCOLS = {'tcp':6, 'udp':17, 'icmp':1, 'ip':0}
+TCPFLAGS = dict( (flag,1<<i) for i,flag in enumerate('FSRPAUEC') )
+
+
+class InvalidTrace(Exception):
+    pass
+
+
+def index_name(name):
+    return name + '.idx'
+
+
+def read_index(name, count):
+    '''Return (stride, start times) from the index of trace name, or (0,
+    None) if it has no index or the index doesn't match the count
+    records in the trace.'''
+    try:
+        infile = open(index_name(name), 'rb')
+    except IOError:
+        return 0, None
+    with infile:
+        header = infile.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size:
+            return 0, None
+        magic,version,stride = INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or version != TRACE_VERSION or not stride:
+            return 0, None
+        index = array('d')
+        index.fromstring(infile.read())
+    if len(index) != (count + stride - 1) // stride:
+        return 0, None
+    return stride, index
+
+
+class TraceWriter(object):
+    '''Buffered writer for binary trace records, which must be written
+    in order of start time.'''
+    __slots__ = ['outname','outfile','buffer','bufsize','records','last','stride','index']
+
+    def __init__(self, outname, bufsize=4096, stride=INDEX_STRIDE):
+        self.outname = outname
+        self.outfile = open(outname, 'wb')
+        self.outfile.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+        self.buffer = []
+        self.bufsize = bufsize
+        self.records = 0
+        self.last = float('-inf')
+        # stride=0 writes no index
+        self.stride = stride
+        self.index = array('d')
+
+    def write(self, start, end, srcip, dstip, sport, dport, ipproto, iptos, tcpflags, pkts, nbytes):
+        '''Write one flow record; addresses are 4-byte packed strings.'''
+        self.write_packed(start, TRACE_RECORD.pack(start, end, srcip, dstip, sport, dport, ipproto, iptos, tcpflags, pkts, nbytes))
+
+    def write_packed(self, start, record):
+        '''Write one record already packed with TRACE_RECORD.'''
+        if start < self.last:
+            raise InvalidTrace("Trace records must be written in order of start time ({} after {})".format(start, self.last))
+        self.last = start
+        if self.stride and self.records % self.stride == 0:
+            self.index.append(start)
+        self.buffer.append(record)
+        self.records += 1
+        if len(self.buffer) >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write(''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+        if self.stride:
+            with open(index_name(self.outname), 'wb') as outfile:
+                outfile.write(INDEX_HEADER.pack(INDEX_MAGIC, TRACE_VERSION, self.stride))
+                self.index.tofile(outfile)
+
+
+class TraceReader(object):
+    '''
+    Memory-mapped, read-only view of a binary trace.  Records are
+    numbered from 0 in start time order; record(i) unpacks one as a
+    tuple (start, end, srcip, dstip, sport, dport, ipproto, iptos,
+    tcpflags, pkts, bytes), with addresses as 4-byte packed strings.
+    The trace's index is used for seeks if it has one.
+    '''
+    __slots__ = ['name','infile','map','count','stride','index']
+
+    def __init__(self, name):
+        self.name = name
+        self.map = None
+        self.infile = open(name, 'rb')
+        size = os.fstat(self.infile.fileno()).st_size
+        if size < TRACE_HEADER.size:
+            self.close()
+            raise InvalidTrace("{} is not an fs trace file".format(name))
+        self.map = mmap.mmap(self.infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic,version = TRACE_HEADER.unpack_from(self.map, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            self.close()
+            raise InvalidTrace("{} is not an fs trace file".format(name))
+        self.count = (size - TRACE_HEADER.size) // TRACE_RECORD.size
+        self.stride,self.index = read_index(name, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        return TRACE_RECORD.unpack_from(self.map, TRACE_HEADER.size + i * TRACE_RECORD.size)
+
+    def start(self, i):
+        '''Start time of record i.'''
+        return struct.unpack_from('<d', self.map, TRACE_HEADER.size + i * TRACE_RECORD.size)[0]
+
+    def find(self, t, lo=0, hi=None):
+        '''Index of the first record (in [lo, hi)) starting at or after t.'''
+        if hi is None:
+            hi = self.count
+        if self.index is not None:
+            # the first sampled record at or after t bounds the search
+            # to within one stride
+            k = bisect_left(self.index, t)
+            first = (k - 1) * self.stride + 1 if k else 0
+            last = min(k * self.stride, self.count)
+            lo,hi = max(lo, min(first, hi)), min(hi, max(last, lo))
+        start = self.start
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if start(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def records(self, first=0, last=None):
+        '''Generator of records first up to (not including) last.'''
+        if last is None:
+            last = self.count
+        unpack_from = TRACE_RECORD.unpack_from
+        m = self.map
+        size = TRACE_RECORD.size
+        for offset in xrange(TRACE_HEADER.size + first * size, TRACE_HEADER.size + last * size, size):
+            yield unpack_from(m, offset)
+
+    def window(self, start, end):
+        '''Generator of records starting in [start, end).'''
+        first = self.find(start)
+        return self.records(first, self.find(end, first))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.infile.close()
+
+
+def _tcpflags(flags, cache={}):
+    value = cache.get(flags, None)
+    if value is None:
+        value = cache[flags] = sum(TCPFLAGS.get(f, 0) for f in flags)
+    return value
+
+
+def _text_run(chunk):
+    '''Sorted list of (start, packed record) from a chunk of text flow
+    export lines.'''
+    pack = TRACE_RECORD.pack
+    aton = socket.inet_aton
+    run = []
+    for start,end,src,sport,dst,dport,proto,tos,pkts,nbytes,flags in TEXT_RECORD.findall(chunk):
+        start = float(start)
+        run.append((start, pack(start, float(end), aton(src), aton(dst), int(sport), int(dport), PROTOCOLS.get(proto, 0), int(tos, 16), _tcpflags(flags), int(pkts), int(nbytes))))
+    run.sort()
+    return run
+
+
+def _cflowd_run(chunk):
+    '''Sorted list of (start, packed record) from a chunk of cflowd
+    records as written by CflowdExporter (all fields present).'''
+    pack = TRACE_RECORD.pack
+    addr = _ADDR.pack
+    unpack_from = _CFLOWD_RECORD.unpack_from
+    run = []
+    for offset in xrange(0, len(chunk) - _CFLOWD_RECORD.size + 1, _CFLOWD_RECORD.size):
+        mask,rtr,src,dst,inif,outif,sport,dport,pkts,nbytes,nexthop,start,end,proto,tos,srcas,dstas,srcmask,dstmask,flags,etype,eid = unpack_from(chunk, offset)
+        start = float(start)
+        run.append((start, pack(start, float(end), addr(src), addr(dst), sport, dport, proto, tos, flags, pkts, nbytes)))
+    run.sort()
+    return run
+
+
+def _convert_chunk(args):
+    '''Pool worker: parse one chunk of input into a sorted run of
+    packed records.'''
+    informat,chunk = args
+    run = _text_run(chunk) if informat == 'text' else _cflowd_run(chunk)
+    return ''.join(record for start,record in run)
+
+
+def _input_chunks(names, informat, chunksize):
+    for name in names:
+        fmt = informat
+        if fmt is None:
+            fmt = 'cflowd' if name.endswith('.cflowd') else 'text'
+        if fmt not in ('text','cflowd'):
+            raise InvalidTrace("Unknown flow export format {}".format(fmt))
+        with open(name, 'rb') as infile:
+            if fmt == 'text':
+                for chunk in read_chunks(infile, chunksize):
+                    yield fmt, chunk
+            else:
+                size = max(1, chunksize // _CFLOWD_RECORD.size) * _CFLOWD_RECORD.size
+                while True:
+                    chunk = infile.read(size)
+                    if not chunk:
+                        break
+                    yield fmt, chunk
+
+
+def _run_records(m, offset, length):
+    '''Generator of (start, packed record) from one sorted run in a
+    mapped spool file.'''
+    unpack_from = _START.unpack_from
+    size = TRACE_RECORD.size
+    for i in xrange(offset, offset + length, size):
+        yield unpack_from(m, i)[0], m[i:i+size]
+
+
+def convert(names, outname, informat=None, processes=None, chunksize=1<<22, stride=INDEX_STRIDE):
+    '''
+    Convert flow export files to an indexed binary trace and return
+    the number of records written.  informat is 'text' or 'cflowd'; by
+    default it's taken from each file's name (<node>.cflowd or
+    <node>_flow.txt).  Input is read in chunks of about chunksize bytes,
+    which are parsed and sorted by a pool of processes (processes=1
+    does everything in this process).  The sorted runs are spooled to
+    a temporary file and merged into the trace.
+    '''
+    chunks = _input_chunks(names, informat, chunksize)
+    pool = None
+    if processes == 1:
+        runs = imap(_convert_chunk, chunks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        runs = pool.imap(_convert_chunk, chunks)
+    spool = tempfile.TemporaryFile()
+    try:
+        extents = []
+        offset = 0
+        for run in runs:
+            if run:
+                spool.write(run)
+                extents.append((offset, len(run)))
+                offset += len(run)
+        if pool is not None:
+            pool.close()
+            pool.join()
+            pool = None
+        spool.flush()
+        writer = TraceWriter(outname, stride=stride)
+        if extents:
+            m = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for start,record in heapq.merge(*[ _run_records(m, o, n) for o,n in extents ]):
+                    writer.write_packed(start, record)
+            finally:
+                m.close()
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        spool.close()
+    return writer.records
@@ -11,9 +11,18 @@ class InvalidFlowConfiguration(Exception):
     pass
 
 class FlowEventGenModulator(object):
-    def __init__(self, gfunc, stime=0, emerge_profile=None, sustain_profile=None, withdraw_profile=None):
-        self.generators = {}
+    def __init__(self, gfunc, stime=0, emerge_profile=None, sustain_profile=None, withdraw_profile=None, superpose=False):
+        # running generators, kept in a list (with each generator's
+        # position in genindex) so that a random one can be removed in
+        # constant time by moving the last one into its place
+        self.generators = []
+        self.genindex = {}
         self.generator_generator = gfunc
+        # in superposition mode, one generator stands for all sources
+        # and only its source count changes
+        self.superpose = superpose
+        self.superposed = None
+        self.num_sources = 0
         self.starttime = stime
         self.logger = get_logger("fslib.traffic")
         if isinstance(self.starttime, (int, float)):
@@ -32,17 +41,17 @@ class FlowEventGenModulator(object):
         #    emerge=((1,),range(1,100,10)) sustain=((0,30),(100,100)) withdraw=((1,),range(100,1,10))"
 
         if emerge_profile:
-            emerge = eval(emerge_profile)
+            emerge = evalspec(emerge_profile)
             # print 'emerge',emerge
             self.emerge = zipit(emerge)
 
         if sustain_profile:
-            sustain = eval(sustain_profile)
+            sustain = evalspec(sustain_profile)
             # print 'sustain',sustain
             self.sustain = zipit(sustain)
 
         if withdraw_profile:
-            withdraw = eval(withdraw_profile)
+            withdraw = evalspec(withdraw_profile)
             print 'withdraw',withdraw
             self.withdraw = zipit(withdraw)
 
@@ -51,10 +60,27 @@ class FlowEventGenModulator(object):
         fscore().after(next(self.starttime), 'flowev modulator startup', self.emerge_phase)
 
 
+    def __add_generator(self, g):
+        self.genindex[g] = len(self.generators)
+        self.generators.append(g)
+        # generators that finish on their own are dropped when they do
+        g.donecallback = self.__remove_generator
+
+
+    def __remove_generator(self, g):
+        i = self.genindex.pop(g, None)
+        if i is None:
+            return
+        last = self.generators.pop()
+        if last is not g:
+            self.generators[i] = last
+            self.genindex[last] = i
+
+
     def start_generator(self):
         g = self.generator_generator()
+        self.__add_generator(g)
         g.start()
-        self.generators[g] = 1
 
 
     def kill_all_generator(self):
@@ -62,21 +88,29 @@ class FlowEventGenModulator(object):
 
 
     def kill_generator(self):
-        g = random.choice(self.generators.keys())
+        g = random.choice(self.generators)
+        self.__remove_generator(g)
         g.stop()
-        del self.generators[g]
-        
 
-    def reap_generators(self):
-        donelist = []
-        for g,x in self.generators.iteritems():
-            if g.done:
-                donelist.append(g)
-        for g in donelist:
-            del self.generators[g]
+
+    def __superpose(self, target_sources):
+        if target_sources == self.num_sources:
+            return
+        if self.superposed is None:
+            g = self.generator_generator()
+            if not g.superposable:
+                raise InvalidFlowConfiguration("{} can't superpose sources".format(g.__class__.__name__))
+            self.superposed = g
+            self.__add_generator(g)
+        self.superposed.set_sources(target_sources)
+        self.num_sources = target_sources
 
 
     def __modulate(self, target_sources):
+        if self.superpose:
+            self.__superpose(target_sources)
+            return
+
         num_sources = len(self.generators)
 
         while num_sources != target_sources:
@@ -89,7 +123,6 @@ class FlowEventGenModulator(object):
 
 
     def emerge_phase(self):
-        self.reap_generators()
         nexttime,sources = 0,0
         try:
             nexttime,sources = next(self.emerge)
@@ -104,7 +137,6 @@ class FlowEventGenModulator(object):
 
 
     def sustain_phase(self):
-        self.reap_generators()
         nexttime,sources = 0,0
         try:
             nexttime,sources = next(self.sustain)
@@ -119,7 +151,6 @@ class FlowEventGenModulator(object):
 
 
     def withdraw_phase(self):
-        self.reap_generators()
         nexttime,sources = 0,0
         try:
             nexttime,sources = next(self.withdraw)
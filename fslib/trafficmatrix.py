@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+'''
+Traffic matrices from fs output.
+
+TrafficMatrixBuilder reads text flow export files (<node>_flow.txt) in
+large chunks and pulls the needed fields out of each chunk with a single
+compiled regular expression, rather than splitting every line in
+Python.  Flow volumes are mapped to origin and destination nodes by
+longest-prefix match of their addresses against the nodes' ipdests,
+spread over the export intervals that each flow spans, and accumulated
+into a NumPy array of origin-destination matrices, one per interval.
+
+link_matrices() and link_matrices_from_frames() do the same for
+interface counters (text or binary), giving per-interval matrices of
+link volumes indexed by (neighbor, node).
+
+NumPy is required for everything in this module.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import re
+from os.path import splitext
+from pytricia import PyTricia
+from networkx.drawing.nx_pydot import read_dot
+from fslib.streamload import load_json_graph, load_gml_graph
+from fslib.counters import read_counter_frames, BYTECOUNT, PKTCOUNT, FLOWCOUNT
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# fields: ts, start, end, src, dst, ingress neighbor, pkts, bytes,
+# flows (aggregated records only), sampling rate (if sampled)
+FLOW_RECORD = re.compile(r'^textexport \S+ (\S+) (\S+) (\S+) ([\d.]+)(?:/\d+)?:\d+->([\d.]+)(?:/\d+)?:\d+ \S+ \S+ ([^:\s]*)\S* (\d+) (\d+) \S*(?: (\d+) flows)?(?: sampling (\S+))?$', re.M)
+
+COUNTER_RECORD = re.compile(r'^\s*(\S+) (\S+)->(\S+) (\d+) bytes (\d+) pkts (\d+) flows$', re.M)
+
+METRICS = ('bytes','pkts','flows')
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is required to build traffic matrices")
+
+
+def read_chunks(infile, chunksize=1<<22):
+    '''Generator of chunks of complete lines (each about chunksize bytes)
+    from a file object.'''
+    carry = ''
+    while True:
+        block = infile.read(chunksize)
+        if not block:
+            if carry:
+                yield carry
+            return
+        block = carry + block
+        cut = block.rfind('\n') + 1
+        if cut == 0:
+            carry = block
+            continue
+        carry = block[cut:]
+        yield block[:cut]
+
+
+def load_scenario(config):
+    '''Return the list of (prefix, node) pairs from the ipdests of the
+    nodes in an fs scenario file, and the list of all node names.'''
+    root,ext = splitext(config)
+    if ext == '.dot':
+        graph = read_dot(config)
+    elif ext == '.gml':
+        graph = load_gml_graph(config)
+    else:
+        graph = load_json_graph(config)
+    prefixes = []
+    for node,data in graph.nodes_iter(data=True):
+        for prefix in str(data.get('ipdests','')).replace('"','').split():
+            prefixes.append((prefix, str(node)))
+    return prefixes, [ str(n) for n in graph ]
+
+
+class TrafficMatrixBuilder(object):
+    '''
+    Accumulates origin-destination matrices of a metric ('bytes', 'pkts'
+    or 'flows') per interval seconds from flow export files.  prefixes is
+    a list of (prefix, node) pairs and topology a list of all node names,
+    e.g., as returned by load_scenario().
+
+    Every measurement node exports the flows that cross it, so by
+    default (edgeonly=True) a record only counts if it was measured at
+    the edge, i.e., its ingress interface doesn't face another node.
+    Volumes of packet-sampled records are scaled up by the inverse of the
+    sampling rate.
+    '''
+    def __init__(self, prefixes, topology=None, interval=60.0, metric='bytes', edgeonly=True, chunksize=1<<22):
+        _require_numpy()
+        if metric not in METRICS:
+            raise ValueError("Unknown traffic matrix metric {} (choose from {})".format(metric, ', '.join(METRICS)))
+        self.interval = float(interval)
+        self.metric = metric
+        self.edgeonly = edgeonly
+        self.chunksize = chunksize
+        self.nodes = sorted(set(node for prefix,node in prefixes))
+        self.index = dict( (node,i) for i,node in enumerate(self.nodes) )
+        self.topology = sorted(set(topology or []) | set(self.nodes))
+        self.lpm = PyTricia()
+        for prefix,node in prefixes:
+            self.lpm[prefix] = self.index[node]
+        self.addrcache = {}
+        self.unmatched = 0
+        self.tm = numpy.zeros((0, len(self.nodes), len(self.nodes)))
+
+    def __lookup(self, addrs):
+        '''Map an array of address strings to node indexes (-1 if no
+        prefix matches).'''
+        uniq,inverse = numpy.unique(addrs, return_inverse=True)
+        cache = self.addrcache
+        lpm = self.lpm
+        ids = numpy.empty(len(uniq), dtype=numpy.int64)
+        for i,addr in enumerate(uniq):
+            nid = cache.get(addr, None)
+            if nid is None:
+                nid = cache[addr] = lpm.get(addr, -1)
+            ids[i] = nid
+        return ids[inverse]
+
+    def __grow(self, intervals):
+        if intervals > self.tm.shape[0]:
+            n = len(self.nodes)
+            tm = numpy.zeros((max(intervals, 2*self.tm.shape[0]), n, n))
+            tm[:self.tm.shape[0]] = self.tm
+            self.tm = tm
+
+    def add_records(self, records):
+        '''Accumulate a list of FLOW_RECORD match tuples.'''
+        if not records:
+            return
+        columns = zip(*records)
+        start = numpy.array(columns[1], dtype=float)
+        end = numpy.maximum(numpy.array(columns[2], dtype=float), start)
+        if self.metric == 'bytes':
+            volume = numpy.array(columns[7], dtype=float)
+        elif self.metric == 'pkts':
+            volume = numpy.array(columns[6], dtype=float)
+        else:
+            volume = numpy.array([ int(f) if f else 1 for f in columns[8] ], dtype=float)
+        rates = [ float(r) if r else 1.0 for r in columns[9] ]
+        if min(rates) < 1.0 and self.metric != 'flows':
+            volume /= numpy.array(rates)
+
+        origin = self.__lookup(numpy.array(columns[3]))
+        dest = self.__lookup(numpy.array(columns[4]))
+        keep = (origin >= 0) & (dest >= 0)
+        if self.edgeonly:
+            keep &= ~numpy.in1d(numpy.array(columns[5]), self.topology)
+        self.unmatched += int(numpy.count_nonzero((origin < 0) | (dest < 0)))
+        if not keep.all():
+            start,end,volume,origin,dest = start[keep],end[keep],volume[keep],origin[keep],dest[keep]
+        if not len(start):
+            return
+
+        first = (start // self.interval).astype(numpy.int64)
+        last = (end // self.interval).astype(numpy.int64)
+        self.__grow(int(last.max()) + 1)
+
+        # flows within one interval go straight in; the rest are split
+        # in proportion to their overlap with each interval they span
+        single = first == last
+        numpy.add.at(self.tm, (first[single], origin[single], dest[single]), volume[single])
+        multi = ~single
+        if multi.any():
+            spans = last[multi] - first[multi] + 1
+            rows = numpy.repeat(numpy.arange(len(spans)), spans)
+            offsets = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(spans) - spans, spans)
+            slot = first[multi][rows] + offsets
+            s = start[multi][rows]
+            e = end[multi][rows]
+            overlap = numpy.minimum(e, (slot + 1) * self.interval) - numpy.maximum(s, slot * self.interval)
+            share = overlap / (e - s)
+            numpy.add.at(self.tm, (slot, origin[multi][rows], dest[multi][rows]), volume[multi][rows] * share)
+
+    def add_flow_file(self, name):
+        '''Stream one text flow export file into the matrices.'''
+        with open(name) as infile:
+            for chunk in read_chunks(infile, self.chunksize):
+                self.add_records(FLOW_RECORD.findall(chunk))
+
+    def matrices(self):
+        '''Return (interval start times, array of shape (intervals, nodes,
+        nodes)), indexed by origin then destination in the order of
+        self.nodes.'''
+        intervals = self.tm.shape[0]
+        while intervals and not self.tm[intervals-1].any():
+            intervals -= 1
+        return numpy.arange(intervals) * self.interval, self.tm[:intervals]
+
+
+def link_matrices(names, nodes=None, metric='bytes', chunksize=1<<22):
+    '''
+    Read text interface counter files (<node>_counters.txt) and return
+    (nodes, export timestamps, array of shape (timestamps, nodes, nodes))
+    where entry [t, i, j] is the volume from nodes[i] to nodes[j] in the
+    interval ending at timestamps[t].
+    '''
+    _require_numpy()
+    column = 3 + METRICS.index(metric)
+    records = []
+    for name in names:
+        with open(name) as infile:
+            for chunk in read_chunks(infile, chunksize):
+                records.extend(COUNTER_RECORD.findall(chunk))
+    if nodes is None:
+        nodes = sorted(set(r[1] for r in records) | set(r[2] for r in records))
+    index = dict( (n,i) for i,n in enumerate(nodes) )
+    records = [ r for r in records if r[1] in index and r[2] in index ]
+    if not records:
+        return nodes, numpy.zeros(0), numpy.zeros((0, len(nodes), len(nodes)))
+    columns = zip(*records)
+    timestamps,slot = numpy.unique(numpy.array(columns[0], dtype=float), return_inverse=True)
+    tm = numpy.zeros((len(timestamps), len(nodes), len(nodes)))
+    src = numpy.array([ index[n] for n in columns[1] ])
+    dst = numpy.array([ index[n] for n in columns[2] ])
+    numpy.add.at(tm, (slot, src, dst), numpy.array(columns[column], dtype=float))
+    return nodes, timestamps, tm
+
+
+def link_matrices_from_frames(name, nodes=None, metric='bytes'):
+    '''Same as link_matrices(), for binary counter output written with
+    counterexportfile name.'''
+    _require_numpy()
+    rows,frames = read_counter_frames(name)
+    if nodes is None:
+        nodes = sorted(set(n for pair in rows for n in pair))
+    index = dict( (n,i) for i,n in enumerate(nodes) )
+    # counters are kept at node for traffic from neighbor
+    src = numpy.array([ index.get(neighbor, -1) for node,neighbor in rows ], dtype=numpy.int64)
+    dst = numpy.array([ index.get(node, -1) for node,neighbor in rows ], dtype=numpy.int64)
+    column = { 'bytes':BYTECOUNT, 'pkts':PKTCOUNT, 'flows':FLOWCOUNT }[metric] + 1
+    timestamps = []
+    matrices = []
+    for frame in frames:
+        values = numpy.frombuffer(frame[column], dtype=numpy.dtype(frame[column].typecode)).astype(float)
+        nrows = len(values)
+        keep = (src[:nrows] >= 0) & (dst[:nrows] >= 0)
+        tm = numpy.zeros((len(nodes), len(nodes)))
+        numpy.add.at(tm, (src[:nrows][keep], dst[:nrows][keep]), values[keep])
+        timestamps.append(frame[0])
+        matrices.append(tm)
+    if not matrices:
+        return nodes, numpy.zeros(0), numpy.zeros((0, len(nodes), len(nodes)))
+    return nodes, numpy.array(timestamps), numpy.array(matrices)
@@ -2,9 +2,22 @@
 
 __author__ = 'jsommers@colgate.edu'
 
+import os
 import random
+import ast
+import operator
+import socket
+import struct
+from array import array
+from bisect import bisect_right
 from ipaddr import IPv4Network, IPv4Address
 import math 
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 def zipit(xtup):
     assert(len(xtup) == 2)
@@ -39,21 +52,65 @@ def modulation_generator(xlist):
     for x in xlist:
         yield x
 
-def randomunifint(lo, hi):
+# the distributions below draw from NumPy, when it's available, in
+# batches that start at VARIATE_FIRST_BATCH values and double up to
+# VARIATE_BATCH, so the many generators that only ever yield a few
+# values stay cheap.  each generator gets its own RandomState, seeded
+# from the random module, so a seeded run (fs.py -s) is reproducible.
+# without NumPy, values come from the random module one at a time.
+VARIATE_FIRST_BATCH = 16
+VARIATE_BATCH = 4096
+
+def _stream():
+    return numpy.random.RandomState(random.getrandbits(32))
+
+def _batchsizes():
+    size = VARIATE_FIRST_BATCH
+    while True:
+        yield size
+        size = min(size * 2, VARIATE_BATCH)
+
+def _batched(draw, *args):
+    for size in _batchsizes():
+        for x in draw(*args, size=size).tolist():
+            yield x
+
+def _randomunifint(lo, hi):
     r = random.randint
     while True:
         yield r(lo, hi)
 
-def randomuniffloat(lo, hi):
+def randomunifint(lo, hi):
+    if numpy is None:
+        return _randomunifint(lo, hi)
+    return _batched(_stream().randint, lo, hi+1)
+
+def _randomuniffloat(lo, hi):
     r = random.random
     while True:
         yield r()*(hi-lo)+lo
 
-def randomchoice(*choices):
+def randomuniffloat(lo, hi):
+    if numpy is None:
+        return _randomuniffloat(lo, hi)
+    return _batched(_stream().uniform, lo, hi)
+
+def _randomchoice(choices):
     r = random.choice
     while True:
         yield r(choices)
 
+def _batchedchoice(choices):
+    for i in _batched(_stream().randint, 0, len(choices)):
+        yield choices[i]
+
+def randomchoice(*choices):
+    if len(choices) == 1:
+        return repeat(choices[0])
+    if numpy is None:
+        return _randomchoice(choices)
+    return _batchedchoice(choices)
+
 def randomchoicefile(infilename):
     xlist = []
     with open(infilename) as inf:
@@ -68,51 +125,208 @@ def randomchoicefile(infilename):
         yield xlist[index]
         index = (index + 1) % len(xlist)
 
-def pareto(offset,alpha):
+def _pareto(offset,alpha):
     pow = math.pow
     r = random.random
     while True:
         yield (offset * ((1.0/pow(r(), 1.0/alpha)) - 1.0));
 
-def exponential(lam):
+def _scaled(values, scale):
+    for x in values:
+        yield scale * x
+
+def pareto(offset,alpha):
+    if numpy is None:
+        return _pareto(offset, alpha)
+    # numpy's pareto is the Lomax (Pareto II) distribution, i.e.,
+    # 1/U**(1/alpha) - 1, same as above
+    return _scaled(_batched(_stream().pareto, alpha), offset)
+
+def _exponential(lam):
     r = random.expovariate
     while True:
         yield r(lam)
 
-def normal(mean, sdev):
+def exponential(lam):
+    if numpy is None:
+        return _exponential(lam)
+    return _batched(_stream().exponential, 1.0/lam)
+
+def _normal(mean, sdev):
     r = random.normalvariate
     while True:
         yield r(mean, sdev)
 
-def lognormal(mean, sdev):
+def normal(mean, sdev):
+    if numpy is None:
+        return _normal(mean, sdev)
+    return _batched(_stream().normal, mean, sdev)
+
+def _lognormal(mean, sdev):
     r = random.lognormvariate
     while True:
         yield r(mean, sdev)
 
-def gamma(alpha, beta):
+def lognormal(mean, sdev):
+    if numpy is None:
+        return _lognormal(mean, sdev)
+    return _batched(_stream().lognormal, mean, sdev)
+
+def _gamma(alpha, beta):
     r = random.gammavariate
     while True:
         yield r(alpha, beta)
 
-def weibull(alpha, beta):
+def gamma(alpha, beta):
+    if numpy is None:
+        return _gamma(alpha, beta)
+    return _batched(_stream().gamma, alpha, beta)
+
+def _weibull(alpha, beta):
     r = random.weibullvariate
     while True:
         yield r(alpha, beta)
 
+def weibull(alpha, beta):
+    if numpy is None:
+        return _weibull(alpha, beta)
+    # random.weibullvariate takes (scale, shape); numpy's weibull only
+    # takes the shape
+    return _scaled(_batched(_stream().weibull, beta), alpha)
+
+# addresses are drawn from a multifractal cascade over the host bits of
+# a prefix (after Kohler et al., "Observed structure of addresses in IP
+# traffic"), like the ipaddrgen module: going down the address trie, each
+# node gives p of its weight to one child, chosen at random, and 1-p to
+# the other.  the top ADDRESS_TABLE_BITS levels are kept as a table of
+# cumulative leaf weights, sampled with one search; below that, an
+# address is drawn one bit at a time, and the child that gets p at each
+# node comes from a hash of the node and a per-prefix salt, so every
+# node has its own orientation without storing 2**hostbits weights.
+# tables are shared by all generators drawing from the same prefix.
+ADDRESS_TABLE_BITS = 12
+
+_address_tables = {}
+
+_MASK64 = (1<<64) - 1
+_MIX1 = 0x9E3779B97F4A7C15
+_MIX2 = 0xBF58476D1CE4E5B9
+_MIX3 = 0x94D049BB133111EB
+
+def _cascade(bits, p):
+    '''Cumulative weights of the 2**bits leaves of a random cascade.'''
+    weights = [1.0]
+    r = random.random
+    for level in xrange(bits):
+        split = []
+        for w in weights:
+            if r() < 0.5:
+                split.append(w*p)
+                split.append(w*(1-p))
+            else:
+                split.append(w*(1-p))
+                split.append(w*p)
+        weights = split
+    cumulative = array('d')
+    total = 0.0
+    for w in weights:
+        total += w
+        cumulative.append(total)
+    return cumulative
+
+def _heavychild(node, level, salt):
+    '''The child (0 or 1) of node (the address bits chosen so far, at
+    level below the table) that gets weight p.'''
+    h = (node * _MIX1 + level * _MIX2 + salt) & _MASK64
+    h = ((h ^ (h >> 30)) * _MIX2) & _MASK64
+    h = ((h ^ (h >> 27)) * _MIX3) & _MASK64
+    return (h ^ (h >> 31)) & 1
+
+def _address_cascade(prefix, p):
+    '''(base address, bits below the table, table of cumulative
+    weights, salt) for a prefix.'''
+    net = IPv4Network(prefix)
+    key = (int(net.network), net.prefixlen, p)
+    cascade = _address_tables.get(key, None)
+    if cascade is None:
+        hostbits = 32 - net.prefixlen
+        tablebits = min(hostbits, ADDRESS_TABLE_BITS)
+        cascade = _address_tables[key] = (key[0], hostbits - tablebits, _cascade(tablebits, p), random.getrandbits(64))
+    return cascade
+
+def _multifractal(base, lowbits, cumulative, salt, p):
+    r = random.random
+    total = cumulative[-1]
+    last = len(cumulative) - 1
+    heavychild = _heavychild
+    while True:
+        node = min(bisect_right(cumulative, r() * total), last)
+        for level in xrange(lowbits):
+            child = heavychild(node, level, salt)
+            if r() >= p:
+                child ^= 1
+            node = node << 1 | child
+        yield base | node
+
+def _batchedmultifractal(base, lowbits, cumulative, salt, p):
+    stream = _stream()
+    table = numpy.frombuffer(cumulative, dtype=float)
+    last = len(table) - 1
+    u64 = numpy.uint64
+    mix1,mix2,mix3 = u64(_MIX1), u64(_MIX2), u64(_MIX3)
+    s30,s27,s31,one = u64(30), u64(27), u64(31), u64(1)
+    for size in _batchsizes():
+        node = numpy.minimum(numpy.searchsorted(table, stream.random_sample(size) * table[-1], side='right'), last).astype(numpy.uint64)
+        for level in xrange(lowbits):
+            # same as _heavychild(), in wrapping 64-bit arithmetic
+            h = node * mix1 + u64((level * _MIX2 + salt) & _MASK64)
+            h = (h ^ (h >> s30)) * mix2
+            h = (h ^ (h >> s27)) * mix3
+            child = (h ^ (h >> s31)) & one
+            child ^= (stream.random_sample(size) >= p).astype(numpy.uint64)
+            node = (node << one) | child
+        for addr in node.tolist():
+            yield base | int(addr)
+
+def multifractal(prefix, p=0.61):
+    '''Generator of (integer) addresses in prefix, with a skewed,
+    multifractal distribution; see ipstr() to format them.'''
+    base,lowbits,cumulative,salt = _address_cascade(prefix, p)
+    if len(cumulative) == 1:
+        return repeat(base)
+    if numpy is None:
+        return _multifractal(base, lowbits, cumulative, salt, p)
+    return _batchedmultifractal(base, lowbits, cumulative, salt, p)
+
+_ADDR = struct.Struct('!I')
+
+def ipstr(addr):
+    '''Dotted-quad string for an integer IPv4 address.'''
+    return socket.inet_ntoa(_ADDR.pack(addr))
+
 def mkdict(s):
     xdict = {}
-    if isinstance(s, str):
+    if isinstance(s, basestring):
         s = s.split()
     for kvstr in s:
         k,v = kvstr.split('=')
         xdict[k] = v
     return xdict
 
-def removeuniform(p):
+def _removeuniform(p):
     r = random.random
     while True:
         yield (r() < p)
 
+def _below(values, p):
+    for x in values:
+        yield x < p
+
+def removeuniform(p):
+    if numpy is None:
+        return _removeuniform(p)
+    return _below(_batched(_stream().random_sample), p)
+
 def empiricaldistribution(fname):
     assert(os.path.exists(fname))
     while True:    
@@ -156,3 +370,223 @@ def default_ip_to_macaddr(ipaddr):
     mac = [ "{:02x}".format(b) for b in reversed(mac) ]
     return ':'.join(mac)
 
+
+
+class InvalidSpecification(Exception):
+    pass
+
+# bounds on what a specification may compute, so that a config string
+# like "9**9**9" or "range(10**9)" is rejected instead of hanging or
+# exhausting memory while the config is loading
+SPEC_MAX_BITS = 1024
+SPEC_MAX_ITEMS = 1<<20
+
+def _spec_range(*args):
+    try:
+        n = len(xrange(*args))
+    except OverflowError:
+        n = None
+    if n is None or n > SPEC_MAX_ITEMS:
+        raise InvalidSpecification("range({}) is too long".format(', '.join(str(a) for a in args)))
+    return range(*args)
+
+def _spec_frange(a, b, c):
+    if not c or abs((b - a) / float(c)) > SPEC_MAX_ITEMS or (b - a) * c < 0:
+        raise InvalidSpecification("frange({}, {}, {}) is too long or doesn't end".format(a, b, c))
+    return frange(a, b, c)
+
+def _bits(x):
+    if isinstance(x, (int, long)):
+        return abs(x).bit_length()
+    return 0
+
+def _spec_pow(a, b):
+    if isinstance(b, (int, long)) and b > 1 and (_bits(a) - 1) * b > SPEC_MAX_BITS:
+        raise InvalidSpecification("{}**{} is too large".format(a, b))
+    try:
+        return operator.pow(a, b)
+    except OverflowError:
+        raise InvalidSpecification("{}**{} is too large".format(a, b))
+
+def _spec_lshift(a, b):
+    if isinstance(b, (int, long)) and _bits(a) + b > SPEC_MAX_BITS:
+        raise InvalidSpecification("{}<<{} is too large".format(a, b))
+    return operator.lshift(a, b)
+
+def _spec_mul(a, b):
+    for seq,n in ((a, b), (b, a)):
+        if isinstance(seq, (basestring, list, tuple)) and isinstance(n, (int, long)) and len(seq) * n > SPEC_MAX_ITEMS:
+            raise InvalidSpecification("Sequence repeated {} times is too long".format(n))
+    return operator.mul(a, b)
+
+# functions that the specification mini-language may call.  calls to
+# the "pure" ones are folded into constants at compile time; everything
+# else returns a (stateful) generator, so each evaluation of a compiled
+# spec calls it anew.
+_SPEC_PURE_FUNCTIONS = {
+    'range': _spec_range, 'xrange': _spec_range, 'frange': _spec_frange,
+    'int': int, 'float': float, 'min': min, 'max': max, 'abs': abs,
+}
+
+_SPEC_FUNCTIONS = {
+    'modulation_generator': modulation_generator,
+    'randomunifint': randomunifint,
+    'randomuniffloat': randomuniffloat,
+    'randomchoice': randomchoice,
+    'randomchoicefile': randomchoicefile,
+    'pareto': pareto,
+    'exponential': exponential,
+    'normal': normal,
+    'lognormal': lognormal,
+    'gamma': gamma,
+    'weibull': weibull,
+    'removeuniform': removeuniform,
+    'empiricaldistribution': empiricaldistribution,
+    'empirical': empirical,
+    'zipit': zipit,
+}
+
+_SPEC_NAMES = {
+    'True': True, 'False': False, 'None': None,
+    'IPPROTO_TCP': socket.IPPROTO_TCP,
+    'IPPROTO_UDP': socket.IPPROTO_UDP,
+    'IPPROTO_ICMP': socket.IPPROTO_ICMP,
+}
+
+_SPEC_BINOPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: _spec_mul,
+    ast.Div: operator.div, ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod, ast.Pow: _spec_pow,
+    ast.BitOr: operator.or_, ast.BitAnd: operator.and_,
+    ast.LShift: _spec_lshift, ast.RShift: operator.rshift,
+}
+
+_SPEC_UNARYOPS = {
+    ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_,
+}
+
+
+def _const(value):
+    if isinstance(value, list):
+        return lambda: list(value)
+    return lambda: value
+
+
+def _compile_node(node, specstr):
+    '''Compile an expression AST node into a thunk.  Returns (thunk, isconst);
+    constant subexpressions are evaluated once, right here.'''
+    if isinstance(node, ast.Num):
+        return _const(node.n), True
+
+    elif isinstance(node, ast.Str):
+        return _const(node.s), True
+
+    elif isinstance(node, ast.Name):
+        if node.id in _SPEC_NAMES:
+            return _const(_SPEC_NAMES[node.id]), True
+
+    elif isinstance(node, ast.Attribute):
+        # allow socket.IPPROTO_TCP and friends
+        if isinstance(node.value, ast.Name) and node.value.id == 'socket' and node.attr in _SPEC_NAMES:
+            return _const(_SPEC_NAMES[node.attr]), True
+
+    elif isinstance(node, (ast.Tuple, ast.List)):
+        mktype = tuple if isinstance(node, ast.Tuple) else list
+        items = [ _compile_node(n, specstr) for n in node.elts ]
+        if all(isconst for thunk,isconst in items):
+            return _const(mktype(thunk() for thunk,isconst in items)), True
+        thunks = [ thunk for thunk,isconst in items ]
+        return (lambda: mktype(t() for t in thunks)), False
+
+    elif isinstance(node, ast.BinOp) and type(node.op) in _SPEC_BINOPS:
+        op = _SPEC_BINOPS[type(node.op)]
+        left,lconst = _compile_node(node.left, specstr)
+        right,rconst = _compile_node(node.right, specstr)
+        if lconst and rconst:
+            return _const(op(left(), right())), True
+        return (lambda: op(left(), right())), False
+
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _SPEC_UNARYOPS:
+        op = _SPEC_UNARYOPS[type(node.op)]
+        operand,isconst = _compile_node(node.operand, specstr)
+        if isconst:
+            return _const(op(operand())), True
+        return (lambda: op(operand())), False
+
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+         not node.keywords and not node.starargs and not node.kwargs:
+        fname = node.func.id
+        args = [ _compile_node(n, specstr) for n in node.args ]
+        argsconst = all(isconst for thunk,isconst in args)
+        if fname in _SPEC_PURE_FUNCTIONS:
+            fn = _SPEC_PURE_FUNCTIONS[fname]
+            if argsconst:
+                return _const(fn(*[ thunk() for thunk,isconst in args ])), True
+        elif fname in _SPEC_FUNCTIONS:
+            fn = _SPEC_FUNCTIONS[fname]
+        else:
+            raise InvalidSpecification("Unknown function '{}' in specification '{}'".format(fname, specstr))
+
+        if argsconst:
+            cargs = [ thunk() for thunk,isconst in args ]
+            return (lambda: fn(*cargs)), False
+        thunks = [ thunk for thunk,isconst in args ]
+        return (lambda: fn(*[ t() for t in thunks ])), False
+
+    raise InvalidSpecification("Disallowed expression '{}' in specification '{}'".format(type(node).__name__, specstr))
+
+
+_spec_cache = {}
+
+def compile_spec(specstr):
+    '''
+    Compile a specification string in the distribution mini-language
+    (e.g., "exponential(1/10000.0)", "randomchoice(22,80,443)", or
+    "((10,),(1,))") into a factory function.  Each call of the factory
+    returns what eval(specstr) would have, e.g., a fresh generator.
+    Only literals, arithmetic and calls to the distribution functions
+    in this module are accepted; compiled factories are cached by
+    specification string.
+    '''
+    factory = _spec_cache.get(specstr, None)
+    if factory is None:
+        try:
+            tree = ast.parse(str(specstr).strip(), mode='eval')
+        except SyntaxError,e:
+            raise InvalidSpecification("Can't parse specification '{}': {}".format(specstr, str(e)))
+        factory,isconst = _compile_node(tree.body, specstr)
+        _spec_cache[specstr] = factory
+    return factory
+
+def evalspec(specstr):
+    '''Evaluate a specification string; a safe stand-in for eval().'''
+    return compile_spec(specstr)()
+
+# the values that a call of each of these may produce, given its
+# arguments, as a sorted sequence
+_SPEC_SUPPORTS = {
+    'randomchoice': lambda *choices: sorted(set(choices)),
+    'randomunifint': lambda lo, hi: xrange(lo, hi+1),
+}
+
+def spec_support(specstr):
+    '''
+    Return the values that the generator a specification string
+    evaluates to may produce, as a sorted sequence, when they're known
+    up front (for calls of randomchoice and randomunifint with constant
+    arguments); None otherwise.
+    '''
+    try:
+        node = ast.parse(str(specstr).strip(), mode='eval').body
+    except SyntaxError:
+        return None
+    if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name) or \
+       node.func.id not in _SPEC_SUPPORTS or node.keywords or node.starargs or node.kwargs:
+        return None
+    args = [ _compile_node(n, specstr) for n in node.args ]
+    if not all(isconst for thunk,isconst in args):
+        return None
+    try:
+        return _SPEC_SUPPORTS[node.func.id](*[ thunk() for thunk,isconst in args ])
+    except (TypeError, OverflowError):
+        return None
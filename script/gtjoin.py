@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+'''
+Join ground-truth flows (recorded with the groundtruth=<file> graph
+option) against a node's exported flow records (<node>_flow.txt), e.g.:
+
+    $ python script/gtjoin.py -w 120 truth.bin b_flow.txt > b_join.txt
+
+Each output line has a true flow's start and end, key, true pkts and
+bytes, then the measured pkts and bytes and the number of exported
+records that matched it.  A summary goes to stderr.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import sys
+import os.path
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fslib.groundtruth import read_groundtruth, read_flow_records, join_records
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] <groundtruth file> <flow export file>")
+    parser.add_option("-w", "--horizon", dest="horizon",
+                      default=120.0, type=float,
+                      help="Longest delay (sec) between a flow's end and its export (default: 120)")
+    parser.add_option("-m", "--matchedonly", dest="matchedonly",
+                      default=False, action="store_true",
+                      help="Only output true flows that matched at least one exported record")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.print_usage(sys.stderr)
+        sys.exit(-1)
+
+    flows = matched = unmatched = 0
+    truebytes = measbytes = 0
+    with open(args[1]) as infile:
+        for truth,pkts,nbytes,nrecords in join_records(read_groundtruth(args[0]), read_flow_records(infile), options.horizon):
+            if truth is None:
+                unmatched += 1
+                continue
+            flows += 1
+            truebytes += truth[9]
+            if nrecords:
+                matched += 1
+                measbytes += nbytes
+            elif options.matchedonly:
+                continue
+            start,end,srcip,sport,dstip,dport,proto,flags,tpkts,tbytes = truth
+            print '%0.06f %0.06f %s:%d->%s:%d %s %d %d %d %d %d' % (start, end, srcip, sport, dstip, dport, proto, tpkts, tbytes, pkts, nbytes, nrecords)
+
+    print >>sys.stderr, "{} true flows, {} matched by exported records; {} exported records unmatched".format(flows, matched, unmatched)
+    if truebytes:
+        print >>sys.stderr, "measured/true bytes (all flows): {:.4f}".format(measbytes / float(truebytes))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+'''
+Convert fs flow export files (text or cflowd) to an indexed binary trace
+for replay or analysis, e.g.:
+
+    $ python script/mktrace.py -p 4 -o flows.trace a_flow.txt b_flow.txt
+
+Records from all the input files are merged into one trace, sorted by
+flow start time, with a sparse time index in flows.trace.idx.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import sys
+import os.path
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fslib.trace import convert, INDEX_STRIDE
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] <flow export files>")
+    parser.add_option("-f", "--format", dest="informat",
+                      default=None, choices=('text','cflowd'),
+                      help="Input format, text or cflowd (default: from each file name; .cflowd files are cflowd, anything else text)")
+    parser.add_option("-p", "--processes", dest="processes",
+                      default=None, type=int,
+                      help="Number of processes to parse input with (default: number of CPUs)")
+    parser.add_option("-c", "--chunksize", dest="chunksize",
+                      default=1<<22, type=int,
+                      help="Bytes of input per parsing task (default: 4MB)")
+    parser.add_option("-s", "--stride", dest="stride",
+                      default=INDEX_STRIDE, type=int,
+                      help="Index every Nth record (default: {}; 0 for no index)".format(INDEX_STRIDE))
+    parser.add_option("-o", "--output", dest="output",
+                      default="flows.trace",
+                      help="Output file (default: flows.trace)")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.print_usage(sys.stderr)
+        sys.exit(-1)
+
+    records = convert(args, options.output, informat=options.informat, processes=options.processes, chunksize=options.chunksize, stride=options.stride)
+    print >>sys.stderr, "{} flow records written to {}".format(records, options.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+'''
+Build per-interval traffic matrices from the output of an fs run, e.g.:
+
+    $ python script/tmbuild.py -i 60 -o tm.npz conf/testconf1.json *_flow.txt
+
+Origin-destination matrices (from flow records) and, with -c or -b,
+link matrices (from interface counters) are saved as NumPy arrays in
+an .npz file along with node names and interval timestamps.
+'''
+
+__author__ = 'jsommers@colgate.edu'
+
+import sys
+import os.path
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fslib.trafficmatrix import TrafficMatrixBuilder, load_scenario, link_matrices, link_matrices_from_frames, METRICS
+import numpy
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] <scenario> [flow export files]")
+    parser.add_option("-i", "--interval", dest="interval",
+                      default=60.0, type=float,
+                      help="Traffic matrix interval in seconds (default: 60)")
+    parser.add_option("-m", "--metric", dest="metric",
+                      default='bytes', choices=METRICS,
+                      help="Metric to use: {} (default: bytes)".format(', '.join(METRICS)))
+    parser.add_option("-a", "--allrecords", dest="edgeonly",
+                      default=True, action="store_false",
+                      help="Count flow records from every interface, not just those measured where traffic enters the network")
+    parser.add_option("-c", "--counters", dest="counters",
+                      default=[], action="append",
+                      help="Text interface counter file to build link matrices from (may be given multiple times)")
+    parser.add_option("-b", "--binarycounters", dest="binarycounters",
+                      default=None,
+                      help="Name of binary interface counter output (counterexportfile) to build link matrices from")
+    parser.add_option("-o", "--output", dest="output",
+                      default="tm.npz",
+                      help="Output file (default: tm.npz)")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.print_usage(sys.stderr)
+        sys.exit(-1)
+
+    prefixes,topology = load_scenario(args[0])
+    builder = TrafficMatrixBuilder(prefixes, topology, interval=options.interval, metric=options.metric, edgeonly=options.edgeonly)
+    for name in args[1:]:
+        builder.add_flow_file(name)
+    starts,od = builder.matrices()
+    result = {'nodes':numpy.array(builder.nodes), 'odstarts':starts, 'od':od}
+    if builder.unmatched:
+        print >>sys.stderr, "{} flow records had addresses outside any node's ipdests".format(builder.unmatched)
+
+    if options.counters:
+        nodes,timestamps,links = link_matrices(options.counters, topology, options.metric)
+    elif options.binarycounters:
+        nodes,timestamps,links = link_matrices_from_frames(options.binarycounters, topology, options.metric)
+    if options.counters or options.binarycounters:
+        result.update({'linknodes':numpy.array(nodes), 'linktimes':timestamps, 'links':links})
+
+    numpy.savez(options.output, **result)
+    print >>sys.stderr, "{} intervals of {}x{} OD matrices written to {}".format(len(starts), len(builder.nodes), len(builder.nodes), options.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import unittest
+from mock import Mock
+
+from spec_base import FsTestBase
+
+from fslib.flowlet import FlowIdent, Flowlet
+from fslib.aggregation import FlowAggregator, AggregateFlowlet, port_class
+
+
+class FlowAggregatorTests(FsTestBase):
+    def mkflowlet(self, srcip, dstip, sport, dport, pkts=1, nbytes=1500, start=0.0):
+        flet = Flowlet(FlowIdent(srcip=srcip, dstip=dstip, ipproto=6, sport=sport, dport=dport), pkts=pkts, bytes=nbytes)
+        flet.flowend = start + 1.0
+        flet.flowstart = start
+        flet.ingress_intf = 'a:10.0.0.1'
+        return flet
+
+    def exported(self, exporter):
+        return [ (call[0][0], call[0][1]) for call in exporter.exportflow.call_args_list ]
+
+    def testPortClasses(self):
+        self.assertEqual([ port_class(p) for p in (22, 1023, 1024, 8080, 49152, 65535) ], [22, 1023, 1024, 1024, 49152, 49152])
+
+    def testBadKeys(self):
+        self.assertRaises(ValueError, FlowAggregator, Mock(), ['srcprefix/33'])
+        self.assertRaises(ValueError, FlowAggregator, Mock(), ['proto/8'])
+        self.assertRaises(ValueError, FlowAggregator, Mock(), ['vlan'])
+
+    def testPrefixAggregation(self):
+        exporter = Mock()
+        agg = FlowAggregator(exporter, ['srcprefix/16', 'dstprefix', 'dstport'], interval=10)
+        agg.exportflow(1.0, self.mkflowlet('10.1.2.3', '10.3.1.7', 1, 80))
+        agg.exportflow(2.0, self.mkflowlet('10.1.9.9', '10.3.1.8', 2, 80, start=1.0))
+        agg.exportflow(3.0, self.mkflowlet('10.1.9.9', '10.3.1.8', 3, 50000))
+        self.assertEqual(exporter.exportflow.call_count, 0)
+        agg.exportflow(12.0, self.mkflowlet('10.2.0.1', '10.3.2.1', 4, 80, start=11.0))
+        records = self.exported(exporter)
+        self.assertEqual(len(records), 2)
+        ts,flet = records[0]
+        self.assertEqual(ts, 10.0)
+        self.assertIsInstance(flet, AggregateFlowlet)
+        self.assertEqual((flet.srcaddr, flet.dstaddr, flet.srcport, flet.dstport), ('10.1.0.0', '10.3.1.0', 0, 80))
+        self.assertEqual((flet.flows, flet.pkts, flet.bytes), (2, 2, 3000))
+        self.assertEqual((flet.flowstart, flet.flowend), (0.0, 2.0))
+        self.assertEqual(records[1][1].dstport, 49152)
+        agg.shutdown()
+        self.assertEqual(exporter.exportflow.call_count, 3)
+        self.assertEqual(self.exported(exporter)[2][0], 12.0)
+        exporter.shutdown.assert_called_with()
+
+    def testIngressKey(self):
+        exporter = Mock()
+        agg = FlowAggregator(exporter, ['ingress'])
+        agg.exportflow(1.0, self.mkflowlet('10.1.2.3', '10.3.1.7', 1, 80))
+        agg.shutdown()
+        flet = self.exported(exporter)[0][1]
+        self.assertEqual((flet.srcaddr, flet.ingress_intf), ('0.0.0.0', 'a:10.0.0.1'))
+        self.assertTrue(str(flet).endswith('1 flows'))
+
+
+if __name__ == '__main__':
+    unittest.main()
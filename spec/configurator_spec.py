@@ -1,8 +1,13 @@
 import unittest
-from mock import Mock
+from mock import Mock, patch
+from fslib.flowlet import Flowlet, FlowIdent
 import tempfile
 from spec_base import FsTestBase
 import fslib.configurator as configurator
+from fslib.streamload import load_json_graph, load_gml_graph
+import networkx
+import json
+from networkx.readwrite import json_graph
 import fslib.common as fscommon
 import os
 
@@ -55,6 +60,18 @@ graph test {
 }
 '''
 
+dot_partition = '''
+graph test {
+    flowexportfn=text_export_factory
+    measurementnodes="b"
+    a [ ipdests="10.1.0.0/16" ];
+    b [ ipdests="10.2.0.0/16" ];
+    c [ ipdests="10.3.0.0/16" ];
+    a -- b [weight=10, capacity=100000000, delay=0.042];
+    b -- c [weight=10, capacity=100000000, delay=0.042];
+}
+'''
+
 json_conf1 = '''
 {
     "directed": false, 
@@ -169,6 +186,16 @@ class ConfiguratorTests(FsTestBase):
         self.assertItemsEqual(topology.nodes.keys(), ['a','b'])
         self.assertItemsEqual(topology.links.keys(), [('a','b'),('b','a')])
 
+    def testRejectsBadPacketSamplingRate(self):
+        for rate in ['100', '0', '-0.5', 'often']:
+            self.mkconfig(dot_conf1.replace('pktsampling=1.0', 'pktsampling={}'.format(rate)))
+            cfg = configurator.FsConfigurator()
+            self.assertRaises(configurator.InvalidConfiguration, cfg.load_config, self.cfgfname, configtype="dot")
+            os.unlink(self.cfgfname)
+        self.mkconfig(dot_conf1.replace('pktsampling=1.0', 'pktsampling=0.01'))
+        topology = configurator.FsConfigurator().load_config(self.cfgfname, configtype="dot")
+        self.assertEqual(topology.node('a').node_measurements.config.pktsampling, 0.01)
+
     def testReadConfigJson1(self):
         self.mkconfig(json_conf1)
         cfg = configurator.FsConfigurator()
@@ -183,5 +210,97 @@ class ConfiguratorTests(FsTestBase):
         self.assertItemsEqual(topology.nodes.keys(), ['a','b'])
         self.assertItemsEqual(topology.links.keys(), [('a','b'),('b','a')])
 
+    def testStreamingJsonLoader(self):
+        self.mkconfig(json_conf1)
+        expected = json_graph.node_link_graph(json.loads(json_conf1))
+        graph = load_json_graph(self.cfgfname)
+        self.assertEqual(graph.graph, expected.graph)
+        self.assertEqual(graph.node, expected.node)
+        self.assertItemsEqual(graph.edges(data=True), expected.edges(data=True))
+
+    def testStreamingGmlLoader(self):
+        g = networkx.MultiGraph(name="test")
+        g.add_edge(0, 1, delay="10ms")
+        g.add_edge(0, 1, delay="20ms")
+        g.add_node(2, label="c", weight=1.5)
+        self.mkconfig('\n'.join(networkx.generate_gml(g)))
+        expected = networkx.read_gml(self.cfgfname)
+        graph = load_gml_graph(self.cfgfname)
+        self.assertIs(type(graph), type(expected))
+        self.assertEqual(graph.graph, expected.graph)
+        self.assertEqual(graph.node, expected.node)
+        self.assertItemsEqual(graph.edges(data=True), expected.edges(data=True))
+
+    def testStreamingLoadersMatchGraphKinds(self):
+        # top-level Creator/Version lines are skipped, but not keys of
+        # the same names inside the graph
+        self.mkconfig('Creator "me"\nVersion 1\ngraph [\n  node [\n    id 0\n    Creator "x"\n    Version 2\n  ]\n  node [\n    id 1\n  ]\n  edge [\n    source 0\n    target 1\n  ]\n]\n')
+        expected = networkx.read_gml(self.cfgfname)
+        graph = load_gml_graph(self.cfgfname)
+        self.assertIs(type(graph), type(expected))
+        self.assertEqual(graph.node, expected.node)
+        self.assertEqual(graph.node[0]['Creator'], 'x')
+        for data in [{'directed': True, 'multigraph': False}, {'directed': False, 'multigraph': False}]:
+            data.update({'graph': [], 'nodes': [{'id': 'a'}, {'id': 'b'}],
+                         'links': [{'source': 0, 'target': 1, 'w': 1}, {'source': 0, 'target': 1, 'd': 2}, {'source': 1, 'target': 1}]})
+            self.mkconfig(json.dumps(data))
+            expected = json_graph.node_link_graph(json.loads(json.dumps(data)))
+            graph = load_json_graph(self.cfgfname)
+            self.assertIs(type(graph), type(expected))
+            self.assertItemsEqual(graph.edges(data=True), expected.edges(data=True))
+            self.assertIs(graph['a']['b'], graph.pred['b']['a'] if graph.is_directed() else graph['b']['a'])
+
+    def testForwardAcrossPartition(self):
+        self.mkconfig(dot_partition)
+        cfg = configurator.FsConfigurator()
+        topology = cfg.load_config(self.cfgfname, configtype="dot")
+        # take b -- c down for good (no recovery times)
+        topology._Topology__linkdown('b', 'c', {}, None, iter([]))
+        b = topology.node('b')
+        self.assertIsNone(b.nextHop('10.3.0.1'))
+        self.assertIsNone(topology.node('a').nextHop('10.3.0.1'))
+        self.assertEqual(b.nextHop('10.1.0.1'), 'a')
+        core = Mock()
+        core.now = 1.0
+        with patch('fslib.node.fscore', return_value=core):
+            flet = Flowlet(FlowIdent('10.2.0.1', '10.3.0.1', 6, 80, 1234), bytes=1000, pkts=1)
+            flet.flowstart = flet.flowend = 1.0
+            # dropped rather than raising out of the event loop
+            b.flowlet_arrival(flet, 'a', 'c')
+
+    def testScenarioCache(self):
+        self.mkconfig(json_conf2)
+        cachename = self.cfgfname + configurator.FsConfigurator.CACHE_SUFFIX
+        try:
+            cfg = configurator.FsConfigurator()
+            topology1 = cfg.load_config(self.cfgfname, configtype="json", usecache=True)
+            self.assertTrue(os.path.exists(cachename))
+            cfg = configurator.FsConfigurator()
+            topology2 = cfg.load_config(self.cfgfname, configtype="json", usecache=True)
+            self.assertEqual(topology1.routing, topology2.routing)
+            self.assertEqual(topology1.owdhash, topology2.owdhash)
+            self.assertItemsEqual(topology2.links.keys(), [('a','b'),('b','a')])
+            self.assertEqual(topology2.capacity('a','b'), 1000000000.0)
+
+            # any change to the scenario invalidates the cache
+            with open(self.cfgfname, 'a') as fh:
+                fh.write('\n')
+            cfg = configurator.FsConfigurator()
+            topology3 = cfg.load_config(self.cfgfname, configtype="json", usecache=True)
+            self.assertEqual(topology1.owdhash, topology3.owdhash)
+        finally:
+            if os.path.exists(cachename):
+                os.unlink(cachename)
+
+    def testScenarioCacheWriteFailure(self):
+        self.mkconfig(json_conf2)
+        cachename = self.cfgfname + configurator.FsConfigurator.CACHE_SUFFIX
+        cfg = configurator.FsConfigurator()
+        with patch('fslib.configurator.cPickle.dump', side_effect=IOError("read-only file system")):
+            topology = cfg.load_config(self.cfgfname, configtype="json", usecache=True)
+        self.assertItemsEqual(topology.nodes.keys(), ['a','b'])
+        self.assertFalse(os.path.exists(cachename))
+        self.assertFalse(os.path.exists(cachename + '.tmp'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import shutil
+import tempfile
+from mock import Mock, patch
+
+from spec_base import FsTestBase
+
+from fslib.node import MeasurementConfig
+from fslib.counters import InterfaceCounters, read_counter_frames, BYTECOUNT, PKTCOUNT, FLOWCOUNT, NUM_METRICS
+
+
+class InterfaceCounterTests(FsTestBase):
+    def setUp(self):
+        self.core = Mock()
+        self.core.now = 0.0
+        self.patcher = patch('fslib.counters.fscore', return_value=self.core)
+        self.patcher.start()
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        self.patcher.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def mkcounters(self, fmt):
+        config = MeasurementConfig(counterexport=True, counterexportinterval=1, counterexportfile='ctr', counterexportformat=fmt)
+        return InterfaceCounters(config, initialrows=1)
+
+    def update(self, counters, node, neighbor, nbytes, pkts, flows):
+        base = counters.row(node, neighbor) * NUM_METRICS
+        counters.counts[base+BYTECOUNT] += nbytes
+        counters.counts[base+PKTCOUNT] += pkts
+        counters.counts[base+FLOWCOUNT] += flows
+
+    def testTextExport(self):
+        counters = self.mkcounters('text')
+        counters.start()
+        counters.start()
+        self.assertEqual(self.core.after.call_count, 1)
+        self.update(counters, 'b', 'a', 1500, 1, 1)
+        self.update(counters, 'c', 'b', 3000, 2, 1)
+        self.assertEqual(counters.get('c', 'b', PKTCOUNT), 2)
+        self.core.now = 1.0
+        counters.export()
+        self.assertEqual(counters.get('c', 'b', PKTCOUNT), 0)
+        counters.stop()
+        counters.stop()
+        self.assertEqual(open('b_ctr.txt').read(), '   1.000 a->b 1500 bytes 1 pkts 1 flows\n')
+        self.assertEqual(open('c_ctr.txt').read(), '   1.000 b->c 3000 bytes 2 pkts 1 flows\n')
+
+    def testBinaryFrames(self):
+        counters = self.mkcounters('binary')
+        counters.start()
+        self.update(counters, 'b', 'a', 1500, 1, 1)
+        counters.export()
+        self.core.now = 1.0
+        self.update(counters, 'c', 'b', 3000, 2, 1)
+        counters.export()
+        counters.stop()
+
+        names, frames = read_counter_frames('ctr')
+        self.assertEqual(names, [('b','a'), ('c','b')])
+        frames = [ (ts, list(nbytes), list(pkts), list(flows)) for ts,nbytes,pkts,flows in frames ]
+        self.assertEqual(frames, [(0.0, [1500], [1], [1]), (1.0, [0, 3000], [0, 2], [0, 1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
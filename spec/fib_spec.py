@@ -0,0 +1,45 @@
+import unittest
+
+from spec_base import FsTestBase
+from fslib.fib import SharedFib, RouterFib, build_fibs
+
+
+class FibTests(FsTestBase):
+    def setUp(self):
+        self.routing = {
+            'a': {'a':['a'], 'b':['a','b'], 'c':['a','b','c']},
+            'b': {'a':['b','a'], 'b':['b'], 'c':['b','c']},
+            'c': {'a':['c','b','a'], 'b':['c','b'], 'c':['c']},
+        }
+        self.prefixdests = [('10.0.0.0/8', ['c']), ('10.1.0.0/16', ['a']), ('10.2.0.0/16', ['c'])]
+
+    def testBulkBuild(self):
+        shared, fibs = build_fibs(self.prefixdests, ['a','b','c'], self.routing)
+        self.assertEqual(len(shared), 3)
+        self.assertEqual(fibs['a'].lookup('10.2.3.4'), ('b',))
+        self.assertEqual(fibs['b'].lookup('10.1.3.4'), ('a',))
+        self.assertEqual(fibs['b'].lookup('10.9.3.4'), ('c',))
+        self.assertEqual(fibs['c'].lookup('192.168.1.1'), ())
+        # a->c and b->c prefixes share one interned group per router
+        self.assertIs(fibs['a'].get('10.0.0.0/8'), fibs['a'].get('10.2.0.0/16'))
+
+    def testFallbackToCoveringPrefix(self):
+        # 'a' owns 10.1/16, so it has no entry there; it should fall back to 10/8
+        shared, fibs = build_fibs(self.prefixdests, ['a'], self.routing)
+        self.assertEqual(fibs['a'].lookup('10.1.1.1'), ('b',))
+
+    def testIncrementalUpdates(self):
+        fib = RouterFib()
+        fib.add('10.1.0.0/16', 'x')
+        fib.add('10.1.0.0/16', 'y')
+        fib.add('10.0.0.0/8', 'z')
+        self.assertEqual(fib.lookup('10.1.2.3'), ('x','y'))
+        self.assertEqual(fib.lookup('10.5.2.3'), ('z',))
+        fib.remove('10.1.0.0/16', 'x')
+        fib.remove('10.1.0.0/16', 'y')
+        self.assertIsNone(fib.get('10.1.0.0/16'))
+        self.assertEqual(fib.lookup('10.1.2.3'), ('z',))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from spec_base import FsTestBase
+from fslib.flowlet import FlowIdent, Flowlet
+from fslib.flowstore import FlowRecordStore
+
+
+class FlowRecordStoreTests(FsTestBase):
+    def mkflowlet(self, sport, tcpflags=0x10):
+        flet = Flowlet(FlowIdent(srcip='10.0.0.1', dstip='10.0.0.2', ipproto=6, sport=sport, dport=80), pkts=2, bytes=3000)
+        flet.tcpflags = tcpflags
+        flet.iptos = 0x08
+        return flet
+
+    def testRoundTrip(self):
+        store = FlowRecordStore()
+        f1 = self.mkflowlet(1, 0x02)
+        row = store.insert(f1, 1.0, 2.5, 2, 3000, 'a:1')
+        store.update(row, self.mkflowlet(1, 0x01), 1, 40)
+        self.assertIn(f1.key, store)
+        flet = store.flowlet(row)
+        self.assertIs(flet.ident, f1.ident)
+        self.assertEqual(str(flet), '1.000000 2.500000 10.0.0.1:1->10.0.0.2:80 tcp 0x8 a:1 3 3040 FS')
+
+    def testRowReuseAndSerials(self):
+        store = FlowRecordStore(ordered=True)
+        r1 = store.insert(self.mkflowlet(1), 0.0, 1.0, 1, 100, 'a:1')
+        r2 = store.insert(self.mkflowlet(2), 0.0, 1.0, 1, 100, 'a:1')
+        serial = store.serials[r1]
+        store.touch(self.mkflowlet(1).key)
+        self.assertEqual(store.first(), r2)
+        store.delete(r1)
+        self.assertFalse(store.valid(r1, serial))
+        r3 = store.insert(self.mkflowlet(3), 0.0, 1.0, 1, 100, 'b:2')
+        self.assertEqual(r3, r1)
+        self.assertFalse(store.valid(r3, serial))
+        self.assertTrue(store.valid(r3, store.serials[r3]))
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.ingress_names, ['a:1', 'b:2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
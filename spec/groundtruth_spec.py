@@ -0,0 +1,53 @@
+import unittest
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from spec_base import FsTestBase
+
+from fslib.flowlet import FlowIdent, Flowlet
+from fslib.groundtruth import GroundTruthRecorder, read_groundtruth, read_flow_records, join_records
+
+
+class GroundTruthTests(FsTestBase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def mkflowlet(self, sport):
+        return Flowlet(FlowIdent(srcip='10.0.0.1', dstip='10.0.0.2', ipproto=6, sport=sport, dport=80))
+
+    def testRecordRoundTrip(self):
+        recorder = GroundTruthRecorder('gt.bin', bufsize=2)
+        for sport in xrange(1, 6):
+            recorder.record(self.mkflowlet(sport), sport, sport+0.5, 10*sport, 1500*sport, 0x13)
+        recorder.close()
+        records = list(read_groundtruth('gt.bin'))
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[1], (2.0, 2.5, '10.0.0.1', 2, '10.0.0.2', 80, 'tcp', 0x13, 20, 3000))
+
+    def testJoin(self):
+        truth = [ (1.0, 3.0, '10.0.0.1', 1, '10.0.0.2', 80, 'tcp', 0, 30, 45000),
+                  (2.0, 4.0, '10.0.0.1', 2, '10.0.0.2', 80, 'tcp', 0, 10, 15000),
+                  (5.0, 6.0, '10.0.0.1', 1, '10.0.0.2', 80, 'tcp', 0, 5, 7500) ]
+        exported = StringIO(
+            'textexport r 2.500000 1.000000 2.500000 10.0.0.1:1->10.0.0.2:80 tcp 0x0 a:b 20 30000 S\n'  # active timeout
+            'textexport r 3.500000 2.500000 3.000000 10.0.0.1:1->10.0.0.2:80 tcp 0x0 a:b 10 15000 FA\n'
+            'textexport r 7.000000 5.000000 6.000000 10.0.0.1:1->10.0.0.2:80 tcp 0x0 a:b 5 7500 FA\n'
+            'textexport r 7.000000 5.000000 6.000000 10.0.0.2:80->10.0.0.1:1 tcp 0x0 a:b 5 200 A\n')
+        joined = list(join_records(truth, read_flow_records(exported), horizon=10.0))
+        matched = dict( ((t[0],t[3]),(pkts,nbytes,n)) for t,pkts,nbytes,n in joined if t )
+        self.assertEqual(matched[(1.0,1)], (30, 45000, 2))
+        self.assertEqual(matched[(2.0,2)], (0, 0, 0))
+        self.assertEqual(matched[(5.0,1)], (5, 7500, 1))
+        self.assertEqual([ x for x in joined if x[0] is None ], [(None, 5, 200, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+import random
+from mock import Mock, patch
+
+from spec_base import FsTestBase
+
+from traffic_generators.harpoon import HarpoonTrafficGenerator
+from tcpmodels.common import FlowRate
+
+
+class HarpoonTickTests(FsTestBase):
+    def setUp(self):
+        random.seed(1)
+        self.core = Mock()
+        self.core.now = 0.0
+        self.core.interval = 1.0
+        self.core.topology.owd.return_value = 0.05
+        self.node = self.core.topology.node.return_value
+        self.patcher = patch('traffic_generators.harpoon.fscore', return_value=self.core)
+        self.patcher.start()
+        self.gen = self.mkgenerator(3000, 3.0)
+
+    def mkgenerator(self, flowsize, duration, ipsrc='10.1.0.0/16', ipdst='10.3.0.0/16', dport='randomunifint(1025,65535)', **kwargs):
+        gen = HarpoonTrafficGenerator('a', ipsrc=ipsrc, ipdst=ipdst, flowsize=flowsize, pktsize=1000, flowstart=10, dport=dport, xopen=False, **kwargs)
+        model = Mock()
+        model.model.side_effect = lambda nbytes, mss, rtt, interval, p: FlowRate(nbytes, duration, interval)
+        gen.tcpmodel = model
+        return gen
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def scheduled(self, prefix):
+        return [ call for call in self.core.after.call_args_list if call[0][1].startswith(prefix) ]
+
+    def sent(self):
+        return [ call[0][0] for call in self.node.flowlet_arrival.call_args_list ]
+
+    def testOneTickForAllFlows(self):
+        self.gen.newflow()
+        self.core.now = 0.2
+        self.gen.newflow()
+        self.assertEqual(len(self.sent()), 2)
+        self.assertEqual(len(self.scheduled('flowemit')), 1)
+        self.assertEqual(len(self.gen.activeflows), 2)
+
+        self.core.now = 1.0
+        self.gen.flowemit()
+        self.assertEqual(len(self.sent()), 4)
+        self.core.now = 2.0
+        self.gen.flowemit()
+        flowlets = self.sent()
+        self.assertEqual(len(flowlets), 6)
+        self.assertEqual(len(self.scheduled('flowemit')), 2)
+        self.assertFalse(self.gen.activeflows)
+        self.assertFalse(self.gen.ticking)
+
+        # SYN on the first flowlet, FIN on the last; 3000 bytes of data
+        # plus headers and handshake
+        self.assertEqual(flowlets[0].tcpflags, 0x12)
+        self.assertEqual(flowlets[-1].tcpflags, 0x11)
+        self.assertEqual(sum(f.bytes for f in flowlets), 2 * (3000 + 5*40))
+        # closed loop: one new flow per completed flow
+        self.assertEqual(len(self.scheduled('newflow')), 2)
+
+    def testLateFlowWaitsForNextTick(self):
+        self.gen.newflow()
+        self.core.now = 0.8
+        self.gen.newflow()
+        self.core.now = 1.0
+        self.gen.flowemit()
+        self.assertEqual(len(self.sent()), 3)
+        self.assertEqual(len(self.gen.activeflows), 2)
+
+    def testLongFlowChunks(self):
+        gen = self.mkgenerator(30000, 30.0, maxflowlets=3)
+        gen.newflow()
+        for tick in xrange(1, 31):
+            self.core.now = float(tick)
+            gen.flowemit()
+        flowlets = self.sent()
+        self.assertEqual([ f.bytes - f.pkts*40 for f in flowlets ], [10000, 10000, 10000])
+        self.assertEqual([ f.span for f in flowlets ], [10.0, 10.0, 10.0])
+        self.assertEqual(len(self.scheduled('newflow')), 1)
+        self.assertFalse(gen.ticking)
+
+    def testDueListsFollowMovedSlots(self):
+        gen = self.mkgenerator(30000, 30.0, maxflowlets=3)
+        for duration in (30.0, 2.0, 30.0, 3.0, 12.0, 2.0):
+            gen.tcpmodel.model.side_effect = lambda nbytes, mss, rtt, interval, p, d=duration: FlowRate(nbytes, d, interval)
+            gen.newflow()
+        for tick in xrange(1, 31):
+            self.core.now = float(tick)
+            gen.flowemit()
+            # every active flow waits, once, in the list for its due
+            # tick, as flows end and others move into their slots
+            waiting = [ (slot, tick) for tick,slots in gen.due.items() for slot in slots ]
+            self.assertEqual(sorted(waiting), [ (slot, gen.duetick[slot]) for slot in xrange(len(gen.flows)) ])
+        self.assertFalse(gen.flows)
+        self.assertEqual(len(self.sent()), 3 + 2 + 3 + 3 + 3 + 2)
+
+    def testUniqueKeysFromNarrowSpecs(self):
+        gen = self.mkgenerator(30000, 30.0, ipsrc='10.1.0.1/32', ipdst='10.3.0.1/32', dport='randomunifint(80,83)', sport='randomchoice(5000,5001)')
+        gen.logger = Mock()
+        for i in xrange(50):
+            gen.newflow()
+        # every key the port specs allow is taken, once each; the flows
+        # that found none free didn't start, and said so once
+        keys = [ f.key for f in gen.flows ]
+        self.assertEqual(len(set(keys)), 8)
+        self.assertEqual(len(gen.activeflows), 8)
+        self.assertEqual(sorted(gen.activeflows.values()), range(8))
+        self.assertEqual(set((k.sport, k.dport) for k in keys), set((s, d) for s in (5000,5001) for d in xrange(80,84)))
+        self.assertEqual(gen.logger.warn.call_count, 1)
+        self.assertEqual(len(self.scheduled('newflow')), 42)
+        # ending flows frees their keys
+        for tick in xrange(1, 31):
+            self.core.now = float(tick)
+            gen.flowemit()
+        self.assertFalse(gen.activeflows)
+        self.assertFalse(gen.portsinuse)
+        gen.newflow()
+        self.assertEqual(len(gen.activeflows), 1)
+
+    def testSuperposedOpenLoop(self):
+        gen = self.mkgenerator(3000, 1.0)
+        gen.xopen = True
+        gen.set_sources(5)
+        delay,name,callback,epoch = self.core.after.call_args[0]
+        self.assertEqual((delay, epoch), (2.0, 1))
+        callback(epoch)
+        self.assertEqual(self.core.after.call_args[0][0], 2.0)
+        gen.set_sources(10)
+        self.assertEqual(self.core.after.call_args[0][0], 1.0)
+        # the chain started for 5 sources is dropped
+        sent = len(self.sent())
+        gen.newflow(epoch)
+        self.assertEqual(len(self.sent()), sent)
+
+    def testSuperposedClosedLoop(self):
+        gen = self.mkgenerator(1000, 1.0)
+        gen.set_sources(3)
+        self.assertEqual(len(self.scheduled('harpoon-start')), 3)
+        gen.set_sources(1)
+        for i in xrange(3):
+            gen.newflow(gen.epoch)
+        # two chains end with their flows, one carries on
+        self.assertEqual(gen.chains, 1)
+        self.assertEqual(len(self.scheduled('newflow')), 1)
+
+if __name__ == '__main__':
+    unittest.main()
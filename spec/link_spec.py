@@ -0,0 +1,69 @@
+import unittest
+import heapq
+from mock import Mock, patch
+
+from spec_base import FsTestBase
+
+from fslib.link import Link
+from fslib.flowlet import Flowlet, FlowIdent
+
+
+class LinkBacklogTests(FsTestBase):
+    def setUp(self):
+        self.core = Mock()
+        self.core.now = 0.0
+        self.core.interval = 1.0
+        self.events = []
+        self.core.after.side_effect = self.schedule
+        self.patcher = patch('fslib.link.fscore', return_value=self.core)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def schedule(self, delay, name, callback, *args):
+        heapq.heappush(self.events, (self.core.now + delay, len(self.events), callback, args))
+
+    def run_until(self, t):
+        while self.events and self.events[0][0] <= t:
+            when,seq,callback,args = heapq.heappop(self.events)
+            self.core.now = when
+            callback(*args)
+        self.core.now = t
+
+    def flowlet(self, nbytes, span=0.0):
+        flet = Flowlet(FlowIdent('10.1.0.1', '10.3.0.1', 6, 80, 1234), bytes=nbytes, pkts=1)
+        flet.span = span
+        return flet
+
+    def backlogs(self, arrivals, probes):
+        '''Backlog at each probe time, given (time, flowlet) arrivals.'''
+        self.core.now = 0.0
+        self.events = []
+        # 8 kbit/s: 1000 bytes take 1 sec to serialize
+        self.link = Link(8000, 0.1, Mock(), Mock())
+        self.link.bdp = 0
+        arrivals = list(arrivals)
+        seen = []
+        for t in probes:
+            while arrivals and arrivals[0][0] <= t:
+                when,flet = arrivals.pop(0)
+                self.run_until(when)
+                self.link.flowlet_arrival(flet, 'a', 'b')
+            self.run_until(t)
+            seen.append(self.link.backlog)
+        return seen
+
+    def testCoarsenedFlowletLoadsWholeSpan(self):
+        probes = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]
+        fine = self.backlogs([ (float(i), self.flowlet(500)) for i in xrange(4) ], probes)
+        coarse = self.backlogs([ (0.0, self.flowlet(2000, span=4.0)) ], probes)
+        # the chunk stays in the backlog while its intervals would be
+        # sent, and drains when the last of them would have
+        self.assertEqual(coarse[::2], fine[::2])
+        self.assertEqual(coarse[-5:], [500, 500, 0, 0, 0])
+        self.assertEqual(fine[:6], [500, 500, 500, 500, 500, 500])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+from mock import Mock, patch
+
+from spec_base import FsTestBase
+
+from fslib.flowlet import FlowIdent, Flowlet
+from fslib.node import MeasurementConfig, NodeMeasurement, NullMeasurement, Node
+
+
+class NodeMeasurementTests(FsTestBase):
+    def setUp(self):
+        self.core = Mock()
+        self.core.now = 0.0
+        self.patcher = patch('fslib.node.fscore', return_value=self.core)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def mkmeasurement(self, **kwargs):
+        nm = NodeMeasurement(MeasurementConfig(flowexport='null', **kwargs), 'r')
+        nm.exporter = Mock()
+        return nm
+
+    def mkflowlet(self, sport, duration):
+        flet = Flowlet(FlowIdent(srcip='10.0.0.1', dstip='10.0.0.2', ipproto=6, sport=sport, dport=80), pkts=1, bytes=1500)
+        flet.flowstart = 0.0
+        flet.flowend = duration
+        return flet
+
+    def exported(self, nm):
+        return [ call[0][1].srcport for call in nm.exporter.exportflow.call_args_list ]
+
+    def testOnlyExpiredFlowsExported(self):
+        nm = self.mkmeasurement(flowinactivetmo=5, longflowtmo=20)
+        nm.add(self.mkflowlet(1, 1.0), 'a', 0)   # inactive at 6
+        nm.add(self.mkflowlet(2, 30.0), 'a', 0)  # long flow at 20
+        self.core.now = 10.0
+        nm.add(self.mkflowlet(3, 1.0), 'a', 0)   # inactive at 16
+
+        nm.flow_export()
+        self.assertEqual(self.exported(nm), [1])
+        self.core.now = 20.0
+        nm.flow_export()
+        self.assertEqual(self.exported(nm), [1,3,2])
+        self.assertEqual(len(nm.flow_table), 0)
+        self.assertEqual(len(nm.expiry_index), 0)
+
+    def testRemovedFlowsLeaveNoTrace(self):
+        nm = self.mkmeasurement(flowinactivetmo=5)
+        flet = self.mkflowlet(1, 1.0)
+        nm.add(flet, 'a', 0)
+        nm.remove(flet, 'a')
+        self.core.now = 1.0
+        nm.add(self.mkflowlet(1, 1.0), 'a', 0)  # same key, new cache entry
+        self.core.now = 6.5
+        nm.flow_export()
+        self.assertEqual(self.exported(nm), [1])
+        self.core.now = 7.0
+        nm.flow_export()
+        self.assertEqual(self.exported(nm), [1,1])
+
+    def testNoTimeouts(self):
+        nm = self.mkmeasurement()
+        nm.add(self.mkflowlet(1, 1.0), 'a', 0)
+        self.assertEqual(nm.expiry_index, [])
+        self.core.now = 1000.0
+        nm.flow_export()
+        self.assertEqual(len(nm.flow_table), 1)
+
+    def testLruEviction(self):
+        nm = self.mkmeasurement(flowcachesize=2, flowcachepolicy='lru')
+        nm.add(self.mkflowlet(1, 1.0), 'a', 0)
+        nm.add(self.mkflowlet(2, 1.0), 'a', 0)
+        nm.add(self.mkflowlet(1, 1.0), 'a', 0)
+        nm.add(self.mkflowlet(3, 1.0), 'a', 0)
+        self.assertEqual(self.exported(nm), [2])
+        self.assertEqual(sorted(k.sport for k in nm.flow_table), [1,3])
+        self.assertEqual(nm.evictions, 1)
+
+    def testOldestFirstEviction(self):
+        nm = self.mkmeasurement(flowcachesize=2, flowcachepolicy='oldest')
+        for sport in [1,2,1,3,4]:
+            nm.add(self.mkflowlet(sport, 1.0), 'a', 0)
+        self.assertEqual(self.exported(nm), [1,2])
+        self.assertEqual(nm.evictions, 2)
+
+    def testAggressiveTimeoutAboveHighWatermark(self):
+        nm = self.mkmeasurement(flowcachesize=4, flowcachepolicy='aggressive',
+                                flowcachehighwater=0.5, aggressivetmo=2, flowinactivetmo=60)
+        nm.add(self.mkflowlet(1, 1.0), 'a', 0)   # aggressive deadline 3
+        nm.add(self.mkflowlet(2, 10.0), 'a', 0)  # aggressive deadline 12
+        self.core.now = 4.0
+        nm.add(self.mkflowlet(3, 1.0), 'a', 0)
+        self.assertEqual(self.exported(nm), [1])
+        nm.add(self.mkflowlet(4, 1.0), 'a', 0)
+        nm.add(self.mkflowlet(5, 1.0), 'a', 0)
+        nm.add(self.mkflowlet(6, 1.0), 'a', 0)
+        # full: evicts the flow closest to its aggressive deadline
+        self.assertEqual(self.exported(nm), [1,3])
+        self.assertEqual(len(nm.flow_table), 4)
+        self.assertEqual(nm.evictions, 2)
+
+    def testPacketSampling(self):
+        nm = self.mkmeasurement(pktsampling=0.5, pktsamplingmode='systematic', counterexport=True)
+        self.assertEqual(nm.pktsampler.rate, 0.5)
+        flet = self.mkflowlet(1, 1.0)
+        flet.pkts = 10
+        flet.bytes = 15000
+        nm.add(flet, 'a', 0)
+        cached = nm.flow_table.flowlet(nm.flow_table.first())
+        self.assertEqual((cached.pkts, cached.bytes), (5, 7500))
+        self.assertEqual(nm.counters.get('r', 'a', NodeMeasurement.PKTCOUNT), 10)
+
+    def testCountersSharedPerConfig(self):
+        config = MeasurementConfig(flowexport='null', counterexport=True)
+        a = NodeMeasurement(config, 'a')
+        b = NodeMeasurement(config, 'b')
+        self.assertIs(a.counters, b.counters)
+        self.assertIs(a.counters.config, config)
+        other = self.mkmeasurement(counterexport=True)
+        self.assertIsNot(other.counters, a.counters)
+
+
+class SelectiveMeasurementTests(FsTestBase):
+    class TestNode(Node):
+        def flowlet_arrival(self, flowlet, prevnode, destnode, input_ident=None):
+            self.measure_flow(flowlet, prevnode, input_ident)
+
+    def setUp(self):
+        self.patcher = patch('fslib.node.fscore', return_value=Mock(now=0.0))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def mkflowlet(self, ipproto, ackflow=False):
+        flet = Flowlet(FlowIdent(srcip='10.0.0.1', dstip='10.0.0.2', ipproto=ipproto, sport=1, dport=80), pkts=1, bytes=1500)
+        flet.ackflow = ackflow
+        return flet
+
+    def testSelection(self):
+        self.assertIsNone(MeasurementConfig.selection('all'))
+        self.assertEqual(MeasurementConfig.selection('none'), [])
+        self.assertEqual(MeasurementConfig.selection('a, b c'), ['a','b','c'])
+
+    def testUnmeasuredNodeHasNoMeters(self):
+        node = self.TestNode('r', None)
+        self.assertIsNone(node.ingress_meter)
+        self.assertEqual(node.ingress_meters, {})
+
+    def testInterfaceAndClassSelection(self):
+        node = self.TestNode('r', MeasurementConfig(flowexport='null', measureingress='a', measureclasses='tcp'))
+        node.node_measurements = Mock()
+        node.ingress_meters['a'].measurement = node.node_measurements
+        node.flowlet_arrival(self.mkflowlet(6), 'a', 'x')
+        node.flowlet_arrival(self.mkflowlet(6), 'b', 'x')
+        node.flowlet_arrival(self.mkflowlet(17), 'a', 'x')
+        node.flowlet_arrival(self.mkflowlet(6, ackflow=True), 'a', 'x')
+        self.assertEqual(node.node_measurements.add.call_count, 1)
+        self.assertIsInstance(node.egress_measurements, NullMeasurement)
+
+    def testEgress(self):
+        node = self.TestNode('r', MeasurementConfig(flowexport='null', measureingress='none', measureegress='all'))
+        self.assertEqual(node.ingress_meters, {})
+        self.assertEqual(node.egress_measurements.node_name, 'r_egress')
+        node.egress_measurements = node.egress_meter = Mock()
+        node.measure_egress_flow(self.mkflowlet(6), 'b', '10.0.0.1')
+        self.assertEqual(node.egress_meter.add.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
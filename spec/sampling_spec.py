@@ -0,0 +1,30 @@
+import unittest
+import random
+
+from spec_base import FsTestBase
+from fslib.sampling import PacketSampler
+
+
+class PacketSamplerTests(FsTestBase):
+    def testSystematic(self):
+        random.seed(1)
+        sampler = PacketSampler(0.01, 'systematic')
+        self.assertEqual(sampler.interval, 100)
+        total = sum(sampler.sample(n) for n in [1, 37, 250, 12, 700] * 20)
+        self.assertEqual(total, 20000 // 100)
+        self.assertEqual(sampler.sample(100), 1)
+
+    def testRandomRate(self):
+        random.seed(1)
+        sampler = PacketSampler(0.1)
+        counts = [ sampler.sample(n) for n in [1, 5, 20, 3000] * 500 ]
+        self.assertTrue(all(0 <= c <= n for c,n in zip(counts, [1, 5, 20, 3000] * 500)))
+        self.assertAlmostEqual(sum(counts) / 1513000.0, 0.1, places=2)
+
+    def testInvalid(self):
+        self.assertRaises(ValueError, PacketSampler, 1.0)
+        self.assertRaises(ValueError, PacketSampler, 0.5, 'sometimes')
+
+
+if __name__ == '__main__':
+    unittest.main()
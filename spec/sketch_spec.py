@@ -0,0 +1,46 @@
+import unittest
+import random
+
+from spec_base import FsTestBase
+from fslib.sketch import CountMinSketch, SpaceSaving, HyperLogLog
+
+
+class SketchTests(FsTestBase):
+    def setUp(self):
+        random.seed(42)
+        self.stream = [ ('10.0.0.1', random.randint(1024,65535)) for i in xrange(5000) ]
+        self.stream += [ ('10.9.9.9', 80) ] * 500
+
+    def testCountMinNeverUndercounts(self):
+        cms = CountMinSketch(width=256, depth=4)
+        truth = {}
+        for key in self.stream:
+            cms.add(key, 10)
+            truth[key] = truth.get(key, 0) + 10
+        self.assertEqual(cms.total, 55000)
+        for key,count in truth.iteritems():
+            self.assertGreaterEqual(cms.estimate(key), count)
+        self.assertLess(cms.estimate(('10.9.9.9', 80)), 5000 + 2*55000/256)
+
+    def testSpaceSavingFindsHeavyHitter(self):
+        ss = SpaceSaving(capacity=8)
+        for key in self.stream:
+            ss.add(key, 10)
+        self.assertEqual(len(ss.top()), 8)
+        key,count,error = ss.top(1)[0]
+        self.assertEqual(key, ('10.9.9.9', 80))
+        self.assertGreaterEqual(count, 5000)
+        self.assertLessEqual(count - error, 5000)
+
+    def testHyperLogLog(self):
+        hll = HyperLogLog(bits=10)
+        self.assertEqual(hll.count(), 0)
+        for i in xrange(20000):
+            hll.add('10.{}.{}.{}'.format(i >> 16, (i >> 8) & 0xff, i & 0xff))
+            hll.add('10.0.0.1')
+        self.assertAlmostEqual(hll.count() / 20000.0, 1.0, delta=0.1)
+        self.assertRaises(ValueError, HyperLogLog, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
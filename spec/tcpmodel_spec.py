@@ -0,0 +1,74 @@
+import unittest
+import random
+from mock import patch
+
+from spec_base import FsTestBase
+
+import tcpmodels.csa00 as csa00
+import tcpmodels.mathis as mathis
+from tcpmodels.common import LRUCache, FlowRate, quantize, numpy
+
+
+class TcpModelTests(FsTestBase):
+    def testLRUCache(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c'), len(cache)), (1, 3, 2))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def testQuantize(self):
+        self.assertAlmostEqual(quantize(0.08612, 0.0001), 0.0861)
+        self.assertAlmostEqual(quantize(0.00001, 0.0001), 0.0001)
+
+    def testMemoizedModel(self):
+        sizes = (1000, 1400, 1460, 100000)
+        csa00._cache.clear()
+        random.seed(1)
+        first = [ csa00.model(nbytes, 1460, 0.086, 1.0, 0.001) for nbytes in sizes ]
+        misses = csa00._cache.misses
+        random.seed(1)
+        second = [ csa00.model(nbytes, 1460, 0.086, 1.0, 0.001) for nbytes in sizes ]
+        self.assertEqual([ f.duration for f in first ], [ s.duration for s in second ])
+        self.assertEqual(csa00._cache.misses, misses)
+        rate = first[3]
+        self.assertTrue(0 < rate.ramp < rate.duration)
+        self.assertAlmostEqual(sum(rate.byteemit()), 100000)
+
+    def testFlowRate(self):
+        rate = FlowRate(1000, 3.5, 1.0)
+        self.assertEqual((rate.nintervals, rate.span, rate.rate), (4, 4.0, 250.0))
+        self.assertEqual(list(rate.byteemit()), [250.0]*4)
+        rate = FlowRate(1000, 4.0, 1.0, ramp=2.0)
+        self.assertAlmostEqual(rate.rate, 1000/3.0)
+        self.assertAlmostEqual(rate.sent(2.0), 1000/3.0)
+        self.assertAlmostEqual(rate.sent(3.0), 2000/3.0)
+        self.assertEqual(rate.sent(5.0), 1000)
+        emitted = list(rate.byteemit())
+        self.assertTrue(emitted[0] < emitted[1] < emitted[2])
+        self.assertAlmostEqual(sum(emitted), 1000)
+
+    @unittest.skipIf(numpy is None, "NumPy not available")
+    def testVectorizedModels(self):
+        sizes = [1000, 20000, 5000000]
+        rtts = [0.086, 0.246, 0.148]
+        durations,ramps,rates = csa00.model_array(sizes, 1460, rtts, 1.0, 0.001, initial_window=[1,2,3])
+        for i in xrange(3):
+            with patch('tcpmodels.csa00.choice', return_value=i+1):
+                rate = csa00.model(sizes[i], 1460, rtts[i], 1.0, 0.001)
+            self.assertAlmostEqual(durations[i], rate.duration)
+            self.assertAlmostEqual(ramps[i], rate.ramp)
+            self.assertAlmostEqual(rates[i], rate.rate)
+        self.assertTrue(ramps.all())
+        durations,ramps,rates = mathis.model_array(sizes, 1460, rtts, 1.0, 0.001)
+        for i in xrange(3):
+            rate = mathis.model(sizes[i], 1460, rtts[i], 1.0, 0.001)
+            self.assertAlmostEqual(durations[i], rate.duration)
+            self.assertEqual(ramps[i], 0.0)
+            self.assertAlmostEqual(rates[i], rate.rate)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+from mock import Mock, patch
+
+from spec_base import FsTestBase
+
+from fslib.trace import TraceWriter, TraceReader, InvalidTrace, convert
+from flowexport.cflow import cflow
+from traffic_generators.replay import ReplayTrafficGenerator
+
+
+def addr(ip):
+    return socket.inet_aton(ip)
+
+
+class TraceTests(FsTestBase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        writer = TraceWriter('x.trace', bufsize=2)
+        for i in xrange(10):
+            src = '10.1.0.1' if i % 2 else '10.2.0.1'
+            writer.write(100.0 + i, 100.0 + i + 4, addr(src), addr('10.3.0.1'), 1000+i, 80, 6, 0, 0x1b, 10, 10000)
+        writer.close()
+        self.core = Mock()
+        self.core.now = 0.0
+        self.core.interval = 1.0
+        self.node = self.core.topology.node.return_value
+        self.patcher = patch('traffic_generators.replay.fscore', return_value=self.core)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def run_events(self):
+        '''Run scheduled replay events in order until none are left.'''
+        while self.core.after.call_args_list:
+            calls = self.core.after.call_args_list
+            delay,name,callback = calls[0][0]
+            self.core.after.reset_mock()
+            self.core.now += delay
+            callback()
+
+    def record_arrivals(self):
+        arrivals = []
+        self.node.flowlet_arrival.side_effect = lambda f, prev, dest: arrivals.append((self.core.now, f))
+        return arrivals
+
+    def testReader(self):
+        reader = TraceReader('x.trace')
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader.record(3)[:2], (103.0, 107.0))
+        self.assertEqual(reader.find(104.5), 5)
+        self.assertEqual(reader.find(0), 0)
+        self.assertEqual(reader.find(200), 10)
+        self.assertEqual([ r[4] for r in reader.records(8) ], [1008, 1009])
+        reader.close()
+
+    def testBadTraces(self):
+        writer = TraceWriter('y.trace')
+        writer.write(5.0, 6.0, addr('1.2.3.4'), addr('1.2.3.5'), 1, 2, 17, 0, 0, 1, 100)
+        self.assertRaises(InvalidTrace, writer.write, 4.0, 6.0, addr('1.2.3.4'), addr('1.2.3.5'), 1, 2, 17, 0, 0, 1, 100)
+        writer.close()
+        with open('z.trace', 'w') as outfile:
+            outfile.write('not a trace')
+        self.assertRaises(InvalidTrace, TraceReader, 'z.trace')
+
+    def testIndexedFind(self):
+        writer = TraceWriter('i.trace', stride=3)
+        for i in xrange(13):
+            writer.write(float(i // 2), 10.0, addr('1.2.3.4'), addr('1.2.3.5'), i, 2, 17, 0, 0, 1, 100)
+        writer.close()
+        reader = TraceReader('i.trace')
+        self.assertEqual((reader.stride, list(reader.index)), (3, [0.0, 1.0, 3.0, 4.0, 6.0]))
+        starts = [ i // 2 for i in xrange(13) ]
+        for t in (-1, 0, 0.5, 1, 2, 3, 3.5, 4, 5, 6, 7):
+            for lo,hi in ((0,13), (3,7), (5,5), (8,13)):
+                expected = max(lo, min(hi, len([ s for s in starts if s < t ])))
+                self.assertEqual(reader.find(t, lo, hi), expected)
+        self.assertEqual([ r[4] for r in reader.window(1, 3) ], [2, 3, 4, 5])
+        reader.close()
+        # an index that doesn't match the trace is ignored
+        os.rename('i.trace.idx', 'x.trace.idx')
+        reader = TraceReader('x.trace')
+        self.assertIsNone(reader.index)
+        self.assertEqual(reader.find(104.5), 5)
+        reader.close()
+
+    def testConvertText(self):
+        lines = [
+            'textexport a 5.000000 3.000000 4.500000 10.1.0.1:22->10.3.0.1:4000 tcp 0x0 harpoon:172.16.0.1 4 2104 FSA',
+            'textexport a 5.000000 1.000000 2.000000 10.1.0.2:53->10.3.0.2:5000 udp 0x10 b 1 80 ',
+            'textexport a 10.000000 2.000000 9.000000 10.1.0.0/16:0->10.3.0.0/16:0 tcp 0x0 b 40 40000 SA 3 flows',
+            'textexport a 10.000000 0.500000 0.600000 10.1.0.3:22->10.3.0.3:4001 tcp 0x0 b 1 40 S sampling 0.5',
+        ]
+        with open('a_flow.txt', 'w') as outfile:
+            outfile.write('\n'.join(lines) + '\n')
+        for processes in (1, 2):
+            self.assertEqual(convert(['a_flow.txt'], 'a.trace', processes=processes, chunksize=64), 4)
+            reader = TraceReader('a.trace')
+            records = list(reader.records())
+            self.assertIsNotNone(reader.index)
+            reader.close()
+            self.assertEqual([ r[0] for r in records ], [0.5, 1.0, 2.0, 3.0])
+            self.assertEqual(records[1], (1.0, 2.0, addr('10.1.0.2'), addr('10.3.0.2'), 53, 5000, 17, 0x10, 0, 1, 80))
+            self.assertEqual(records[2][2:], (addr('10.1.0.0'), addr('10.3.0.0'), 0, 0, 6, 0, 0x12, 40, 40000))
+            self.assertEqual(records[3][8], 0x13)
+
+    def testConvertCflowd(self):
+        with open('a.cflowd', 'wb') as outfile:
+            for start in (7, 3, 5):
+                outfile.write(cflow.packrecord(srcaddr=0x0a010001, dstaddr=0x0a030001, pkts=2, bytes=start*100, start=start, end=start+1, srcport=80, dstport=1234, tcpflags=0x1b, ipproto=6))
+        self.assertEqual(convert(['a.cflowd'], 'b.trace', informat='cflowd', processes=1, chunksize=100), 3)
+        reader = TraceReader('b.trace')
+        records = list(reader.records())
+        reader.close()
+        self.assertEqual(records[0], (3.0, 4.0, addr('10.1.0.1'), addr('10.3.0.1'), 80, 1234, 6, 0, 0x1b, 2, 300))
+        self.assertEqual([ r[0] for r in records ], [3.0, 5.0, 7.0])
+
+    def testReplay(self):
+        gen = ReplayTrafficGenerator('a', tracefile='x.trace', speed='2', start='102', end='106', ipsrc='10.2.0.0/16')
+        arrivals = self.record_arrivals()
+        self.core.now = 10.0
+        gen.start()
+        self.run_events()
+        sent = [ (t, f.srcport, f.flowend, f.span) for t,f in arrivals ]
+        # records at 102 and 104 from 10.2/16, replayed at double speed
+        self.assertEqual(sent, [(10.0, 1002, 2.0, 2.0), (11.0, 1004, 2.0, 2.0)])
+        self.assertEqual(self.core.topology.node.call_count, 2)
+        self.assertEqual(gen.flows, 2)
+        self.assertTrue(gen.done)
+        self.assertIsNone(gen.reader)
+
+    def testReplayTiming(self):
+        gen = ReplayTrafficGenerator('a', tracefile='x.trace')
+        arrivals = self.record_arrivals()
+        gen.start()
+        self.run_events()
+        times = [ (t, f.flowend, f.pkts, f.bytes, f.tcpflags) for t,f in arrivals ]
+        self.assertEqual([ t[0] for t in times ], [ float(i) for i in xrange(10) ])
+        self.assertEqual(times[0][1:], (4.0, 10, 10000, 0x1b))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,61 @@
 import unittest
-
-class TrafficTests(unittest.TestCase):
-    pass
+from mock import Mock, patch
+
+from spec_base import FsTestBase
+
+from fslib.traffic import FlowEventGenModulator, InvalidFlowConfiguration
+
+class TrafficTests(FsTestBase):
+    def setUp(self):
+        self.core = Mock()
+        self.patcher = patch('fslib.traffic.fscore', return_value=self.core)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def testFinishedGeneratorsAreDropped(self):
+        from traffic_generators.trafgen import TrafficGenerator
+        class Gen(TrafficGenerator):
+            def start(self):
+                pass
+        modulator = FlowEventGenModulator(lambda: Gen('a'), sustain_profile='((10,10),(1000,10))')
+        modulator.sustain_phase()
+        gens = list(modulator.generators)
+        for g in gens[:500]:
+            g.done = True
+        self.assertEqual(len(modulator.generators), 500)
+        self.assertEqual(sorted(modulator.genindex.values()), range(500))
+        modulator.sustain_phase()
+        modulator.sustain_phase()
+        self.assertEqual(len(modulator.generators), 10)
+        self.assertFalse(any(g.done for g in modulator.generators))
+        for i,g in enumerate(modulator.generators):
+            self.assertEqual(modulator.genindex[g], i)
+
+    def testSuperposedSources(self):
+        gens = []
+        def mkgen():
+            gens.append(Mock(superposable=True, done=False))
+            return gens[-1]
+        modulator = FlowEventGenModulator(mkgen, sustain_profile='((10,10,10),(50,200,0))', superpose=True)
+        for i in xrange(4):
+            modulator.sustain_phase()
+        self.assertEqual(len(gens), 1)
+        self.assertEqual([ c[0][0] for c in gens[0].set_sources.call_args_list ], [50, 200, 0])
+        self.assertFalse(gens[0].start.called)
+
+    def testSuperposeNeedsSupport(self):
+        modulator = FlowEventGenModulator(lambda: Mock(superposable=False), sustain_profile='((10,),(5,))', superpose=True)
+        self.assertRaises(InvalidFlowConfiguration, modulator.sustain_phase)
+
+    def testSeparateSources(self):
+        modulator = FlowEventGenModulator(lambda: Mock(done=False), sustain_profile='((10,10),(3,1))')
+        modulator.sustain_phase()
+        self.assertEqual(len(modulator.generators), 3)
+        modulator.sustain_phase()
+        modulator.sustain_phase()
+        self.assertEqual(len(modulator.generators), 1)
     
 
 
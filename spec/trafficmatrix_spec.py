@@ -0,0 +1,74 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from spec_base import FsTestBase
+
+import fslib.trafficmatrix as tmod
+from fslib.trafficmatrix import TrafficMatrixBuilder, link_matrices, read_chunks
+
+FLOWS = '''textexport a 5.000000 1.000000 2.000000 10.1.0.1:80->10.3.0.1:1025 tcp 0x0 harpoon:172.16.0.1 10 1000 FSA
+textexport b 5.000000 1.100000 2.100000 10.1.0.1:80->10.3.0.1:1025 tcp 0x0 a:172.16.0.2 10 1000 FSA
+textexport a 25.000000 5.000000 15.000000 10.3.0.9:53->10.1.2.2:999 udp 0x0 harpoon:172.16.0.1 4 400  sampling 0.5
+textexport a 30.000000 0.000000 10.000000 10.1.0.0/16:0->10.3.0.0/16:0 tcp 0x0 * 7 700 FSA 3 flows
+textexport a 30.000000 0.000000 1.000000 192.168.0.1:1->10.3.0.1:2 tcp 0x0 harpoon:172.16.0.1 1 100 S
+'''
+
+COUNTERS = '''   1.000 a->b 100 bytes 1 pkts 1 flows
+   1.000 b->c 50 bytes 1 pkts 1 flows
+   2.000 a->b 30 bytes 1 pkts 0 flows
+'''
+
+
+@unittest.skipIf(tmod.numpy is None, "NumPy not available")
+class TrafficMatrixTests(FsTestBase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        with open('x_flow.txt', 'w') as outfile:
+            outfile.write(FLOWS)
+        with open('x_counters.txt', 'w') as outfile:
+            outfile.write(COUNTERS)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def mkbuilder(self, **kwargs):
+        return TrafficMatrixBuilder([('10.1.0.0/16','a'), ('10.3.0.0/16','c')], ['a','b','c'], interval=10, chunksize=64, **kwargs)
+
+    def testChunksAreWholeLines(self):
+        with open('x_flow.txt') as infile:
+            chunks = list(read_chunks(infile, 100))
+        self.assertTrue(all(c.endswith('\n') for c in chunks))
+        self.assertEqual(''.join(chunks), FLOWS)
+
+    def testODMatrices(self):
+        builder = self.mkbuilder()
+        builder.add_flow_file('x_flow.txt')
+        starts,tm = builder.matrices()
+        self.assertEqual(list(starts), [0.0, 10.0])
+        self.assertEqual(builder.unmatched, 1)
+        # edge record at a only (b's copy came in from a)
+        self.assertEqual(tm[0,0,1], 1000 + 700)
+        # sampled udp flow, scaled by 2 and split across two intervals
+        self.assertAlmostEqual(tm[0,1,0], 400.0)
+        self.assertAlmostEqual(tm[1,1,0], 400.0)
+
+    def testFlowCounts(self):
+        builder = self.mkbuilder(metric='flows', edgeonly=False)
+        builder.add_flow_file('x_flow.txt')
+        starts,tm = builder.matrices()
+        self.assertEqual(tm[0,0,1], 5)
+
+    def testLinkMatrices(self):
+        nodes,timestamps,tm = link_matrices(['x_counters.txt'])
+        self.assertEqual(nodes, ['a','b','c'])
+        self.assertEqual(list(timestamps), [1.0, 2.0])
+        self.assertEqual((tm[0,0,1], tm[0,1,2], tm[1,0,1]), (100, 50, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
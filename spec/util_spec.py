@@ -0,0 +1,166 @@
+import unittest
+import random
+from mock import patch
+
+from spec_base import FsTestBase
+import fslib.util
+from fslib.util import compile_spec, evalspec, spec_support, InvalidSpecification, VARIATE_BATCH, multifractal, ipstr
+
+
+class SpecCompilerTests(FsTestBase):
+    def testConstants(self):
+        self.assertEqual(evalspec('60'), 60)
+        self.assertEqual(evalspec('1/10000.0'), 0.0001)
+        self.assertEqual(evalspec('False'), False)
+        self.assertEqual(evalspec('((10,),range(1,10,3))'), ((10,),[1,4,7]))
+
+    def testGeneratorsAreFresh(self):
+        factory = compile_spec('randomchoice(22,80,443)')
+        self.assertIs(factory, compile_spec('randomchoice(22,80,443)'))
+        g1 = factory()
+        g2 = factory()
+        self.assertIsNot(g1, g2)
+        self.assertIn(next(g1), (22,80,443))
+        self.assertEqual(next(evalspec('randomchoice(socket.IPPROTO_TCP)')), 6)
+
+    def testRejectsArbitraryCode(self):
+        for s in ['__import__("os").system("true")', 'open("/etc/passwd")',
+                  '(1).__class__', 'lambda: 1', 'exponential(x)', 'randomchoice(']:
+            self.assertRaises(InvalidSpecification, compile_spec, s)
+
+
+    def testRejectsHugeConstants(self):
+        for s in ['9**9**9', '2**100000', '1.5**100000', '1<<100000', 'range(10**9)',
+                  'xrange(10**30)', 'frange(0, 10**9, 1)', 'frange(0, 10, 0)',
+                  "'a'*10**9", '[0]*10**9']:
+            self.assertRaises(InvalidSpecification, compile_spec, s)
+        self.assertEqual(evalspec('2**10 + (1<<4)'), 1040)
+        self.assertEqual(evalspec('1**100000'), 1)
+        self.assertEqual(len(evalspec('range(1000)')), 1000)
+
+    def testSupport(self):
+        self.assertEqual(spec_support('randomchoice(443,22,80,22)'), [22,80,443])
+        self.assertEqual(list(spec_support('randomunifint(1,2*2)')), [1,2,3,4])
+        for s in ['exponential(1)', 'randomchoice(randomunifint(1,2))', '60']:
+            self.assertIsNone(spec_support(s))
+
+
+class VariateTests(FsTestBase):
+    SPECS = ['randomunifint(1,3)', 'randomuniffloat(1,3)', 'randomchoice(22,80,443)',
+             'pareto(10000.0,1.2)', 'exponential(1/100.0)', 'normal(5,1)', 'lognormal(1,0.5)',
+             'gamma(2,3)', 'weibull(2,1.5)', 'removeuniform(0.3)']
+
+    def draw(self, spec, n):
+        gen = evalspec(spec)
+        return [ next(gen) for i in xrange(n) ]
+
+    def testSeededStreamsRepeat(self):
+        for spec in self.SPECS:
+            random.seed(42)
+            first = self.draw(spec, VARIATE_BATCH + 10)
+            random.seed(42)
+            self.assertEqual(first, self.draw(spec, VARIATE_BATCH + 10), spec)
+
+    def testStreamsAreIndependent(self):
+        random.seed(42)
+        g1 = evalspec('exponential(1.0)')
+        g2 = evalspec('exponential(1.0)')
+        self.assertNotEqual([ next(g1) for i in xrange(5) ], [ next(g2) for i in xrange(5) ])
+
+    def testValues(self):
+        random.seed(42)
+        ints = self.draw('randomunifint(1,3)', 1000)
+        self.assertEqual(set(ints), set([1,2,3]))
+        self.assertIs(type(ints[0]), int)
+        self.assertEqual(set(self.draw('randomchoice(22,80,443)', 1000)), set([22,80,443]))
+        self.assertEqual(set(self.draw("randomchoice('a')", 10)), set(['a']))
+        mean = sum(self.draw('exponential(1/100.0)', 20000)) / 20000
+        self.assertTrue(95 < mean < 105)
+
+    def testSmallStreams(self):
+        # a single choice needs no random stream
+        random.seed(42)
+        state = random.getstate()
+        self.assertEqual(self.draw('randomchoice(6)', 3), [6,6,6])
+        self.assertEqual(random.getstate(), state)
+        # batches start small and grow
+        if fslib.util.numpy is None:
+            return
+        sizes = []
+        def draw(size):
+            sizes.append(size)
+            return fslib.util.numpy.zeros(size)
+        gen = fslib.util._batched(draw)
+        for i in xrange(2 * VARIATE_BATCH):
+            next(gen)
+        self.assertEqual(sizes[:3], [16, 32, 64])
+        self.assertEqual(max(sizes), VARIATE_BATCH)
+
+    def testWithoutNumPy(self):
+        with patch('fslib.util.numpy', None):
+            for spec in self.SPECS:
+                random.seed(42)
+                values = self.draw(spec, 10)
+                random.seed(42)
+                self.assertEqual(values, self.draw(spec, 10), spec)
+
+
+class AddressTests(FsTestBase):
+    def check(self, prefix, base, numhosts):
+        random.seed(42)
+        gen = multifractal(prefix)
+        addrs = [ next(gen) for i in xrange(VARIATE_BATCH + 10) ]
+        self.assertTrue(all(base <= a < base + numhosts for a in addrs), prefix)
+        return addrs
+
+    def testMultifractal(self):
+        for numpy in (fslib.util.numpy, None):
+            with patch('fslib.util.numpy', numpy):
+                addrs = self.check('10.1.0.0/16', 0x0a010000, 1<<16)
+                # many distinct addresses, but skewed toward some
+                counts = {}
+                for a in addrs:
+                    counts[a] = counts.get(a, 0) + 1
+                self.assertTrue(len(counts) > 1000)
+                self.assertTrue(max(counts.values()) > 3)
+                self.check('16.0.0.0/4', 0x10000000, 1<<28)
+                self.assertEqual(set(self.check('10.1.2.3/32', 0x0a010203, 1)), set([0x0a010203]))
+
+    def splits(self, addrs, base, hostbits, level):
+        '''Samples in each child of every node at level (bits into the
+        prefix), as {node: [count0, count1]}.'''
+        shift = hostbits - level - 1
+        counts = {}
+        for a in addrs:
+            bits = (a - base) >> shift
+            counts.setdefault(bits >> 1, [0, 0])[bits & 1] += 1
+        return counts
+
+    def testPrefixMassSkew(self):
+        for numpy in (fslib.util.numpy, None):
+            with patch('fslib.util.numpy', numpy):
+                for prefix,base,hostbits,levels in (('10.0.0.0/8', 0x0a000000, 24, (2, 14, 18)), ('10.1.0.0/16', 0x0a010000, 16, (2, 10, 14))):
+                    random.seed(42)
+                    gen = multifractal(prefix, 0.8)
+                    addrs = [ next(gen) for i in xrange(10 * VARIATE_BATCH) ]
+                    for level in levels:
+                        # well-sampled nodes split their mass 0.8/0.2,
+                        # above and below the precomputed table
+                        nodes = [ c for c in self.splits(addrs, base, hostbits, level).values() if sum(c) >= 200 ]
+                        self.assertTrue(nodes, (prefix, level))
+                        heavy = sum(max(c) for c in nodes) / float(sum(sum(c) for c in nodes))
+                        self.assertTrue(0.77 < heavy < 0.83, (prefix, level, heavy))
+                    # which child is heavier varies from node to node,
+                    # even among nodes whose bits below the table match
+                    groups = {}
+                    for node,c in self.splits(addrs, base, hostbits, 13).iteritems():
+                        if sum(c) >= 100:
+                            groups.setdefault(node & 1, set()).add(c[0] > c[1])
+                    self.assertIn(set([True, False]), groups.values(), prefix)
+
+    def testIpstr(self):
+        self.assertEqual(ipstr(0x0a010203), '10.1.2.3')
+
+
+if __name__ == '__main__':
+    unittest.main()
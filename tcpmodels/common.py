@@ -0,0 +1,120 @@
+'''
+Helpers shared by the tcp models: the FlowRate descriptor returned by
+each model's model() function, input quantization, and a small LRU
+cache for memoizing model results.
+'''
+
+from math import ceil
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# inputs are rounded to these before model evaluation so that flows
+# with effectively the same path and loss rate share cache entries
+RTT_QUANTUM = 0.0001
+LOSS_QUANTUM = 0.000001
+
+
+def quantize(x, quantum):
+    '''Round x to the nearest (nonzero) multiple of quantum.'''
+    return max(1, int(x / quantum + 0.5)) * quantum
+
+
+def quantize_array(x, quantum):
+    return numpy.maximum(1, numpy.floor(numpy.asarray(x, dtype=float) / quantum + 0.5)) * quantum
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is required for vectorized tcp model evaluation")
+
+
+def flowrate_arrays(bytes, duration, interval, ramp=0.0):
+    '''Vectorized counterpart of FlowRate: returns arrays of durations,
+    (clipped) slow-start ramps and peak sending rates, as FlowRate
+    would compute them for each flow.'''
+    duration = numpy.asarray(duration, dtype=float)
+    span = numpy.maximum(numpy.ceil(duration / interval), 1) * interval
+    ramp = numpy.clip(numpy.asarray(ramp, dtype=float), 0.0, span)
+    rate = numpy.asarray(bytes, dtype=float) / (span - ramp / 2.0)
+    return duration, ramp, rate
+
+
+class LRUCache(object):
+    '''Mapping that holds at most maxsize entries, evicting the least
+    recently used.'''
+    __slots__ = ['maxsize','entries','hits','misses']
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class FlowRate(object):
+    '''
+    Describes how a modeled flow sends its bytes: over duration seconds,
+    rounded up to whole simulator intervals (the flow's span), at a
+    constant rate, optionally reached by a linear slow-start ramp over
+    the first ramp seconds.  sent(t) gives the number of bytes sent t
+    seconds into the flow, so a flow can be emitted in chunks of any
+    length without stepping through it interval by interval.
+    '''
+    __slots__ = ['bytes','duration','interval','nintervals','ramp','rate']
+
+    def __init__(self, bytes, duration, interval, ramp=0.0):
+        self.bytes = bytes
+        self.duration = duration
+        self.interval = interval
+        self.nintervals = int(max(ceil(duration / interval), 1))
+        self.ramp = max(0.0, min(ramp, self.span))
+        # peak sending rate, bytes/sec
+        self.rate = bytes / (self.span - self.ramp / 2.0)
+
+    @property
+    def span(self):
+        return self.nintervals * self.interval
+
+    def sent(self, t):
+        '''Bytes sent by t seconds after the start of the flow.'''
+        if t >= self.span:
+            return self.bytes
+        if t <= 0:
+            return 0.0
+        if t < self.ramp:
+            return self.rate * t * t / (2.0 * self.ramp)
+        return self.rate * (t - self.ramp / 2.0)
+
+    def byteemit(self):
+        '''Generator of the bytes sent in each interval of the flow.'''
+        sent = self.sent
+        interval = self.interval
+        for i in xrange(self.nintervals):
+            yield sent((i+1) * interval) - sent(i * interval)
+
+    def __str__(self):
+        return "{} bytes over {:.3f}s (ramp {:.3f}s, rate {:.1f} bytes/s)".format(self.bytes, self.duration, self.ramp, self.rate)
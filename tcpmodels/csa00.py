@@ -1,8 +1,32 @@
 from random import choice
 from math import log, floor, ceil, sqrt
+from tcpmodels.common import numpy, quantize, quantize_array, require_numpy, LRUCache, FlowRate, flowrate_arrays, RTT_QUANTUM, LOSS_QUANTUM
+
+# flow duration depends on flow size only through the number of
+# packets, so results are memoized by (packets, mss, rtt, p, initial
+# window, rwnd), with rtt and p quantized
+_cache = LRUCache()
 
 def model(bytes, mss, rtt, interval, p, rwnd=1048576):
-    '''Implements the cardwell, savage, anderson infocom 2000 improvement on pftk98.'''
+    '''Implements the cardwell, savage, anderson infocom 2000 improvement on pftk98.
+    Returns a FlowRate whose slow-start ramp is the expected time spent
+    in initial slow start.'''
+    initial_window = choice([1,2,3])
+    d = bytes // mss
+    if bytes % mss > 0:
+        d += 1
+    key = (d, mss, quantize(rtt, RTT_QUANTUM), quantize(p, LOSS_QUANTUM), initial_window, rwnd)
+    result = _cache.get(key)
+    if result is None:
+        result = _duration(*key)
+        _cache.put(key, result)
+    flowduration,etss = result
+    return FlowRate(bytes, flowduration, interval, ramp=etss)
+
+
+def _duration(d, mss, rtt, p, initial_window, rwnd):
+    '''Expected duration of a transfer of d packets, and of its initial
+    slow start.'''
 
     # assume losspr is same in forward and reverse direction
     pr = pf = p
@@ -10,8 +34,6 @@ def model(bytes, mss, rtt, interval, p, rwnd=1048576):
     # initial syn timeout = 3.0 sec
     ts = 3.0
 
-    initial_window = choice([1,2,3])
-
     gamma = 1.5
     wmax = rwnd / mss  # receive window, in MSS
     # print 'wmax:',wmax
@@ -20,9 +42,6 @@ def model(bytes, mss, rtt, interval, p, rwnd=1048576):
     elh = rtt + ts * ( (1.0-pr) / (1-2.0*pr) + (1.0 - pf) / (1 - 2*pf) - 2.0)
 
     # eq(5): expected number of packets in initial slow-start phase
-    d = bytes // mss
-    if bytes % mss > 0:
-        d += 1
     edss = floor((1 - (1 - p) ** d) * (1 - p) / p + 1)
 
     # eq(11): expected window at the end of slowstart
@@ -77,7 +96,7 @@ def model(bytes, mss, rtt, interval, p, rwnd=1048576):
     flowduration = etss + etloss + etca + etdelack
     
     #print 'exp handshake',elh
-    #print 'data bytes: %d mss %d pkts %d' % (bytes, mss, d)
+    #print 'data pkts %d mss %d' % (d, mss)
     #print 'expt d in ss',edss
     #print 'etss',etss
     #print 'etloss',etloss
@@ -86,22 +105,62 @@ def model(bytes, mss, rtt, interval, p, rwnd=1048576):
     #print 'entire estimated time',flowduration
 
     # assert(flowduration >= rtt)
-    flowduration = max(flowduration, rtt)
+    return max(flowduration, rtt), etss
+
+
+def model_array(bytes, mss, rtt, interval, p, rwnd=1048576, initial_window=None):
+    '''
+    Vectorized model(): evaluates arrays (or scalars) of bytes, mss, rtt
+    and p at once and returns arrays of flow durations, slow-start ramps
+    and peak rates, the values of the FlowRate model() would return for
+    each flow.  Initial windows are drawn at random, as in model(),
+    unless given.  Requires NumPy.
+    '''
+    require_numpy()
+    bytes = numpy.asarray(bytes, dtype=numpy.int64)
+    mss = numpy.asarray(mss, dtype=numpy.int64)
+    rtt = quantize_array(rtt, RTT_QUANTUM)
+    p = quantize_array(p, LOSS_QUANTUM)
+    bytes,mss,rtt,p = numpy.broadcast_arrays(bytes, mss, rtt, p)
+    if initial_window is None:
+        initial_window = [ choice([1,2,3]) for i in xrange(bytes.size) ]
+    initial_window = numpy.asarray(initial_window, dtype=numpy.int64).reshape(bytes.shape)
 
-    csa00bw = bytes / flowduration
-    # print "flow duration",flowduration
-    # print "flow rate",csa00bw
+    gamma = 1.5
+    lgamma = log(gamma)
+    wmax = rwnd // mss
+    d = -(-bytes // mss)
 
-    nintervals = ceil(flowduration / interval)
+    # eqs (5), (11), (15)
+    edss = numpy.floor((1 - (1 - p) ** d) * (1 - p) / p + 1)
+    ewss = edss * (gamma - 1) / gamma + initial_window/gamma
+    etss = numpy.where(ewss > wmax,
+        rtt * numpy.log(wmax // initial_window) / lgamma + 1.0 + 1.0/wmax * (edss - (gamma * wmax - initial_window)/(gamma - 1.0)),
+        rtt * numpy.log(edss*(gamma-1)/initial_window+1) / lgamma)
 
-    nintervals = max(nintervals, 1)
-    avgemit = bytes/nintervals
+    # eqs (21), (16)
+    edca = d - edss
+    lss = 1 - (1-p)**d
+
+    Q = lambda p,w: numpy.minimum(1.0, (1+(1-p)**3*(1-(1-p)**(w-3)))/((1-(1-p)**w)/(1-(1-p)**3)))
+    G = 1 + p + 2*p**2 + 4*p**3 + 8*p**4 + 16*p**5 + 32*p**6
 
-    def byteemit():
-        for i in xrange(int(nintervals)+1):
-            yield avgemit
+    # eqs (18), (20)
+    to = rtt * 2
+    Ezto = G*to/(1-p)
+    qss = Q(p,ewss)
+    etloss = lss * (qss * Ezto + (1-qss) * rtt)
 
-    return flowduration, byteemit()
+    # eqs (23), (22)
+    b = 2.0
+    wp = 2+b/3*b + numpy.sqrt(8*(1-p)/3*b*p + (2*b/(3*b))**2)
+    R = numpy.where(wp < wmax,
+        ((1-p)/p+wp/2.0+Q(p,wp)) / (rtt*(b/2.0*wp+1)+(Q(p,wp)*G*to)/(1-p)),
+        ((1-p)/p+wmax/2.0+Q(p,wmax))/(rtt*(b/8.0*wmax+(1-p)/(p*wmax)+Q(p,wmax)*G*to/(1-p))))
+
+    # eqs (24), (25)
+    flowduration = numpy.maximum(etss + etloss + edca/R + 0.1, rtt)
+    return flowrate_arrays(bytes, flowduration, interval, ramp=etss)
 
 
 if __name__ == '__main__':
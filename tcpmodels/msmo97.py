@@ -1,9 +1,10 @@
-from math import sqrt, ceil
+from math import sqrt
+from tcpmodels.common import numpy, require_numpy, FlowRate, flowrate_arrays
 
 def model(bytes, mss, rtt, interval, p):
-    '''Function to implement MSMO97 tcp model.  Returns flow duration
-    in seconds and a byte emitter (generator) given number of bytes, rtt,
-    simulation interval, and an emitter str to eval'''
+    '''Function to implement MSMO97 tcp model.  Returns a FlowRate
+    describing the flow given number of bytes, mss, rtt, simulation
+    interval and loss rate'''
 
     # mathis model constant C
     C = sqrt(3.0/2)
@@ -16,16 +17,18 @@ def model(bytes, mss, rtt, interval, p):
     # how many intervals will this flowlet last?
     flowduration = bytes / bw
 
-    nintervals = ceil(flowduration / interval)
-    nintervals = max(nintervals, 1)
-    avgemit = bytes/float(nintervals)
-    assert(avgemit > 0.0)
+    assert(bytes > 0)
+    return FlowRate(bytes, flowduration, interval)
 
-    def byteemit():
-        for i in xrange(int(nintervals)+1):
-            yield avgemit
-
-    return flowduration, byteemit()
+def model_array(bytes, mss, rtt, interval, p):
+    '''Vectorized model(): evaluates arrays (or scalars) of bytes, mss,
+    rtt and p at once and returns arrays of flow durations, slow-start
+    ramps (all zero) and rates, the values of the FlowRate model() would
+    return for each flow.  Requires NumPy.'''
+    require_numpy()
+    bw = numpy.asarray(mss, dtype=float) / rtt * sqrt(3.0/2) / numpy.sqrt(p)
+    flowduration = numpy.asarray(bytes, dtype=float) / bw
+    return flowrate_arrays(bytes, flowduration, interval)
 
 if __name__ == '__main__':
     print model(1048576, 1470, 0.060, 1, 0.01)
@@ -3,10 +3,17 @@ import socket
 import ipaddr
 from fslib.common import fscore, get_logger
 from fslib.flowlet import Flowlet, FlowIdent
-from copy import copy
+from fslib.groundtruth import groundtruth
+from array import array
 from importlib import import_module
+from bisect import bisect_left
 from fslib.util import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 haveIPAddrGen = False
 try:
     import ipaddrgen
@@ -14,63 +21,134 @@ try:
 except:
     pass
 
+# when a new flow's key collides with an active flow's and the values
+# its port specs may take aren't known up front, its ports are redrawn
+# up to this many times before the flow is given up on
+KEY_DRAWS = 4
+
+def _ipaddrgen(trie):
+    generate = ipaddrgen.generate_addressv4
+    while True:
+        yield generate(trie)
+
+def _rotated(values, start):
+    '''Iterate over a sorted sequence, from start (or the first value
+    above it) on, wrapping around to the beginning.'''
+    i = bisect_left(values, start)
+    for j in xrange(i, len(values)):
+        yield values[j]
+    for j in xrange(i):
+        yield values[j]
+
 class HarpoonTrafficGenerator(TrafficGenerator):
-    def __init__(self, srcnode, ipsrc='0.0.0.0', ipdst='0.0.0.0', sport=0, dport=0, flowsize=1500, pktsize=1500, flowstart=0, ipproto=socket.IPPROTO_TCP, lossrate=0.001, mss=1460, iptos=0x0, xopen=True, tcpmodel='csa00'):
+    def __init__(self, srcnode, ipsrc='0.0.0.0', ipdst='0.0.0.0', sport=0, dport=0, flowsize=1500, pktsize=1500, flowstart=0, ipproto=socket.IPPROTO_TCP, lossrate=0.001, mss=1460, iptos=0x0, xopen=True, tcpmodel='csa00', maxflowlets=0):
         TrafficGenerator.__init__(self, srcnode)
         self.logger = get_logger('fs.harpoon')
         self.srcnet = ipaddr.IPNetwork(ipsrc)
         self.dstnet = ipaddr.IPNetwork(ipdst)
         if haveIPAddrGen:
-            self.ipsrcgen = ipaddrgen.initialize_trie(int(self.srcnet), self.srcnet.prefixlen, 0.61)
-            self.ipdstgen = ipaddrgen.initialize_trie(int(self.dstnet), self.dstnet.prefixlen, 0.61)
+            self.ipsrcgen = _ipaddrgen(ipaddrgen.initialize_trie(int(self.srcnet), self.srcnet.prefixlen, 0.61))
+            self.ipdstgen = _ipaddrgen(ipaddrgen.initialize_trie(int(self.dstnet), self.dstnet.prefixlen, 0.61))
+        else:
+            self.ipsrcgen = multifractal(self.srcnet, 0.61)
+            self.ipdstgen = multifractal(self.dstnet, 0.61)
 
         if isinstance(ipproto, (str,unicode)):
-            self.ipproto = eval(ipproto)
+            self.ipproto = evalspec(ipproto)
         else: 
             self.ipproto = randomchoice(ipproto)
 
         if isinstance(sport, (str,unicode)):
-            self.srcports = eval(sport)
+            self.srcports = evalspec(sport)
+            self.srcportvals = spec_support(sport)
         else:
             self.srcports = randomchoice(sport)
+            self.srcportvals = [sport]
 
         if isinstance(dport, (str,unicode)):
-            self.dstports = eval(dport)
+            self.dstports = evalspec(dport)
+            self.dstportvals = spec_support(dport)
         else:
             self.dstports = randomchoice(dport)
+            self.dstportvals = [dport]
 
         if isinstance(flowsize, (str,unicode)):
-            self.flowsizerv = eval(flowsize)
+            self.flowsizerv = evalspec(flowsize)
         else:
             self.flowsizerv = randomchoice(flowsize)
 
         if isinstance(pktsize, (str,unicode)):
-            self.pktsizerv = eval(pktsize)
+            self.pktsizerv = evalspec(pktsize)
         else:
             self.pktsizerv = randomchoice(pktsize)
 
         if isinstance(flowstart, (str,unicode)):
-            self.flowstartrv = eval(flowstart)
+            self.flowstartrv = evalspec(flowstart)
         else:
             self.flowstartrv = randomchoice(flowstart)
 
         if isinstance(lossrate, (str,unicode)):
-            self.lossraterv = eval(lossrate)
+            self.lossraterv = evalspec(lossrate)
         else:
             self.lossraterv = randomchoice(lossrate)
 
         if isinstance(mss, (str,unicode)):
-            self.mssrv = eval(mss)
+            self.mssrv = evalspec(mss)
         else:
             self.mssrv = randomchoice(mss)
 
         if isinstance(iptos, (str,unicode)):
-            self.iptosrv = eval(iptos)
+            self.iptosrv = evalspec(iptos)
         else:
             self.iptosrv = randomchoice(iptos)
 
         self.xopen = xopen
+        # if positive, a long flow is sent as at most maxflowlets
+        # flowlets, each spanning several intervals
+        self.maxflowlets = int(maxflowlets)
+        self.groundtruth = groundtruth()
+
+        # number of identical sources this generator stands for (see
+        # set_sources()), the number of closed-loop flow chains running,
+        # and the open-loop arrival chain currently in effect
+        self.sources = 1
+        self.chains = 0
+        self.epoch = 0
+
+        # active flows live in a dense, array-backed table, one slot per
+        # flow (activeflows maps flow key, as a tuple of integers, ->
+        # slot), and are all served by a single tick event per generator.
+        # flows leave the table by moving the last slot into theirs.
+        # each flow's rate descriptor is kept as its span, ramp and peak
+        # rate columns, so that chunk sizes can be worked out in bulk.
         self.activeflows = {}
+        self.keys = []
+        self.flows = []
+        self.dests = []
+        self.sizes = array('L')
+        self.spans = array('d')
+        self.ramps = array('d')
+        self.peaks = array('d')
+        self.remaining = array('L')
+        self.steps = array('L')
+        self.numsent = array('L')
+        # slots waiting for each tick (due maps tick number -> list of
+        # slots), and where each slot is in its list
+        self.due = {}
+        self.duetick = array('l')
+        self.duepos = array('L')
+        # ground-truth totals, only kept when recording
+        self.gtstart = array('d')
+        self.gtpkts = array('L')
+        self.gtbytes = array('L')
+        self.gtflags = array('B')
+        # (sport, dport) pairs taken by active flows, for each (srcip,
+        # dstip, ipproto)
+        self.portsinuse = {}
+        self.keysfull = False
+        self.ticking = False
+        self.tickno = 0
+        self.nexttick = 0.0
 
         try:
             self.tcpmodel = import_module("tcpmodels.{}".format(tcpmodel))
@@ -78,18 +156,64 @@ class HarpoonTrafficGenerator(TrafficGenerator):
             raise InvalidFlowConfiguration('Unrecognized tcp model for harpoon: {} (Error on import: {})'.format(tcpmodel, str(e)))
 
 
+    superposable = True
+
     def start(self):
+        self.chains = 1
         startt = next(self.flowstartrv)
-        fscore().after(startt, 'harpoon-start'+str(self.srcnode), self.newflow)
+        fscore().after(startt, 'harpoon-start'+str(self.srcnode), self.newflow, self.epoch)
+
+    def set_sources(self, n):
+        '''
+        Make this generator stand for n identical sources.  In open-loop
+        mode, the sources are superposed into one arrival process with n
+        times the intensity (flowstart values are divided by n; exact for
+        exponential interarrivals), which starts afresh whenever n
+        changes.  In closed-loop mode, n flow chains run; chains beyond n
+        end when their current flow does.
+        '''
+        self.sources = n
+        if self.xopen:
+            self.epoch += 1
+            if n > 0:
+                fscore().after(next(self.flowstartrv) / n, 'harpoon-start'+str(self.srcnode), self.newflow, self.epoch)
+        else:
+            while self.chains < n:
+                self.chains += 1
+                fscore().after(next(self.flowstartrv), 'harpoon-start'+str(self.srcnode), self.newflow, self.epoch)
 
 
-    def newflow(self, xint=1.0):
+    def newflow(self, epoch=0):
         if self.done:
             print 'harpoon generator done'
             return
+        if epoch != self.epoch:
+            # arrival chain superseded by set_sources()
+            return
+
+        key = self.__makekey()
+        if key is not None:
+            self.__startflow(key)
+        else:
+            # every port pair that the port specs allow is taken for the
+            # drawn addresses; rather than share a 5-tuple with an
+            # active flow, this one doesn't start
+            if not self.keysfull:
+                self.logger.warn("Harpoon generator at %s has run out of distinct flow keys; new flows are skipped while they last", self.srcnode)
+                self.keysfull = True
+            if not self.xopen:
+                self.__chainnext()
 
-        flet = self.__makeflow()
-        self.activeflows[flet.key] = 1
+        # if operating in an 'open-loop' fashion, schedule next
+        # incoming flow now (otherwise schedule it when this flow ends;
+        # see code in flowemit())
+        if self.xopen:
+            nextst = next(self.flowstartrv) / self.sources
+            # print >>sys.stderr, 'scheduling next new harpoon flow at',nextst
+            fscore().after(nextst, 'newflow-'+str(self.srcnode), self.newflow, self.epoch)
+
+    def __startflow(self, key):
+        flet = self.__makeflow(key)
 
         destnode = fscore().topology.destnode(self.srcnode, flet.dstaddr)
         owd = fscore().topology.owd(self.srcnode, destnode)
@@ -103,7 +227,8 @@ class HarpoonTrafficGenerator(TrafficGenerator):
         p = next(self.lossraterv)
         basertt = owd * 2.0
 
-        flowduration, byteemit = self.tcpmodel.model(flet.size, flet.mss, basertt, fscore().interval, p)
+        rate = self.tcpmodel.model(flet.size, flet.mss, basertt, fscore().interval, p)
+        flowduration = rate.duration
 
         # FIXME: add an end timestamp onto flow to indicate its estimated
         # duration; routers along path can add that end to arrival time to get
@@ -111,91 +236,248 @@ class HarpoonTrafficGenerator(TrafficGenerator):
         # unclear what to do with raw flows.
         flet.flowstart = 0.0
         flet.flowend = flowduration
-        self.logger.debug("Flow duration: %f" % flowduration)
-
-        fscore().after(0.0, 'flowemit-'+str(self.srcnode), self.flowemit, flet, 0, byteemit, destnode)
-        
-        # if operating in an 'open-loop' fashion, schedule next
-        # incoming flow now (otherwise schedule it when this flow ends;
-        # see code in flowemit())
-        if self.xopen:
-            nextst = next(self.flowstartrv)
-            # print >>sys.stderr, 'scheduling next new harpoon flow at',nextst
-            fscore().after(nextst, 'newflow-'+str(self.srcnode), self.newflow)
-
-
-    def flowemit(self, flowlet, numsent, emitrv, destnode):
-        fsend = copy(flowlet)
-        fsend.bytes = int(min(next(emitrv), flowlet.bytes)) 
-        flowlet.bytes -= fsend.bytes
+        self.logger.debug("Flow duration: %f", flowduration)
+
+        # the first flowlet goes out right away; the rest go out on
+        # ticks, every step ticks
+        step = 1
+        if self.maxflowlets > 0:
+            step = max(1, -(-rate.nintervals // self.maxflowlets))
+        slot = self.__addflow(key, flet, rate, step, destnode)
+        if self.__emit(slot, self.__chunk(slot)):
+            self.__removeflow(slot)
+            return
+        tick = self.tickno + step
+        if not self.ticking:
+            self.ticking = True
+            self.nexttick = fscore().now + fscore().interval
+            fscore().after(fscore().interval, 'flowemit-'+str(self.srcnode), self.flowemit)
+        elif self.nexttick - fscore().now < fscore().interval / 2.0:
+            # too close to the upcoming tick; wait for the one after
+            tick += 1
+        self.__schedule(slot, tick)
+
+    def __chainnext(self):
+        '''Closed-loop mode: schedule the next flow of a chain whose flow
+        has ended, unless the chain is one too many.'''
+        if self.chains > self.sources:
+            self.chains -= 1
+        else:
+            fscore().after(next(self.flowstartrv), "newflow-{}".format(self.srcnode), self.newflow, self.epoch)
+
+    def __addflow(self, key, flet, rate, step, destnode):
+        slot = len(self.flows)
+        self.activeflows[key] = slot
+        self.keys.append(key)
+        self.flows.append(flet)
+        self.dests.append(destnode)
+        self.sizes.append(flet.bytes)
+        self.spans.append(rate.span)
+        self.ramps.append(rate.ramp)
+        self.peaks.append(rate.rate)
+        self.remaining.append(flet.bytes)
+        self.steps.append(step)
+        self.numsent.append(0)
+        self.duetick.append(0)
+        self.duepos.append(0)
+        if self.groundtruth:
+            self.gtstart.append(fscore().now)
+            self.gtpkts.append(0)
+            self.gtbytes.append(0)
+            self.gtflags.append(0)
+        return slot
+
+    def __schedule(self, slot, tick):
+        bucket = self.due.get(tick, None)
+        if bucket is None:
+            bucket = self.due[tick] = []
+        self.duetick[slot] = tick
+        self.duepos[slot] = len(bucket)
+        bucket.append(slot)
+
+    def __removeflow(self, slot):
+        '''Drop the flow in slot, which mustn't be waiting in a tick's
+        list (it's just been sent); the last flow takes its slot.'''
+        last = len(self.flows) - 1
+        key = self.keys[slot]
+        del self.activeflows[key]
+        inuse = self.portsinuse[key[:3]]
+        inuse.discard(key[3:])
+        if not inuse:
+            del self.portsinuse[key[:3]]
+        columns = [self.keys, self.flows, self.dests, self.sizes, self.spans, self.ramps, self.peaks, self.remaining, self.steps, self.numsent, self.duetick, self.duepos]
+        if self.groundtruth:
+            columns += [self.gtstart, self.gtpkts, self.gtbytes, self.gtflags]
+        if slot != last:
+            for column in columns:
+                column[slot] = column[last]
+            self.activeflows[self.keys[slot]] = slot
+            self.due[self.duetick[slot]][self.duepos[slot]] = slot
+        for column in columns:
+            column.pop()
+
+    def __chunk(self, slot):
+        '''Bytes of data in the next flowlet of the flow in slot: what it
+        sends from here to the end of the flowlet's step intervals,
+        according to its rate (see FlowRate.sent()).'''
+        remaining = self.remaining[slot]
+        t = (self.numsent[slot] + 1) * self.steps[slot] * fscore().interval
+        if t >= self.spans[slot]:
+            return remaining
+        ramp = self.ramps[slot]
+        peak = self.peaks[slot]
+        if t < ramp:
+            sent = peak * t * t / (2.0 * ramp)
+        else:
+            sent = peak * (t - ramp / 2.0)
+        nbytes = int(sent + 0.5) - (self.sizes[slot] - remaining)
+        return min(max(1, nbytes), remaining)
+
+    def __chunks(self, slots):
+        '''__chunk() for each of a list of slots, on whole columns at
+        once when NumPy is available.'''
+        if numpy is None:
+            return [ self.__chunk(slot) for slot in slots ]
+        idx = numpy.array(slots)
+        remaining = numpy.frombuffer(self.remaining, dtype='L')[idx]
+        t = (numpy.frombuffer(self.numsent, dtype='L')[idx] + 1) * numpy.frombuffer(self.steps, dtype='L')[idx] * fscore().interval
+        ramp = numpy.frombuffer(self.ramps)[idx]
+        peak = numpy.frombuffer(self.peaks)[idx]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            sent = numpy.where(t < ramp, peak * t * t / (2.0 * ramp), peak * (t - ramp / 2.0))
+        nbytes = numpy.floor(sent + 0.5) - (numpy.frombuffer(self.sizes, dtype='L')[idx] - remaining)
+        nbytes = numpy.minimum(numpy.maximum(1, nbytes), remaining)
+        nbytes = numpy.where(t >= numpy.frombuffer(self.spans)[idx], remaining, nbytes)
+        return nbytes.astype(int).tolist()
+
+    def __emit(self, slot, nbytes):
+        '''Send the next flowlet of the flow in slot, carrying nbytes of
+        data; returns True if that was its last one.'''
+        core = fscore()
+        flowlet = self.flows[slot]
+        step = self.steps[slot]
+        remaining = self.remaining[slot] - nbytes
+        self.remaining[slot] = remaining
         psize = min(next(self.pktsizerv), flowlet.mss)
         psize = int(max(40, psize))
-        fsend.pkts = fsend.bytes / psize
-        if fsend.pkts * psize < fsend.bytes:
-            fsend.pkts += 1
-        fsend.bytes += fsend.pkts * 40
+        pkts = nbytes // psize
+        if pkts * psize < nbytes:
+            pkts += 1
+        nbytes += pkts * 40
 
+        flags = 0x0
         if flowlet.ipproto == socket.IPPROTO_TCP:
-            flags = 0x0
-            if numsent == 0: # start of flow
+            if self.numsent[slot] == 0: # start of flow
                 # set SYN flag
                 flags |= 0x02 
 
                 # if first flowlet, add 1 3-way handshake pkt.
                 # simplifying assumption: 3-way handshake takes place in one
                 # simulator tick interval with final ack piggybacked with data.
-                fsend.pkts += 1
-                fsend.bytes += 40
+                pkts += 1
+                nbytes += 40
 
-            if flowlet.bytes == 0: # end of flow
+            if remaining == 0: # end of flow
                 # set FIN flag
                 flags |= 0x01
 
-                fsend.pkts += 1
-                fsend.bytes += 40
+                pkts += 1
+                nbytes += 40
 
             # set ACK flag regardless
             flags |= 0x10 # ack
-            fsend.tcpflags = flags
-
-        numsent += 1
-
-        self.logger.debug("sending %d bytes %d pkts %s flags; flowlet has %d bytes remaining" % (fsend.bytes, fsend.pkts, fsend.tcpflagsstr, flowlet.size))
-
 
-        fscore().topology.node(self.srcnode).flowlet_arrival(fsend, 'harpoon', destnode)
-
-        # if there are more flowlets, schedule the next one
-        if flowlet.bytes > 0:
-            fscore().after(fscore().interval, "flowemit-{}".format(self.srcnode), self.flowemit, flowlet, numsent, emitrv, destnode)
+        if self.groundtruth:
+            self.gtpkts[slot] += pkts
+            self.gtbytes[slot] += nbytes
+            self.gtflags[slot] |= flags
+
+        self.numsent[slot] += 1
+
+        fsend = Flowlet(flowlet.ident, pkts=pkts, bytes=nbytes)
+        fsend.tcpflags = flags
+        fsend.iptos = flowlet.iptos
+        fsend.mss = flowlet.mss
+        fsend.flowstart = flowlet.flowstart
+        fsend.flowend = flowlet.flowend
+        if step > 1:
+            fsend.span = step * core.interval
+        self.logger.debug("sending %d bytes %d pkts %s flags; flowlet has %d bytes remaining", nbytes, pkts, fsend.tcpflagsstr, remaining)
+
+        core.topology.node(self.srcnode).flowlet_arrival(fsend, 'harpoon', self.dests[slot])
+
+        if remaining > 0:
+            return False
+
+        # if there's nothing more to send, the flow is done
+        if self.groundtruth:
+            self.groundtruth.record(flowlet, self.gtstart[slot], core.now, self.gtpkts[slot], self.gtbytes[slot], self.gtflags[slot])
+
+        # if we're operating in closed-loop mode, schedule beginning of next flow now that
+        # we've completed the current one.
+        if not self.xopen:
+            self.__chainnext()
+        return True
+
+    def flowemit(self):
+        '''Tick: send a flowlet for every active flow that's due.'''
+        self.tickno += 1
+        tickno = self.tickno
+        due = self.due.pop(tickno, None)
+        if due:
+            # highest slot first: the flow that moves into a finished
+            # flow's slot has then either been sent already or isn't due
+            due.sort(reverse=True)
+            steps = self.steps
+            for slot,nbytes in zip(due, self.__chunks(due)):
+                if self.__emit(slot, nbytes):
+                    self.__removeflow(slot)
+                else:
+                    self.__schedule(slot, tickno + steps[slot])
+
+        if self.flows:
+            self.nexttick = fscore().now + fscore().interval
+            fscore().after(fscore().interval, "flowemit-{}".format(self.srcnode), self.flowemit)
         else:
-            # if there's nothing more to send, remove from active flows 
-            del self.activeflows[flowlet.key]
-
-            # if we're operating in closed-loop mode, schedule beginning of next flow now that
-            # we've completed the current one.
-            if not self.xopen:
-                fscore().after(next(self.flowstartrv), "newflow-{}".format(self.srcnode), self.newflow)
-    
-    def __makeflow(self):
-        while True:
-            if haveIPAddrGen:
-                srcip = str(ipaddr.IPv4Address(ipaddrgen.generate_addressv4(self.ipsrcgen)))
-                dstip = str(ipaddr.IPv4Address(ipaddrgen.generate_addressv4(self.ipdstgen)))
-            else:
-                # srcip = str(ipaddr.IPAddress(int(self.srcnet) + random.randint(0,self.srcnet.numhosts-1)))
-                # dstip = str(ipaddr.IPAddress(int(self.dstnet) + random.randint(0,self.dstnet.numhosts-1)))
-                srcip = str(ipaddr.IPAddress(int(self.srcnet) + random.randint(0, 2)))
-                dstip = str(ipaddr.IPAddress(int(self.dstnet) + random.randint(0, 2)))
-
-            ipproto = next(self.ipproto)
-            sport = next(self.srcports)
-            dport = next(self.dstports)
-            fsize = int(next(self.flowsizerv))
-            flet = Flowlet(FlowIdent(srcip, dstip, ipproto, sport, dport), bytes=fsize)
-            
-            flet.iptos = next(self.iptosrv)
-            if flet.key not in self.activeflows:
-                break
-
+            self.ticking = False
+
+    def __makekey(self):
+        '''Draw a flow key (srcip, dstip, ipproto, sport, dport, as
+        integers) that no active flow is using, and reserve it; returns
+        None if there's no free one for the drawn addresses.'''
+        hosts = (next(self.ipsrcgen), next(self.ipdstgen), next(self.ipproto))
+        inuse = self.portsinuse.get(hosts, None)
+        if inuse is None:
+            inuse = self.portsinuse[hosts] = set()
+        ports = (next(self.srcports), next(self.dstports))
+        if ports in inuse:
+            ports = self.__freeports(inuse, ports)
+            if ports is None:
+                return None
+        inuse.add(ports)
+        return hosts + ports
+
+    def __freeports(self, inuse, ports):
+        '''Find a (sport, dport) pair not in inuse, stepping through the
+        values the port specs allow from the colliding pair ports on.'''
+        sports,dports = self.srcportvals, self.dstportvals
+        if sports is None or dports is None:
+            for i in xrange(KEY_DRAWS):
+                ports = (next(self.srcports), next(self.dstports))
+                if ports not in inuse:
+                    return ports
+            return None
+        if len(inuse) >= len(sports) * len(dports):
+            return None
+        for sport in _rotated(sports, ports[0]):
+            for dport in _rotated(dports, ports[1]):
+                if (sport, dport) not in inuse:
+                    return sport, dport
+        return None
+
+    def __makeflow(self, key):
+        '''Return the first flowlet of a new flow with the given key.'''
+        srcip,dstip,ipproto,sport,dport = key
+        flet = Flowlet(FlowIdent(ipstr(srcip), ipstr(dstip), ipproto, sport, dport), bytes=int(next(self.flowsizerv)))
+        flet.iptos = next(self.iptosrv)
         return flet
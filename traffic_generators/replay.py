@@ -0,0 +1,115 @@
+from trafgen import TrafficGenerator
+import socket
+import struct
+from ipaddr import IPNetwork
+from fslib.common import fscore, get_logger
+from fslib.flowlet import Flowlet, FlowIdent
+from fslib.groundtruth import groundtruth
+from fslib.trace import TraceReader
+
+_ADDR = struct.Struct('!I')
+
+class ReplayTrafficGenerator(TrafficGenerator):
+    '''
+    Replays the flows in a binary trace (see fslib/trace.py) from srcnode.
+    The trace is memory-mapped and read one record at a time, in start
+    time order, and each flow is injected at its (scaled) start time as
+    a single flowlet spread over the flow's duration.
+
+    speed scales time: with speed=2, the trace plays back twice as fast
+    (so at twice the rate).  start and end select a window of the trace,
+    in trace time; replay of the window begins when the generator
+    starts.  If ipsrc is given, only flows from that prefix are
+    replayed, so several nodes can share one trace.
+    '''
+    def __init__(self, srcnode, tracefile=None, speed=1.0, start=None, end=None, ipsrc=None):
+        TrafficGenerator.__init__(self, srcnode)
+        self.logger = get_logger('fs.replay')
+        self.groundtruth = groundtruth()
+        self.tracefile = tracefile
+        self.speed = float(speed)
+        if self.speed <= 0:
+            raise ValueError("Replay speed must be positive")
+        self.winstart = None if start is None else float(start)
+        self.winend = float('inf') if end is None else float(end)
+        self.srcmask = self.srcnet = 0
+        if ipsrc:
+            net = IPNetwork(ipsrc)
+            self.srcnet = int(net.network)
+            self.srcmask = int(net.netmask)
+        self.reader = None
+        self.records = None
+        self.pending = None
+        self.base = self.t0 = 0.0
+        self.flows = 0
+
+    def start(self):
+        self.reader = TraceReader(self.tracefile)
+        first = 0
+        if self.winstart is not None:
+            first = self.reader.find(self.winstart)
+        self.records = self.reader.records(first)
+        self.pending = next(self.records, None)
+        if self.pending is None:
+            self.__finish()
+            return
+        self.base = self.pending[0] if self.winstart is None else self.winstart
+        self.t0 = fscore().now
+        self.__schedule()
+
+    def __schedule(self):
+        start = self.pending[0]
+        if start >= self.winend:
+            self.__finish()
+            return
+        delay = self.t0 + (start - self.base) / self.speed - fscore().now
+        fscore().after(max(0.0, delay), 'replay-'+str(self.srcnode), self.inject)
+
+    def inject(self):
+        '''Inject all flows due now and schedule the next one.'''
+        if self.done:
+            self.__finish()
+            return
+        # a little slack, since now went through a round trip from
+        # trace time
+        now = fscore().now + 1e-9
+        t0 = self.t0
+        base = self.base
+        speed = self.speed
+        record = self.pending
+        records = self.records
+        while record is not None and record[0] < self.winend and t0 + (record[0] - base) / speed <= now:
+            self.__send(record)
+            record = next(records, None)
+        self.pending = record
+        if record is None:
+            self.__finish()
+        else:
+            self.__schedule()
+
+    def __send(self, record):
+        start,end,src,dst,sport,dport,proto,tos,flags,pkts,nbytes = record
+        if self.srcmask and _ADDR.unpack(src)[0] & self.srcmask != self.srcnet:
+            return
+        dstip = socket.inet_ntoa(dst)
+        flet = Flowlet(FlowIdent(socket.inet_ntoa(src), dstip, proto, sport, dport), pkts=pkts, bytes=nbytes)
+        flet.tcpflags = flags
+        flet.iptos = tos
+        duration = max(0.0, end - start) / self.speed
+        flet.flowstart = 0.0
+        flet.flowend = duration
+        flet.span = duration
+        self.flows += 1
+        destnode = fscore().topology.destnode(self.srcnode, dstip)
+        if self.groundtruth:
+            self.groundtruth.record(flet, fscore().now, fscore().now + duration, pkts, nbytes, flags)
+        fscore().topology.node(self.srcnode).flowlet_arrival(flet, 'replay', destnode)
+
+    def __finish(self):
+        if self.reader is not None:
+            self.logger.info("Replayed {} flows from {}".format(self.flows, self.tracefile))
+            self.records = self.pending = None
+            self.reader.close()
+            self.reader = None
+        if not self.done:
+            self.done = True
@@ -4,13 +4,11 @@ from ipaddr import IPAddress, IPNetwork
 from socket import IPPROTO_UDP, IPPROTO_TCP, IPPROTO_ICMP
 from fslib.flowlet import Flowlet, FlowIdent
 from fslib.common import fscore
+from fslib.groundtruth import groundtruth
 import copy
 import re
 
 
-# FIXME
-haveIPAddrGen = False
-
 class SimpleTrafficGenerator(TrafficGenerator):
 
     def __init__(self, srcnode, ipsrc=None, ipdst=None, ipproto=None,
@@ -18,20 +16,20 @@ class SimpleTrafficGenerator(TrafficGenerator):
                  fps=None, pps=None, bps=None, pkts=None, bytes=None, pktsize=None, 
                  icmptype=None, icmpcode=None, interval=None, autoack=False):
         TrafficGenerator.__init__(self, srcnode)
+        self.groundtruth = groundtruth()
         # assume that all keyword params arrive as strings
         # print ipsrc,ipdst
         self.ipsrc = IPNetwork(ipsrc)
         self.ipdst = IPNetwork(ipdst)
-        if haveIPAddrGen:
-            self.ipsrcgen = ipaddrgen.initialize_trie(int(self.ipsrc), self.ipsrc.prefixlen, 0.61)
-            self.ipdstgen = ipaddrgen.initialize_trie(int(self.ipdst), self.ipdst.prefixlen, 0.61)
+        self.ipsrcgen = multifractal(self.ipsrc, 0.61)
+        self.ipdstgen = multifractal(self.ipdst, 0.61)
 
 
         self.sport = self.dport = None
         self.icmptype = self.icmpcode = None
         self.autoack = False
         if autoack and isinstance(autoack, (str,unicode)):
-            self.autoack = eval(autoack)
+            self.autoack = evalspec(autoack)
         else:
             self.autoack = autoack
 
@@ -53,14 +51,14 @@ class SimpleTrafficGenerator(TrafficGenerator):
             if isinstance(iptos, int):
                 self.iptos = randomchoice(self.iptos)
             elif isinstance(iptos, (str,unicode)):
-                self.iptos = eval(iptos)
+                self.iptos = evalspec(iptos)
    
         if self.ipproto == IPPROTO_ICMP:
             xicmptype = xicmpcode = 0
             if icmptype:
-                xicmptype = eval(icmptype)
+                xicmptype = evalspec(icmptype)
             if icmpcode:
-                xicmpcode = eval(icmpcode)
+                xicmpcode = evalspec(icmpcode)
             if isinstance(xicmptype, int):
                 xicmptype = randomchoice(xicmptype)
             if isinstance(xicmpcode, int):
@@ -68,10 +66,10 @@ class SimpleTrafficGenerator(TrafficGenerator):
             self.icmptype = xicmptype
             self.icmpcode = xicmpcode
         elif self.ipproto == IPPROTO_UDP or self.ipproto == IPPROTO_TCP:
-            self.dport = eval(dport)
+            self.dport = evalspec(dport)
             if isinstance(self.dport, int):
                 self.dport = randomchoice(self.dport)
-            self.sport = eval(sport)
+            self.sport = evalspec(sport)
             if isinstance(self.sport, int):
                 self.sport = randomchoice(self.sport)
             # print 'sport,dport',self.sport, self.dport
@@ -79,7 +77,7 @@ class SimpleTrafficGenerator(TrafficGenerator):
                 self.tcpflags = randomchoice('')
                 if tcpflags:
                     if re.search('\(\S+\)', tcpflags):
-                        self.tcpflags = eval(tcpflags)
+                        self.tcpflags = evalspec(tcpflags)
                     else:
                         self.tcpflags = randomchoice(tcpflags)
         else:
@@ -89,12 +87,12 @@ class SimpleTrafficGenerator(TrafficGenerator):
         self.nflowlets = None
         if continuous:
             if isinstance(continuous, (str,unicode)):
-                self.continuous = eval(continuous)
+                self.continuous = evalspec(continuous)
             else:
                 self.continuous = continuous
 
         if flowlets:
-            self.nflowlets = eval(flowlets)
+            self.nflowlets = evalspec(flowlets)
             if isinstance(self.nflowlets, (int, float)):
                 self.nflowlets = randomchoice(self.nflowlets)
 
@@ -107,29 +105,29 @@ class SimpleTrafficGenerator(TrafficGenerator):
 
         self.fps = self.interval = None
         if fps:
-            fps = eval(fps)
+            fps = evalspec(fps)
             if isinstance(fps, int):
                 fps = randomchoice(fps)
             self.fps = fps
         elif interval:
-            self.interval = eval(interval)
+            self.interval = evalspec(interval)
             if isinstance(self.interval, (int, float)):
                 self.interval = randomchoice(self.interval)
 
         assert(bytes)
-        self.bytes = eval(bytes)
+        self.bytes = evalspec(bytes)
         if isinstance(self.bytes, int):
             self.bytes = randomchoice(self.bytes)
 
         self.pkts = self.pktsize = None
 
         if pkts:
-            self.pkts = eval(pkts)
+            self.pkts = evalspec(pkts)
             if isinstance(self.pkts, int):
                 self.pkts = randomchoice(self.pkts)
 
         if pktsize:
-            self.pktsize = eval(pktsize)
+            self.pktsize = evalspec(pktsize)
             if isinstance(self.pktsize, int):
                 self.pktsize = randomchoice(self.pktsize)
 
@@ -138,12 +136,8 @@ class SimpleTrafficGenerator(TrafficGenerator):
 
 
     def __makeflow(self):
-        if haveIPAddrGen:
-            srcip = str(IPv4Address(ipaddrgen.generate_addressv4(self.ipsrcgen)))
-            dstip = str(IPv4Address(ipaddrgen.generate_addressv4(self.ipdstgen)))
-        else:
-            srcip = str(IPAddress(int(self.ipsrc) + random.randint(0,self.ipsrc.numhosts-1)))
-            dstip = str(IPAddress(int(self.ipdst) + random.randint(0,self.ipdst.numhosts-1)))
+        srcip = ipstr(next(self.ipsrcgen))
+        dstip = ipstr(next(self.ipdstgen))
 
         ipproto = self.ipproto
         sport = dport = 0
@@ -195,7 +189,7 @@ class SimpleTrafficGenerator(TrafficGenerator):
         return flet
 
 
-    def flowemit(self, flowlet, destnode, xinterval, ticks):
+    def flowemit(self, flowlet, destnode, xinterval, ticks, totals=None):
         assert(xinterval > 0.0)
         f = copy.copy(flowlet)
         f.bytes = next(self.bytes)
@@ -207,10 +201,18 @@ class SimpleTrafficGenerator(TrafficGenerator):
         else:
             f.pkts = next(self.pkts)
 
+        if totals is not None:
+            totals[0] += f.pkts
+            totals[1] += f.bytes
+            totals[2] |= f.tcpflags
+
         fscore().topology.node(self.srcnode).flowlet_arrival(f, 'simple', destnode)
 
         ticks -= 1
-        fscore().after(xinterval, 'rawflow-flowemit-'+str(self.srcnode), self.flowemit, flowlet, destnode, xinterval, ticks)
+        if ticks > 0:
+            fscore().after(xinterval, 'rawflow-flowemit-'+str(self.srcnode), self.flowemit, flowlet, destnode, xinterval, ticks, totals)
+        elif totals is not None:
+            self.groundtruth.record(flowlet, totals[3], fscore().now, totals[0], totals[1], totals[2])
 
     def start(self):
         self.callback()
@@ -253,9 +255,13 @@ class SimpleTrafficGenerator(TrafficGenerator):
         # print 'xinterval',xinterval
 
         if not ticks or ticks == 1:
+            if self.groundtruth:
+                self.groundtruth.record(f, fscore().now, fscore().now, f.pkts, f.bytes, f.tcpflags)
             fscore().topology.node(self.srcnode).flowlet_arrival(f, 'simple', destnode)
         else:
-            fscore().after(0, "rawflow-flowemit-{}".format(self.srcnode), self.flowemit, f, destnode, xinterval, ticks)
+            # flow totals, if recording ground truth: [pkts, bytes, tcpflags, start]
+            totals = [0, 0, 0, fscore().now] if self.groundtruth else None
+            fscore().after(0, "rawflow-flowemit-{}".format(self.srcnode), self.flowemit, f, destnode, xinterval, ticks, totals)
       
         if self.continuous and not self.done:
             fscore().after(xinterval, "rawflow-cb-".format(self.srcnode), self.callback)
@@ -14,7 +14,7 @@ class SubtractiveTrafficGenerator(TrafficGenerator):
         self.ipprotofilt = 0
 
         assert(action)
-        self.action = eval(action)
+        self.action = evalspec(action)
 
         if ipdstfilt:
             self.ipdstfilt = ipaddr.IPNetwork(ipdstfilt)
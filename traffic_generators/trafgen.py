@@ -4,8 +4,14 @@ from fslib.common import fscore, get_logger
 class TrafficGenerator(object):
     __metaclass__ = ABCMeta
 
+    # whether the generator implements set_sources(), so that a modulator
+    # can superpose many identical sources onto one generator
+    superposable = False
+
     def __init__(self, srcnode):
         self.srcnode = srcnode
+        # called with the generator when it's done (see set_done())
+        self.donecallback = None
         self.done = False
         self.logger = get_logger("tgen.{}".format(self.srcnode))
         
@@ -18,6 +24,8 @@ class TrafficGenerator(object):
 
     def set_done(self, tf):
         self.__done = tf
+        if tf and self.donecallback:
+            self.donecallback(self)
 
     done = property(get_done, set_done, None, 'done flag')
 